@@ -0,0 +1,23 @@
+"""
+OpAuth Benchmark Helpers
+Setup shared by the scripts in this directory.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def temp_home():
+    """
+    Run with HOME pointed at a throwaway directory, yielding its path.
+
+    Every store path derives from the home directory when its module is
+    first imported, so a script imports opauth's stores inside the
+    block, never at the top, and its writes stay out of the real
+    ~/.opauth. Worker processes started inside the block inherit it.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["HOME"] = os.environ["USERPROFILE"] = tmp
+        yield tmp
@@ -0,0 +1,98 @@
+"""
+OpAuth Async Fan-out Benchmark
+One user's daily Fitbit context (activity, sleep, heart rate, weight,
+profile) fetched one call after another, then concurrently through
+AsyncProvider and gather(), from a local stand-in API that takes
+DELAY_MS per request. One scope is left ungranted to show that the
+consent check still applies.
+
+Run from apps/:  python -m opauth.benchmarks.async_fanout
+"""
+
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ._common import temp_home
+
+DELAY_MS = 100
+PASSPHRASE = "benchmark"
+
+
+class _Endpoint(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    # One write per response, or Nagle and delayed ACKs add 40 ms a call
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(DELAY_MS / 1000)
+        body = f'{{"path": "{self.path}"}}'.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run():
+    with temp_home():
+        from ..core.scope_registry import get_registry
+        from ..providers import fitbit
+        from ..providers.aio import AsyncProvider, gather
+        from ..storage.token_store import TokenStore
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Endpoint)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        fitbit.FITBIT_API_BASE = f"http://127.0.0.1:{server.server_port}"
+
+        store = TokenStore()
+        store.unlock(PASSPHRASE)
+        store.store_token("fitbit", {"access_token": "a", "expires_in": 3600})
+        get_registry().grant("fitbit", ["activity", "sleep", "heartrate", "profile"])
+        provider = fitbit.FitbitProvider()
+        aio = AsyncProvider(provider)
+
+        def sequential():
+            results = []
+            for call in (provider.get_daily_activity, provider.get_sleep,
+                         provider.get_heart_rate, provider.get_weight):
+                try:
+                    results.append(call())
+                except PermissionError as e:
+                    results.append(e)
+            results.append(provider.api_call("/1/user/-/profile.json", "profile").json())
+            return results
+
+        async def concurrent():
+            return await gather(
+                aio.get_daily_activity(), aio.get_sleep(), aio.get_heart_rate(),
+                aio.get_weight(), aio.api_call("/1/user/-/profile.json", "profile"),
+                return_exceptions=True,
+            )
+
+        start = time.perf_counter()
+        expected = sequential()
+        t_sequential = time.perf_counter() - start
+        start = time.perf_counter()
+        results = asyncio.run(concurrent())
+        t_concurrent = time.perf_counter() - start
+        results[-1] = results[-1].json()
+        server.shutdown()
+
+        same = [type(r) if isinstance(r, Exception) else r for r in results] == \
+               [type(r) if isinstance(r, Exception) else r for r in expected]
+        print(f"5 calls, {DELAY_MS} ms each, weight scope not granted")
+        print(f"sequential  {t_sequential * 1000:>6.0f} ms")
+        print(f"gather      {t_concurrent * 1000:>6.0f} ms   {t_sequential / t_concurrent:.1f}x")
+        print(f"same results: {same}; weight: {results[3]!r}")
+        audit = provider.audit.get_logs(limit=None, event="API_CALL")
+        print(f"API_CALL audit entries: {len(audit)} (4 sequential + 4 concurrent)")
+
+
+if __name__ == "__main__":
+    run()
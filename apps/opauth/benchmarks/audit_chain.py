@@ -0,0 +1,96 @@
+"""
+OpAuth Audit Chain Benchmark
+What the hash chain costs on append, and how verify() scales as the
+file log grows: incremental verification should stay flat while a
+full re-hash grows with the log.
+
+Run from apps/:  python -m opauth.benchmarks.audit_chain [entries]
+The default stops at 1M entries; pass 10000000 for the 10M run
+(a few GB of disk and around ten minutes).
+"""
+
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta
+
+from ._common import temp_home
+
+ENTRIES = 1000000
+APPENDS = 5000  # timed appends, synchronous and buffered
+BATCH = 10000   # entries per bulk-load batch
+REPEAT = 5  # best of, to keep scheduler noise out
+
+
+def _entries(start: int, count: int, base: datetime):
+    for i in range(start, start + count):
+        yield {
+            "timestamp": (base + timedelta(milliseconds=i)).isoformat(),
+            "event": "API_CALL" if i % 4 else "TOKEN_ACCESS",
+            "service": f"svc{i % 20}",
+            "actor": "ai",
+            "details": {"endpoint": f"/v1/items/{i}"},
+        }
+
+
+def _append_rate(audit, count: int) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        audit.log("API_CALL", f"svc{i % 20}", {"endpoint": f"/v1/items/{i}"}, "ai")
+    audit.flush()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def run(entries: int = ENTRIES):
+    with temp_home():
+        from ..core.audit import GENESIS_HASH, AuditLog, _entry_hash
+
+        audit = AuditLog()
+        sync_us = _append_rate(audit, APPENDS)
+        buffered = AuditLog(buffered=True)
+        buffered_us = _append_rate(buffered, APPENDS)
+        buffered.close()
+
+        # The chain's share of an append: linking and hashing the entry
+        entry = next(_entries(0, 1, datetime.now()))
+        entry["prev"] = GENESIS_HASH
+        number = 100000
+        chain_us = min(timeit.repeat(lambda: _entry_hash(entry), number=number,
+                                     repeat=REPEAT)) / number * 1e6
+        print(f"append (us/entry)   synchronous {sync_us:>7.1f}   buffered {buffered_us:>7.1f}")
+        print(f"chain hash (us/entry) {chain_us:>5.2f}   = {chain_us / sync_us * 100:.1f}% "
+              f"of a synchronous append, {chain_us / buffered_us * 100:.1f}% of a buffered one")
+        print()
+
+        # Grow the log and verify at each power of ten
+        print(f"{'entries':>11}  {'load/s':>9}  {'verify ms':>10}  {'full verify s':>14}  "
+              f"{'full entries/s':>15}")
+        base = datetime.now()  # After the timed appends, so time keeps moving forward
+        written = APPENDS * 2
+        size = 10000
+        while True:
+            size = min(size, entries)
+            start = time.perf_counter()
+            for offset in range(written, size, BATCH):
+                audit.import_entries(_entries(offset, min(BATCH, size - offset), base),
+                                     batch_size=BATCH)
+            loaded = size - written
+            load_rate = f"{loaded / (time.perf_counter() - start):,.0f}" if loaded > 0 else "-"
+            written = max(written, size)
+
+            incremental = min(timeit.repeat(audit.verify, number=1, repeat=REPEAT))
+            start = time.perf_counter()
+            result = audit.verify(full=True)
+            full = time.perf_counter() - start
+            print(f"{written:>11,}  {load_rate:>9}  {incremental * 1000:>10.2f}  "
+                  f"{full:>14.2f}  {result['verified'] / full:>15,.0f}")
+            if not result["valid"]:
+                print(f"verify failed: {result['error']}")
+                sys.exit(1)
+            if size >= entries:
+                break
+            size *= 10
+
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,92 @@
+"""
+OpAuth Audit Encoding Benchmark
+The same entries in the JSON and binary audit encodings: bytes on disk,
+raw and gzipped as sealed segments are, and how fast a full scan and a
+single-service scan run over the active segment.
+
+Run from apps/:  python -m opauth.benchmarks.audit_encoding [entries]
+"""
+
+import gzip
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from ._common import temp_home
+
+ENTRIES = 100000
+SERVICES = 20
+REPEAT = 3  # best of, to keep scheduler noise out
+
+
+def _entries(count: int):
+    base = datetime.now()
+    for i in range(count):
+        yield {
+            "timestamp": (base + timedelta(milliseconds=i)).isoformat(),
+            "event": "API_CALL" if i % 4 else "TOKEN_ACCESS",
+            "service": f"svc{i % SERVICES}",
+            "actor": "ai",
+            "details": {"endpoint": f"/v1/items/{i}"} if i % 4 else {},
+        }
+
+
+def _scan(codec, path, service=None) -> int:
+    """Decode every record, or only one service's, the way queries do."""
+    count = 0
+    with open(path, 'rb') as f:
+        for _, raw in codec.iter_records(f):
+            if service is not None and not codec.may_match(raw, service, None, None, None):
+                continue
+            entry = codec.decode(raw)
+            if service is None or entry["service"] == service:
+                count += 1
+    return count
+
+
+def _measure(audit) -> dict:
+    path = audit.log_path
+    data = path.read_bytes()
+    full = min(timeit.repeat(lambda: _scan(audit.codec, path), number=1, repeat=REPEAT))
+    one = min(timeit.repeat(lambda: _scan(audit.codec, path, "svc7"), number=1, repeat=REPEAT))
+    return {"bytes": len(data), "gzip": len(gzip.compress(data)), "full": full, "one": one}
+
+
+def run(entries: int = ENTRIES):
+    with temp_home():
+        from ..core.audit import AuditLog
+        from ..core.audit_codec import _FLAGS, _FRAME, _HEADER
+
+        audit = AuditLog(encoding="json")
+        audit.import_entries(_entries(entries), batch_size=10000)
+        results = {"json": _measure(audit)}
+        audit.convert_encoding("binary")
+        results["binary"] = _measure(audit)
+        if sum(1 for _ in audit.iter_entries()) != entries or not audit.verify(full=True)["valid"]:
+            print("conversion lost entries or broke the chain")
+            sys.exit(1)
+
+        print(f"{entries:,} entries      {'json':>10}  {'binary':>10}  {'binary/json':>12}")
+        rows = [
+            ("bytes per entry", "bytes", lambda v: v / entries, "{:>10.1f}"),
+            ("gzipped per entry", "gzip", lambda v: v / entries, "{:>10.1f}"),
+            ("full scan (k/s)", "full", lambda v: entries / v / 1000, "{:>10.1f}"),
+            ("one service (k/s)", "one", lambda v: entries / v / 1000, "{:>10.1f}"),
+        ]
+        for label, key, fmt, spec in rows:
+            j, b = fmt(results["json"][key]), fmt(results["binary"][key])
+            print(f"{label:<20}{spec.format(j)}  {spec.format(b)}  {b / j:>11.2f}x")
+
+        # Where the binary bytes go: the prev hash and the details JSON
+        # are incompressible or already compact, which caps the ratio
+        details = sum(len(json.dumps(e["details"], separators=(",", ":")))
+                      for e in _entries(entries)) / entries
+        fixed = 2 * _FRAME.size + _FLAGS.size + _HEADER.size
+        print()
+        print(f"binary entry: {fixed} framing and header + 32 prev hash "
+              f"+ {details:.1f} details JSON = {fixed + 32 + details:.1f} bytes")
+
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:2]))
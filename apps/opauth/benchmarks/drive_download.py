@@ -0,0 +1,165 @@
+"""
+OpAuth Drive Download Benchmark
+Downloads a large file from a local stand-in for the Drive API that
+caps each connection's bandwidth and drops one connection partway:
+whole in memory (read_drive_file), streamed to a file object, saved
+to a path in one range and in parallel ranges, and resumed after an
+interrupted download.
+
+Run from apps/:  python -m opauth.benchmarks.drive_download [MiB]
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from ._common import temp_home
+
+SIZE_MIB = 64
+CONNECTION_MIB_S = 100  # Bandwidth cap per connection
+PASSPHRASE = "benchmark"
+
+
+class _Drive(BaseHTTPRequestHandler):
+    """
+    GET /files/<id>?fields=...   size and checksum
+    GET /files/<id>?alt=media    the content, honouring Range; the
+                                 first response of each run is cut off
+                                 halfway
+    """
+
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    content = b""
+    drop_next = [False]
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, headers: dict):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+    def do_GET(self):
+        content = self.content
+        if "alt=media" not in self.path:
+            body = json.dumps({"size": str(len(content)),
+                               "md5Checksum": hashlib.md5(content).hexdigest()}).encode()
+            self._send(200, body, {"Content-Type": "application/json"})
+            self.wfile.write(body)
+            return
+        start, end = 0, len(content)
+        status = 200
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else len(content)
+            status = 206
+        body = memoryview(content)[start:end]
+        self._send(status, body, {"Content-Type": "application/octet-stream"})
+        with self.lock:
+            drop, self.drop_next[0] = self.drop_next[0], False
+        step = 256 * 1024
+        try:
+            for i in range(0, len(body), step):
+                if drop and i >= len(body) // 2:
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+                self.wfile.write(body[i:i + step])
+                time.sleep(step / (CONNECTION_MIB_S * 1024 * 1024))
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # The client gave up on it
+
+
+class _HashSink:
+    """A file object that keeps only a hash of what is written."""
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+
+
+def _timed(label: str, fn, expected: bytes, digest):
+    _Drive.drop_next[0] = True
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    ok = digest() == hashlib.sha256(expected).digest()
+    print(f"{label:<28}{elapsed:>7.2f}s{peak / 2 ** 20:>9.1f} MiB   intact: {ok}")
+
+
+def run(size_mib: int = SIZE_MIB):
+    with temp_home() as tmp:
+        from ..core.scope_registry import get_registry
+        from ..providers import google
+        from ..storage.token_store import TokenStore
+
+        content = _Drive.content = os.urandom(size_mib * 2 ** 20)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Drive)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        google.DRIVE_FILES_URL = f"http://127.0.0.1:{server.server_port}/files"
+
+        store = TokenStore()
+        store.unlock(PASSPHRASE)
+        store.store_token("google", {"access_token": "a", "expires_in": 3600})
+        get_registry().grant("google", ["drive.readonly"])
+        provider = google.GoogleProvider()
+        dest = Path(tmp) / "download.bin"
+
+        print(f"{size_mib} MiB file, {CONNECTION_MIB_S} MiB/s per connection, "
+              f"one connection dropped halfway per run")
+        print(f"{'':<28}{'time':>8}{'peak mem':>13}")
+        _Drive.drop_next[0] = True
+        tracemalloc.start()
+        try:
+            provider.read_drive_file("f")
+            outcome = "completed"
+        except Exception as e:
+            outcome = f"failed: {type(e).__name__}"
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{'read_drive_file':<28}{'':>8}{peak / 2 ** 20:>9.1f} MiB   {outcome}")
+        path_digest = lambda: hashlib.sha256(dest.read_bytes()).digest()
+        sink = _HashSink()
+        _timed("stream to file object", lambda: provider.download_drive_file("f", sink),
+               content, lambda: sink.hash.digest())
+        _timed("save to path, 1 range", lambda: provider.download_drive_file("f", dest, parallel=1),
+               content, path_digest)
+        dest.unlink()
+        _timed(f"save to path, {google.DRIVE_PARALLEL} ranges",
+               lambda: provider.download_drive_file("f", dest), content, path_digest)
+        dest.unlink()
+
+        # Interrupt halfway, then run again
+        def stop_early(done, total):
+            if done >= total // 2:
+                raise KeyboardInterrupt
+        try:
+            provider.download_drive_file("f", dest, progress=stop_early)
+        except KeyboardInterrupt:
+            pass
+        fetched = []
+        _timed("resume after interrupt", lambda: provider.download_drive_file(
+            "f", dest, progress=lambda done, total: fetched.append(done)), content, path_digest)
+        print(f"resume started at {fetched[0] / 2 ** 20:.0f} MiB of {size_mib}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else SIZE_MIB)
@@ -0,0 +1,103 @@
+"""
+OpAuth Provider Session Benchmark
+api_call latency through a new connection per request (the old
+module-level requests calls) against the provider's pooled session,
+plus a 429 with Retry-After to show the retry path.
+
+Run from apps/:  python -m opauth.benchmarks.provider_session [calls]
+"""
+
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from ._common import temp_home
+
+CALLS = 500
+PASSPHRASE = "benchmark"
+
+
+class _Endpoint(BaseHTTPRequestHandler):
+    """
+    GET /api answers 200. GET /limited answers 429 with Retry-After: 1
+    the first time, then 200.
+    """
+
+    protocol_version = "HTTP/1.1"  # Keep-alive
+    # One write per response, or Nagle and delayed ACKs add 40 ms a call
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    limited = {"hits": 0}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        status, headers = 200, {}
+        if self.path == "/limited":
+            self.limited["hits"] += 1
+            if self.limited["hits"] == 1:
+                status, headers = 429, {"Retry-After": "1"}
+        body = b'{"ok": true}'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Unpooled:
+    """The module-level requests functions, as providers used before."""
+
+    def request(self, method, url, **kwargs):
+        return requests.request(method, url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return requests.post(url, **kwargs)
+
+
+def _per_call_us(provider, url: str, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        provider._make_request(url).raise_for_status()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def run(calls: int = CALLS):
+    with temp_home():
+        from ..providers.google import GoogleProvider
+        from ..storage.token_store import TokenStore
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Endpoint)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+
+        store = TokenStore()
+        store.unlock(PASSPHRASE)
+        store.store_token("google", {"access_token": "a", "expires_in": 3600})
+        # _make_request is api_call after its scope check and audit entry
+        unpooled = GoogleProvider()
+        unpooled.session = _Unpooled()
+        pooled = GoogleProvider()
+
+        t_unpooled = _per_call_us(unpooled, f"{base}/api", calls)
+        t_pooled = _per_call_us(pooled, f"{base}/api", calls)
+        print(f"{'session':<12}{'us/call':>10}")
+        print(f"{'unpooled':<12}{t_unpooled:>10.0f}")
+        print(f"{'pooled':<12}{t_pooled:>10.0f}   {t_unpooled / t_pooled:.2f}x")
+
+        start = time.perf_counter()
+        status = pooled._make_request(f"{base}/limited").status_code
+        print(f"429 then 200: got {status} after {time.perf_counter() - start:.2f}s "
+              f"(Retry-After: 1)")
+        print(f"metrics: {pooled.session.metrics()}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else CALLS)
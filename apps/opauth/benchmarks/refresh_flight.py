@@ -0,0 +1,100 @@
+"""
+OpAuth Single-Flight Refresh Check
+Many threads share an expired Fitbit token. A local stand-in for the
+token endpoint rotates refresh tokens like Fitbit does and counts the
+refresh grants it receives: exactly one should arrive per expiry.
+
+Run from apps/:  python -m opauth.benchmarks.refresh_flight [threads]
+"""
+
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from ._common import temp_home
+
+THREADS = 16
+ROUNDS = 3
+PASSPHRASE = "benchmark"
+
+
+class _Endpoint(BaseHTTPRequestHandler):
+    """
+    POST /token: refresh grant; the refresh token is single use.
+    GET /api: 401 unless the bearer token is the current access token.
+    """
+
+    state = {"access": "a0", "refresh": "r0", "grants": 0, "reused": 0}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes = b"{}"):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        time.sleep(0.05)  # A slow token endpoint widens the race
+        with self.lock:
+            state = self.state
+            state["grants"] += 1
+            if form.get("refresh_token") != [state["refresh"]]:
+                state["reused"] += 1
+                return self._reply(400, b'{"errors": [{"errorType": "invalid_grant"}]}')
+            n = state["grants"]
+            state["access"], state["refresh"] = f"a{n}", f"r{n}"
+            body = f'{{"access_token": "a{n}", "refresh_token": "r{n}", "expires_in": 28800}}'
+        self._reply(200, body.encode())
+
+    def do_GET(self):
+        with self.lock:
+            ok = self.headers.get("Authorization") == f"Bearer {self.state['access']}"
+        self._reply(200 if ok else 401)
+
+
+def run(threads: int = THREADS):
+    with temp_home():
+        from ..providers import fitbit
+        from ..storage.token_store import TokenStore
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Endpoint)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        fitbit.FITBIT_TOKEN_URL = f"{base}/token"
+
+        store = TokenStore()
+        store.unlock(PASSPHRASE)
+        store.store_token("fitbit", {"access_token": "a0", "refresh_token": "r0"})
+        provider = fitbit.FitbitProvider("client", "secret")
+
+        failed = 0
+        for round_ in range(ROUNDS):
+            with _Endpoint.lock:
+                _Endpoint.state["access"] = f"expired{round_}"  # Server-side expiry
+                grants_before = _Endpoint.state["grants"]
+            statuses = []
+            workers = [threading.Thread(target=lambda: statuses.append(
+                provider._make_request(f"{base}/api").status_code)) for _ in range(threads)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            grants = _Endpoint.state["grants"] - grants_before
+            failed += statuses.count(401) + (grants != 1)
+            print(f"round {round_ + 1}: {threads} threads, {grants} refresh grant(s), "
+                  f"{statuses.count(200)} x 200, {statuses.count(401)} x 401")
+        server.shutdown()
+        print(f"refresh tokens reused: {_Endpoint.state['reused']}")
+        if failed or _Endpoint.state["reused"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else THREADS)
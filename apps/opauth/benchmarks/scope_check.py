@@ -0,0 +1,56 @@
+"""
+OpAuth Scope Check Benchmark
+Compiled bitset checks against the old list scan.
+
+Run from apps/:  python -m opauth.benchmarks.scope_check
+"""
+
+import timeit
+
+from ._common import temp_home
+
+NUMBER = 100000
+REPEAT = 5  # best of, to keep scheduler noise out
+
+
+def _list_scan(scopes: dict, service: str, required_scope: str) -> bool:
+    # ScopeRegistry.check before the compiled index
+    if service not in scopes["services"]:
+        return False
+    svc = scopes["services"][service]
+    if not svc.get("active", False):
+        return False
+    return required_scope in svc.get("scope", [])
+
+
+def run(number: int = NUMBER):
+    with temp_home():
+        from ..core.consent import GOOGLE_SCOPES
+        from ..core.scope_registry import ScopeRegistry
+        from ..storage.file_backend import FileBackend
+
+        registry = ScopeRegistry(FileBackend(fsync=False))
+        registry.grant("google", list(GOOGLE_SCOPES))
+        scopes = registry.scopes
+
+        cases = [
+            ("hit, first scope", lambda: registry.check("google", "drive.readonly"),
+             lambda: _list_scan(scopes, "google", "drive.readonly")),
+            ("hit, last scope", lambda: registry.check("google", "gmail.send"),
+             lambda: _list_scan(scopes, "google", "gmail.send")),
+            ("miss", lambda: registry.check("google", "payments"),
+             lambda: _list_scan(scopes, "google", "payments")),
+            ("any of two", lambda: registry.check_any("google", ("drive.appdata", "drive.file")),
+             lambda: (_list_scan(scopes, "google", "drive.appdata")
+                      or _list_scan(scopes, "google", "drive.file"))),
+        ]
+
+        print(f"{'case':<20}{'bitset ns':>12}{'list ns':>12}{'speedup':>10}")
+        for name, compiled, scan in cases:
+            t_compiled = min(timeit.repeat(compiled, number=number, repeat=REPEAT)) / number * 1e9
+            t_scan = min(timeit.repeat(scan, number=number, repeat=REPEAT)) / number * 1e9
+            print(f"{name:<20}{t_compiled:>12.0f}{t_scan:>12.0f}{t_scan / t_compiled:>9.2f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,78 @@
+"""
+OpAuth Storage Backend Benchmark
+The same workload against the file and SQLite backends.
+
+Run from apps/:  python -m opauth.benchmarks.storage_backends [entries]
+"""
+
+import base64
+import os
+import sys
+import time
+
+from ._common import temp_home
+
+ENTRIES = 5000
+SERVICES = 20
+
+
+def _timed(label: str, results: dict, fn):
+    start = time.perf_counter()
+    fn()
+    results[label] = (time.perf_counter() - start) * 1000
+
+
+def _workload(backend, entries: int) -> dict:
+    from ..core.scope_registry import ScopeRegistry
+
+    results = {}
+    registry = ScopeRegistry(backend)
+    _timed("registry: 500 grants", results,
+           lambda: [registry.grant(f"svc{i}", ["read", "write"]) for i in range(500)])
+    _timed("registry: 100 revokes", results,
+           lambda: [registry.revoke(f"svc{i}") for i in range(0, 500, 5)])
+    _timed("registry: reload", results, lambda: ScopeRegistry(backend))
+
+    record = base64.urlsafe_b64encode(os.urandom(2048))
+    _timed("tokens: 200 writes of 2 KB", results,
+           lambda: [backend.put_tokens({f"svc{i % 50}": record}) for i in range(200)])
+    _timed("tokens: 200 reads", results,
+           lambda: [backend.read_token(f"svc{i % 50}") for i in range(200)])
+
+    audit = backend.open_audit()
+    _timed(f"audit: {entries} appends", results, lambda: [
+        audit.log("API_CALL" if i % 4 else "TOKEN_ACCESS", f"svc{i % SERVICES}",
+                  {"endpoint": f"/v1/items/{i}"}, "ai")
+        for i in range(entries)
+    ])
+    buffered = backend.open_audit(buffered=True)
+    _timed(f"audit: {entries} buffered appends", results, lambda: (
+        [buffered.log("API_CALL", "bulk", {"n": i}, "ai") for i in range(entries)],
+        buffered.flush(),
+    ))
+    buffered.close()
+    _timed("audit: newest 20", results, lambda: audit.get_logs(limit=20))
+    _timed("audit: newest 20 for a service", results,
+           lambda: audit.get_logs(limit=20, service="svc7"))
+    _timed("audit: access history", results, lambda: audit.get_access_history("svc3"))
+    _timed("audit: stream all", results, lambda: sum(1 for _ in audit.iter_entries()))
+    _timed("audit: hourly rollups", results, lambda: audit.get_rollups("hour"))
+    _timed("audit: verify", results, lambda: audit.verify())
+    _timed("audit: verify full", results, lambda: audit.verify(full=True))
+    return results
+
+
+def run(entries: int = ENTRIES):
+    with temp_home():
+        from ..storage.backends import open_backend
+
+        results = {name: _workload(open_backend(name, fsync=False), entries)
+                   for name in ("file", "sqlite")}
+
+    print(f"{'operation (ms)':<36}{'file':>10}{'sqlite':>10}")
+    for label in results["file"]:
+        print(f"{label:<36}{results['file'][label]:>10.1f}{results['sqlite'][label]:>10.1f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else ENTRIES)
@@ -0,0 +1,43 @@
+"""
+OpAuth Token Cache Benchmark
+get_token() calls per second with and without the decrypted token cache.
+
+Run from apps/:  python -m opauth.benchmarks.token_cache
+"""
+
+import os
+import timeit
+
+from ._common import temp_home
+
+NUMBER = 20000
+REPEAT = 5  # best of, to keep scheduler noise out
+SERVICES = 50
+
+
+def run(number: int = NUMBER):
+    with temp_home():
+        from ..storage.backends import open_backend
+        from ..storage.token_store import KeyContext, TokenStore
+
+        print(f"{'backend':<10}{'uncached/s':>14}{'cached/s':>14}{'speedup':>10}")
+        for name in ("file", "sqlite"):
+            context = KeyContext()
+            backend = open_backend(name, fsync=False)
+            plain = TokenStore(backend, key_context=context)
+            cached = TokenStore(backend, key_context=context, cache=True)
+            plain.unlock("benchmark")
+            for i in range(SERVICES):
+                plain.store_token(f"svc{i}", {"access_token": os.urandom(96).hex(),
+                                              "refresh_token": os.urandom(48).hex(),
+                                              "expires_in": 3600})
+
+            rates = []
+            for store in (plain, cached):
+                t = min(timeit.repeat(lambda: store.get_token("svc7"), number=number, repeat=REPEAT))
+                rates.append(number / t)
+            print(f"{name:<10}{rates[0]:>14,.0f}{rates[1]:>14,.0f}{rates[1] / rates[0]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    run()
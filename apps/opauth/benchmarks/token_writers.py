@@ -0,0 +1,89 @@
+"""
+OpAuth Concurrent Token Writers
+Several processes store and delete tokens in one file-backed store at
+once, then every record is checked: none torn, none lost. Also times
+single-process writes with and without the inter-process lock.
+
+Run from apps/:  python -m opauth.benchmarks.token_writers [processes] [writes]
+"""
+
+import contextlib
+import multiprocessing
+import sys
+import time
+
+from ._common import temp_home
+
+PROCESSES = 4
+WRITES = 200
+PASSPHRASE = "benchmark"
+
+
+def _writer(worker: int, writes: int):
+    from ..storage.file_backend import FileBackend
+    from ..storage.token_store import TokenStore
+
+    store = TokenStore(FileBackend())
+    store.unlock(PASSPHRASE)
+    for i in range(writes):
+        # Own services plus a shared one, so records replace each other
+        # and compaction runs while other processes append
+        store.store_token(f"w{worker}.s{i % 20}", {"access_token": f"{worker}:{i}"})
+        store.store_token("shared", {"access_token": f"{worker}:{i}"})
+        if i % 7 == 6:
+            store.delete_token(f"w{worker}.s{i % 20}")
+
+
+def _timed_writes(backend, store, writes: int) -> float:
+    start = time.perf_counter()
+    for i in range(writes):
+        store.store_token(f"t{i % 20}", {"access_token": str(i)})
+    return writes / (time.perf_counter() - start)
+
+
+def run(processes: int = PROCESSES, writes: int = WRITES):
+    with temp_home():
+        from ..storage.file_backend import FileBackend
+        from ..storage.token_store import TokenStore
+
+        store = TokenStore(FileBackend())
+        store.unlock(PASSPHRASE)
+
+        start = time.perf_counter()
+        workers = [multiprocessing.Process(target=_writer, args=(w, writes))
+                   for w in range(processes)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+
+        # Each worker's last write to a service is the one that must survive
+        expected = {}
+        for w in range(processes):
+            for i in range(writes):
+                service = f"w{w}.s{i % 20}"
+                expected[service] = None if i % 7 == 6 else f"{w}:{i}"
+        lost = [s for s, value in expected.items()
+                if (store.get_token(s) or {}).get("access_token") != value]
+        shared = store.get_token("shared")["access_token"]
+        total = processes * writes * 2 + processes * (writes // 7)
+        print(f"{processes} processes, {total} writes in {elapsed:.2f}s "
+              f"({total / elapsed:,.0f}/s across processes)")
+        print(f"records checked: {len(expected) + 1}, lost or wrong: {len(lost)}, "
+              f"shared ends at {shared}")
+
+        for fsync in (False, True):
+            backend = FileBackend(fsync=fsync)
+            timed = TokenStore(backend)
+            locked = _timed_writes(backend, timed, writes)
+            backend._token_file_lock = contextlib.nullcontext()
+            unlocked = _timed_writes(backend, timed, writes)
+            print(f"fsync={fsync!s:<5}  writes/s locked {locked:>9,.0f}  "
+                  f"unlocked {unlocked:>9,.0f}  cost {(1 - locked / unlocked) * 100:>5.1f}%")
+        if lost:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -5,12 +5,13 @@ Human-friendly management of OAuth authorizations.
 
 import sys
 import os
+import json
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.consent import ConsentFlow, GOOGLE_SCOPES, FITBIT_SCOPES, SMARTHOME_SCOPES
 from core.revocation import RevocationManager
 from core.audit import get_audit
-from storage.token_store import TokenStore
+from storage.token_store import IDLE_TIMEOUT, TokenStore
 
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -127,7 +128,16 @@ def grant_authorization():
         return
 
     consent = ConsentFlow()
-    consent.grant_consent(service, selected_scopes, granted_by="human")
+    try:
+        consent.apply_decisions(
+            [{"action": "grant", "service": service, "scope": selected_scopes}],
+            decided_by="human",
+        )
+    except PermissionError as e:
+        print()
+        print(f"Not granted: {e}")
+        input("Press Enter to continue...")
+        return
 
     print()
     print(f"Authorization granted for {service}!")
@@ -226,16 +236,14 @@ def view_audit():
     print()
 
     audit = get_audit()
-    log_file = audit.log_file
+    entries = audit.get_logs(limit=20)
 
-    if os.path.exists(log_file):
-        print(f"Log file: {log_file}")
+    if entries:
+        print(f"Audit log: {audit.location}")
         print()
-        with open(log_file, "r") as f:
-            lines = f.readlines()
-            # Show last 20 entries
-            for line in lines[-20:]:
-                print(line.strip())
+        # Show last 20 entries
+        for entry in entries:
+            print(json.dumps(entry))
     else:
         print("No audit log found.")
 
@@ -255,6 +263,7 @@ def unlock_store():
     store = TokenStore()
     if store.unlock(passphrase):
         print("Token store unlocked successfully!")
+        print(f"Stays unlocked for every provider until locked or idle {IDLE_TIMEOUT // 60} minutes.")
     else:
         print("Failed to unlock token store.")
 
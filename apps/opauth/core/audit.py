@@ -4,39 +4,316 @@ Every scope change, token access, and API call logged.
 AI cannot disable logging. Human can review.
 """
 
+import atexit
+import gzip
+import hashlib
+import heapq
+import hmac
 import json
+import os
+import shutil
+import struct
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
+from urllib.parse import quote, unquote
+
+from ..storage.backends import get_backend
+from ..storage.fileio import FileLock, atomic_write, file_state
+from .audit_codec import BinaryCodec, JsonCodec, _timestamp_us, _us_timestamp
+from .audit_rollups import AuditRollups
 
 AUDIT_LOG_PATH = Path.home() / ".opauth" / "audit.log"
+AUDIT_INDEX_PATH = Path.home() / ".opauth" / "audit.idx"
+AUDIT_SEGMENTS_PATH = Path.home() / ".opauth" / "audit.segments"
+AUDIT_CHECKPOINT_PATH = Path.home() / ".opauth" / "audit.checkpoints"
+AUDIT_KEY_PATH = Path.home() / ".opauth" / "audit.key"
+AUDIT_ROLLUPS_PATH = Path.home() / ".opauth" / "audit.rollups.json"
+AUDIT_LOCK_PATH = Path.home() / ".opauth" / "audit.lock"
+AUDIT_FORMAT_PATH = Path.home() / ".opauth" / "audit.format"
+AUDIT_DICTIONARY_PATH = Path.home() / ".opauth" / "audit.dict"
+
+# The log is stored in one encoding ("json" or "binary", see
+# audit_codec.py), recorded in audit.format. audit.log (or audit.bin)
+# is the active segment. When it spans more than segment_hours
+# or grows past max_segment_bytes it is sealed: gzipped into
+# audit.segments/ and recorded in audit.segments/manifest.json with its
+# time span, entry count, services and event types.
+SEGMENT_HOURS = 24
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Every entry carries "prev", the SHA-256 of the previous entry's JSON
+# form, chaining across segments. Every CHECKPOINT_EVERY entries an
+# HMAC-signed checkpoint of the chain head is appended to
+# audit.checkpoints, so verify() only re-hashes entries written since.
+CHECKPOINT_EVERY = 1000
+GENESIS_HASH = "0" * 64
+
+# Sidecar index layout (all files are append-only, fixed-width records).
+# Appends do not touch it: readers catch it up from the log under the
+# write lock before they use it.
+#   all              (offset, timestamp_us) for every entry, in log order
+#   service/<name>   offset of every entry for that service
+#   event/<name>     offset of every entry of that event type
+#   unordered        present once an entry is older than one before it,
+#                    so time-range scans cannot stop early
+_ALL_RECORD = struct.Struct("<Qq")
+_OFFSET_RECORD = struct.Struct("<Q")
+_INDEX_BLOCK = 4096  # records read per seek when walking an index backwards
+_CATCH_UP_BATCH = 10000  # records indexed per pass when catching up
+_US_PER_HOUR = 3600 * 1000000
+ENCODINGS = ("json", "binary")
+
+
+def _index_name(value: str) -> str:
+    """File-system safe name for a service or event index file."""
+    return quote(value, safe="").replace(".", "%2E") or "%00"
+
 
-class AuditLog:
+def _index_value(name: str) -> str:
+    """Inverse of _index_name."""
+    return "" if name == "%00" else unquote(name)
+
+
+def _entry_hash(entry: dict) -> str:
+    """Chain hash of an entry: SHA-256 of its JSON form."""
+    return hashlib.sha256(json.dumps(entry).encode()).hexdigest()
+
+
+def _sign_checkpoint(key_path: Path, checkpoint: dict) -> str:
+    """HMAC of a checkpoint with the local audit key, created on first use."""
+    if key_path.exists():
+        with open(key_path, 'rb') as f:
+            key = f.read()
+    else:
+        key = os.urandom(32)
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+    payload = json.dumps(checkpoint, sort_keys=True).encode()
+    return hmac.new(key, payload, hashlib.sha256).hexdigest()
+
+
+def _stamp(entries: list):
     """
-    Immutable audit log for all OpAuth operations.
-    AI cannot delete or modify entries.
+    Timestamp entries from log() and log_many() as they are committed.
+    Caller must hold the log's write lock, so entries are stamped in
+    the order they are written.
     """
+    now = datetime.now().isoformat()
+    for entry in entries:
+        if "timestamp" in entry and entry["timestamp"] is None:
+            entry["timestamp"] = now
 
-    def __init__(self):
-        self.log_path = AUDIT_LOG_PATH
-        self._ensure_directory()
 
-    def _ensure_directory(self):
-        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+def _match(entry: dict, service, events, since_us, until_us) -> bool:
+    if service is not None and entry.get("service") != service:
+        return False
+    if events is not None and entry.get("event") not in events:
+        return False
+    if since_us is not None or until_us is not None:
+        try:
+            ts = _timestamp_us(entry["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            return False
+        if since_us is not None and ts < since_us:
+            return False
+        if until_us is not None and ts > until_us:
+            return False
+    return True
+
+
+class AuditCommittedError(Exception):
+    """
+    A batch reached the log, but updating its index, checkpoint or
+    rollups afterwards failed. The entries are committed: writing them
+    again would duplicate them. Readers catch the index up on their own.
+    """
+
+
+class AuditWriter:
+    """
+    Background group-commit writer for audit entries.
+    Entries are batched and committed together by a dedicated thread.
+    A batch is committed once it holds flush_every entries, or once
+    flush_interval_ms has passed since the last commit.
+
+    A failed batch is kept and retried on the next cycle; once closed,
+    only CLOSE_RETRIES more times before close() raises the error.
+    """
+
+    CLOSE_RETRIES = 3
+
+    def __init__(self, write_batch, flush_every: int = 100, flush_interval_ms: int = 50):
+        self._write_batch = write_batch
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = max(1, flush_interval_ms) / 1000
+        self._pending = []
+        self._submitted = 0
+        self._committed = 0
+        self._error = None
+        self._errors = 0  # Failed writes so far; flush() raises only newer ones
+        self._flush_requested = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="opauth-audit-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, entry: dict):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Audit writer is closed")
+            self._pending.append(entry)
+            self._submitted += 1
+            if len(self._pending) >= self.flush_every:
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = None):
+        """
+        Block until every entry submitted so far is committed.
+        Raises if a write fails after the flush began and entries are
+        still pending; earlier failures are being retried.
+        """
+        with self._cond:
+            target = self._submitted
+            errors = self._errors
+            self._flush_requested = True
+            self._cond.notify_all()
+            self._cond.wait_for(
+                lambda: self._committed >= target or self._errors > errors,
+                timeout,
+            )
+            if self._committed < target:
+                if self._errors > errors:
+                    raise self._error
+                raise TimeoutError("Audit flush timed out")
+
+    def close(self):
+        """
+        Drain all pending entries and stop the writer thread.
+        Raises the last write error if entries could not be committed.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+        if self._pending:
+            raise self._error
+
+    def _run(self):
+        retries = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: (len(self._pending) >= self.flush_every
+                             or self._flush_requested or self._closed),
+                    self.flush_interval,
+                )
+                batch, self._pending = self._pending, []
+                self._flush_requested = False
+                closed = self._closed
+
+            error = None
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except AuditCommittedError as e:
+                    error = e  # Written; only the bookkeeping failed
+                except Exception as e:
+                    with self._cond:
+                        # Keep the entries; they are retried on the next cycle
+                        self._pending[:0] = batch
+                        self._error = e
+                        self._errors += 1
+                        self._cond.notify_all()
+                    if closed:
+                        retries += 1
+                        if retries > self.CLOSE_RETRIES:
+                            return  # close() raises the error
+                        time.sleep(self.flush_interval * 2 ** retries)
+                    continue
+
+            with self._cond:
+                self._committed += len(batch)
+                self._error = error
+                self._cond.notify_all()
+                if closed and not self._pending:
+                    return
+
+
+class BaseAuditLog:
+    """
+    Logging helpers shared by every audit log implementation.
+    Subclasses provide _write_entries(entries), which stamps, chains
+    and commits a batch, plus the query methods, and set location to
+    where the entries are kept, for display.
+
+    Entries are timestamped under the write lock, when they are
+    committed, so the log stays in time order across threads and
+    processes. Buffered entries are stamped when their batch commits.
+    """
+
+    _writer = None
+    location = None
 
     def log(self, event_type: str, service: str, details: dict, actor: str = "unknown"):
         """
         Log an event. Append-only.
         """
         entry = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": None,  # Stamped when committed
             "event": event_type,
             "service": service,
             "actor": actor,
             "details": details
         }
 
-        with open(self.log_path, 'a') as f:
-            f.write(json.dumps(entry) + "\n")
+        if self._writer is not None:
+            self._writer.submit(entry)
+        else:
+            self._write_entries([entry])
+
+    def log_many(self, events: list):
+        """
+        Log (event_type, service, details, actor) tuples as one batch,
+        committed before returning even when the log is buffered.
+        The batch is written on the calling thread, so it joins a
+        backend transaction the caller holds. It does not wait for
+        buffered entries: flush() first, before taking any lock the
+        writer thread needs, to keep earlier entries ahead of it.
+        """
+        entries = [
+            {"timestamp": None, "event": event_type, "service": service,
+             "actor": actor, "details": details}
+            for event_type, service, details, actor in events
+        ]
+        if entries:
+            self._write_entries(entries)
+
+    def flush(self):
+        """
+        Commit any buffered entries. No-op for unbuffered logs.
+        """
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """
+        Drain buffered entries and stop the writer thread.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
 
     def log_scope_grant(self, service: str, scope: list, actor: str = "human"):
         self.log("SCOPE_GRANT", service, {"scope": scope}, actor)
@@ -53,6 +330,9 @@ class AuditLog:
     def log_token_delete(self, service: str, actor: str = "human"):
         self.log("TOKEN_DELETE", service, {}, actor)
 
+    def log_token_refresh(self, service: str, details: dict, actor: str = "system"):
+        self.log("TOKEN_REFRESH", service, details, actor)
+
     def log_api_call(self, service: str, endpoint: str, actor: str = "ai"):
         self.log("API_CALL", service, {"endpoint": endpoint}, actor)
 
@@ -71,38 +351,920 @@ class AuditLog:
     def log_lock(self, actor: str = "human"):
         self.log("STORE_LOCK", "token_store", {}, actor)
 
-    def get_logs(self, limit: int = 100, service: str = None) -> list:
+    def import_entries(self, entries, batch_size: int = 1000, progress=None) -> int:
+        """
+        Append entries copied from another log, re-chained onto this
+        one. Returns the number imported.
+        """
+        count = 0
+        batch = []
+        for entry in entries:
+            batch.append({k: v for k, v in entry.items() if k != "prev"})
+            if len(batch) >= batch_size:
+                self._write_entries(batch)
+                count += len(batch)
+                batch = []
+                if progress:
+                    progress(count)
+        if batch:
+            self._write_entries(batch)
+            count += len(batch)
+        return count
+
+    def get_access_history(self, service: str, since=None, until=None) -> list:
+        """
+        Get all access events for a service.
         """
-        Read recent log entries.
+        return self.get_logs(limit=None, service=service,
+                             event=("TOKEN_ACCESS", "API_CALL"),
+                             since=since, until=until)
+
+
+class AuditLog(BaseAuditLog):
+    """
+    Immutable audit log for all OpAuth operations.
+    AI cannot delete or modify entries.
+
+    With buffered=True, entries are group-committed by an AuditWriter
+    thread instead of being written on the calling thread. fsync=True
+    forces every commit (single entry or batch) to disk.
+
+    encoding picks the on-disk format for a new log. An existing log
+    keeps its format until convert_encoding() is called.
+    """
+
+    def __init__(self, encoding: str = None, buffered: bool = False, flush_every: int = 100,
+                 flush_interval_ms: int = 50, fsync: bool = False,
+                 segment_hours: int = SEGMENT_HOURS,
+                 max_segment_bytes: int = MAX_SEGMENT_BYTES,
+                 checkpoint_every: int = CHECKPOINT_EVERY):
+        self.format_path = AUDIT_FORMAT_PATH
+        self._binary = BinaryCodec(AUDIT_DICTIONARY_PATH)
+        self.index_path = AUDIT_INDEX_PATH
+        self._all_path = self.index_path / "all"
+        self._index_files = {}  # (kind, value) -> index file path
+        self.segments_path = AUDIT_SEGMENTS_PATH
+        self.manifest_path = self.segments_path / "manifest.json"
+        self.checkpoint_path = AUDIT_CHECKPOINT_PATH
+        self.key_path = AUDIT_KEY_PATH
+        self.rollups = AuditRollups(AUDIT_ROLLUPS_PATH)
+        self.fsync = fsync
+        self.segment_hours = segment_hours
+        self.max_segment_bytes = max_segment_bytes
+        self.checkpoint_every = checkpoint_every
+        self._tail = None  # Active segment as of this instance's last write
+        # Several processes may append to the same log. Every write, and
+        # every index update, happens under the thread lock plus an
+        # advisory lock on audit.lock.
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(AUDIT_LOCK_PATH)
+        AUDIT_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with self._locked():
+            self._open_encoding(encoding)
+            self._ensure_directory()
+            self._recover_sealed()
+        self._writer = None
+        if buffered:
+            self._writer = AuditWriter(self._write_entries, flush_every, flush_interval_ms)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, self._file_lock:
+            yield
+
+    def close(self):
+        super().close()
+        with self._locked():
+            self.rollups.close()
+
+    def _codec_for(self, encoding: str):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown audit encoding: {encoding}")
+        return self._binary if encoding == "binary" else JsonCodec()
+
+    def _set_codec(self, codec):
+        self.codec = codec
+        self.log_path = AUDIT_LOG_PATH.with_suffix(codec.suffix)
+        self.location = str(self.log_path)
+
+    def _open_encoding(self, encoding: str = None):
+        """
+        Load the stored encoding, recording it for a new log.
+        Also cleans up after a conversion that was interrupted.
+        """
+        if self.format_path.exists():
+            stored = self.format_path.read_text().strip()
+        elif AUDIT_LOG_PATH.exists() or self.manifest_path.exists():
+            stored = "json"  # Logs written before encodings existed
+        else:
+            stored = encoding or "json"
+        if not self.format_path.exists():
+            atomic_write(self.format_path, stored.encode())
+        if encoding is not None and encoding != stored:
+            raise ValueError(
+                f"Audit log is stored as {stored}; use convert_encoding() to switch"
+            )
+        self._set_codec(self._codec_for(stored))
+
+        for other in ENCODINGS:
+            path = AUDIT_LOG_PATH.with_suffix(self._codec_for(other).suffix)
+            if other != stored and path.exists():
+                # A converted copy that never became current, or the
+                # original left behind after the switch
+                path.unlink()
+                self._clear_index()
+
+    def _ensure_directory(self):
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self.index_path.mkdir(parents=True, exist_ok=True)
+        self.segments_path.mkdir(parents=True, exist_ok=True)
+
+    def _active_tail(self, st: os.stat_result = None) -> dict:
+        """
+        The active segment as of this instance's last write: its file
+        state, first entry time, entry count, last entry's offset and
+        end, chain head, and entries covered by the last checkpoint.
+        Kept in memory; re-read from disk only when the log's state
+        (st, if the caller has it) shows another process wrote.
+        Caller must hold the write lock.
+        """
+        state = file_state(self.log_path) if st is None else (st.st_ino, st.st_size)
+        if self._tail is not None and self._tail["state"] == state:
+            return self._tail
+        first = last = None
+        entries = end = 0
+        head = self._sealed_head()
+        if state is not None and state[1]:
+            self._sync_index()
+            first = self._first_record(self._all_path, _ALL_RECORD)
+            last = self._last_record(self._all_path, _ALL_RECORD)
+            if last is not None:
+                entries = self._all_path.stat().st_size // _ALL_RECORD.size
+                end = self._indexed_size()
+                with open(self.log_path, 'rb') as f:
+                    head = self.codec.chain_hash(self.codec.read_at(f, last[0]))
+        checkpoint = self._last_checkpoint()
+        checkpointed = 0
+        segment = _us_timestamp(first[1]) if first else None
+        if checkpoint and checkpoint.get("segment") in (None, segment):
+            checkpointed = checkpoint["entries"]
+        self._tail = {
+            "state": state,
+            "first": first[1] if first else None,
+            "entries": entries,
+            "last": last[0] if last else 0,
+            "end": end,
+            "head": head,
+            "checkpointed": checkpointed,
+        }
+        return self._tail
+
+    def _open_log(self):
+        """
+        Append descriptor for the active segment, and its tail.
+        """
+        flags = os.O_RDWR | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        fd = os.open(self.log_path, flags, 0o600)
+        try:
+            return fd, self._active_tail(os.fstat(fd))
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def _write_entries(self, entries: list):
+        """
+        Chain entries onto the log in a single write.
+        One open, fstat and write when this instance wrote last.
+        """
+        with self._locked():
+            _stamp(entries)
+            fd, tail = self._open_log()
+            written = False
+            try:
+                if self._rotation_due(tail, entries[0]["timestamp"]):
+                    os.close(fd)
+                    fd = None
+                    self._seal_active()
+                    fd, tail = self._open_log()
+
+                prev = tail["head"]
+                records = []
+                for entry in entries:
+                    entry["prev"] = prev
+                    prev = _entry_hash(entry)
+                    records.append(self.codec.encode(entry))
+                data = b"".join(records)
+
+                offset = tail["state"][1]
+                if offset != tail["end"] and not self.codec.ends_cleanly(fd, offset):
+                    # A writer died mid-entry
+                    if self.codec.terminator:
+                        data = self.codec.terminator + data
+                        offset += len(self.codec.terminator)
+                    else:
+                        offset = tail["end"]
+                        os.ftruncate(fd, offset)
+                # One write per batch, so other readers and writers never
+                # see a partial batch interleaved with their own entries
+                os.write(fd, data)
+                written = True
+                if self.fsync:
+                    os.fsync(fd)
+                end = offset + len(data)
+                if tail["first"] is None:
+                    tail["first"] = _timestamp_us(entries[0]["timestamp"])
+                tail["state"] = (tail["state"][0], end)
+                tail["entries"] += len(entries)
+                tail["last"] = end - len(records[-1])
+                tail["end"] = end
+                tail["head"] = prev
+            except Exception as e:
+                if written:
+                    raise AuditCommittedError(f"Audit entries written, then: {e}") from e
+                raise
+            finally:
+                if fd is not None:
+                    os.close(fd)
+
+            try:
+                self._checkpoint_if_due(tail)
+                self.rollups.record(entries)
+            except Exception as e:
+                raise AuditCommittedError(f"Audit entries written, then: {e}") from e
+
+    # Sidecar index
+
+    def _index_file(self, kind: str, value: str) -> Path:
+        path = self._index_files.get((kind, value))
+        if path is None:
+            path = self._index_files[(kind, value)] = self.index_path / kind / _index_name(value)
+        return path
+
+    def _first_record(self, path: Path, record: struct.Struct):
+        if not path.exists():
+            return None
+        with open(path, 'rb') as f:
+            data = f.read(record.size)
+        if len(data) < record.size:
+            return None
+        return record.unpack(data)
+
+    def _last_record(self, path: Path, record: struct.Struct):
+        if not path.exists():
+            return None
+        with open(path, 'rb') as f:
+            size = f.seek(0, 2)
+            size -= size % record.size
+            if size == 0:
+                return None
+            f.seek(size - record.size)
+            return record.unpack(f.read(record.size))
+
+    def _append_records(self, path: Path, record: struct.Struct, rows: list):
+        """
+        Append index rows, skipping any already present.
+        Rows left behind by an interrupted write are not duplicated.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'ab+') as f:
+            size = f.seek(0, 2)
+            if size % record.size:
+                size -= size % record.size
+                f.truncate(size)
+            last = -1
+            if size:
+                f.seek(size - record.size)
+                last = record.unpack(f.read(record.size))[0]
+            f.write(b"".join(record.pack(*row) for row in rows if row[0] > last))
+
+    def _index_entries(self, items: list):
+        """
+        Index (offset, entry) pairs. The "all" index is written last,
+        so it only ever covers entries that are fully indexed.
+        """
+        by_file = {}
+        all_rows = []
+        last = self._last_record(self._all_path, _ALL_RECORD)
+        last_offset, newest = last if last is not None else (-1, None)
+        ordered = True
+        for offset, entry in items:
+            for kind in ("service", "event"):
+                path = self._index_file(kind, str(entry.get(kind)))
+                by_file.setdefault(path, []).append((offset,))
+            try:
+                ts = _timestamp_us(entry["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                ts = 0
+            all_rows.append((offset, ts))
+            if offset > last_offset:
+                if newest is not None and ts < newest:
+                    ordered = False
+                newest = ts if newest is None else max(newest, ts)
+
+        if not ordered:
+            (self.index_path / "unordered").touch()
+        for path, rows in by_file.items():
+            self._append_records(path, _OFFSET_RECORD, rows)
+        self._append_records(self._all_path, _ALL_RECORD, all_rows)
+
+    def _indexed_size(self) -> int:
         """
+        Byte length of the log covered by the index.
+        Returns -1 if the index does not match the log.
+        """
+        last = self._last_record(self._all_path, _ALL_RECORD)
+        if last is None:
+            return 0
         if not self.log_path.exists():
+            return -1
+        with open(self.log_path, 'rb') as f:
+            raw = self.codec.read_at(f, last[0])
+        if raw is None:
+            return -1
+        return last[0] + len(raw)
+
+    def _clear_index(self):
+        for path in sorted(self.index_path.rglob("*"), reverse=True):
+            if path.is_dir():
+                path.rmdir()
+            else:
+                path.unlink()
+
+    def _sync_index(self):
+        """
+        Index any complete records the index does not cover yet.
+        Rebuilds from scratch if the log was replaced or truncated.
+        """
+        if not self.log_path.exists():
+            self._clear_index()
+            return
+
+        start = self._indexed_size()
+        if start < 0 or start > self.log_path.stat().st_size:
+            self._clear_index()
+            start = 0
+
+        with open(self.log_path, 'rb') as f:
+            f.seek(start)
+            batch = []
+            for offset, raw in self.codec.iter_records(f):
+                try:
+                    batch.append((offset, self.codec.decode(raw)))
+                except ValueError:
+                    pass
+                if len(batch) >= _CATCH_UP_BATCH:
+                    self._index_entries(batch)
+                    batch = []
+            if batch:
+                self._index_entries(batch)
+
+    def _iter_index_rows(self, path: Path, record: struct.Struct,
+                         reverse: bool = False, start: int = 0):
+        """
+        Yield (offset, ...) rows from an index file, from row number
+        start onwards, or newest first when reverse is set.
+        """
+        if not path.exists():
+            return
+        with open(path, 'rb') as f:
+            end = f.seek(0, 2)
+            end -= end % record.size
+            if reverse:
+                while end > 0:
+                    block_start = max(0, end - _INDEX_BLOCK * record.size)
+                    f.seek(block_start)
+                    block = f.read(end - block_start)
+                    for i in range(len(block) - record.size, -1, -record.size):
+                        yield record.unpack_from(block, i)
+                    end = block_start
+            else:
+                pos = start * record.size
+                while pos < end:
+                    f.seek(pos)
+                    block = f.read(min(_INDEX_BLOCK * record.size, end - pos))
+                    for i in range(0, len(block), record.size):
+                        yield record.unpack_from(block, i)
+                    pos += len(block)
+
+    def _bisect_time(self, since_us: int) -> int:
+        """
+        Row number of the first active entry at or after since_us.
+        """
+        path = self._all_path
+        if not path.exists():
+            return 0
+        with open(path, 'rb') as f:
+            lo, hi = 0, f.seek(0, 2) // _ALL_RECORD.size
+            while lo < hi:
+                mid = (lo + hi) // 2
+                f.seek(mid * _ALL_RECORD.size)
+                if _ALL_RECORD.unpack(f.read(_ALL_RECORD.size))[1] < since_us:
+                    lo = mid + 1
+                else:
+                    hi = mid
+        return lo
+
+    def _iter_active(self, service, events, since_us, until_us, reverse: bool):
+        """
+        Yield matching entries from the active segment.
+        Only entries reachable through the narrowest index are read.
+        Scans stop at the query's time bound only while the index is in
+        time order; imported entries or a clock set back can break it.
+        """
+        ordered = not (self.index_path / "unordered").exists()
+        if service is not None:
+            paths = [self._index_file("service", service)]
+        elif events is not None:
+            paths = [self._index_file("event", e) for e in events]
+        else:
+            paths = []
+
+        if paths:
+            streams = [self._iter_index_rows(p, _OFFSET_RECORD, reverse) for p in paths]
+            rows = heapq.merge(*streams, reverse=reverse) if len(streams) > 1 else streams[0]
+        else:
+            start = 0
+            if since_us is not None and not reverse and ordered:
+                start = self._bisect_time(since_us)
+            rows = self._iter_index_rows(self._all_path, _ALL_RECORD, reverse, start)
+
+        with open(self.log_path, 'rb') as f:
+            for row in rows:
+                if len(row) > 1:
+                    # The "all" index carries timestamps; skip without reading
+                    if until_us is not None and row[1] > until_us:
+                        if reverse or not ordered:
+                            continue
+                        return
+                    if since_us is not None and row[1] < since_us:
+                        if reverse and ordered:
+                            return
+                        continue
+                raw = self.codec.read_at(f, row[0])
+                if raw is None:
+                    continue
+                if not self.codec.may_match(raw, service, events, since_us, until_us):
+                    header = self.codec.header(raw)
+                    if (reverse and ordered and since_us is not None
+                            and header and header[0] < since_us):
+                        return
+                    continue
+                try:
+                    entry = self.codec.decode(raw)
+                except ValueError:
+                    continue
+                if _match(entry, service, events, since_us, until_us):
+                    yield entry
+                elif since_us is not None and reverse and ordered:
+                    try:
+                        if _timestamp_us(entry["timestamp"]) < since_us:
+                            return
+                    except (KeyError, TypeError, ValueError):
+                        pass
+
+    # Segments
+
+    def _load_manifest(self) -> list:
+        if not self.manifest_path.exists():
             return []
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)["segments"]
+
+    def _save_manifest(self, segments: list):
+        data = json.dumps({"segments": segments}, indent=2).encode()
+        atomic_write(self.manifest_path, data, fsync=self.fsync)
 
-        entries = []
-        with open(self.log_path, 'r') as f:
-            for line in f:
+    def _index_values(self, kind: str) -> list:
+        path = self.index_path / kind
+        if not path.exists():
+            return []
+        return sorted(_index_value(p.name) for p in path.iterdir())
+
+    def _recover_sealed(self):
+        """
+        Drop the active segment if a crash left it behind after sealing.
+        """
+        self._sync_index()
+        first = self._first_record(self._all_path, _ALL_RECORD)
+        segments = self._load_manifest()
+        if first is not None and segments and segments[-1]["file"] == self._segment_name(first[1]):
+            self.log_path.unlink(missing_ok=True)
+            self._clear_index()
+
+    def _rotation_due(self, tail: dict, timestamp: str) -> bool:
+        if tail["first"] is None:
+            return False
+        if tail["end"] >= self.max_segment_bytes:
+            return True
+        span = self.segment_hours * _US_PER_HOUR
+        return tail["first"] // span != _timestamp_us(timestamp) // span
+
+    def _segment_name(self, first_us: int) -> str:
+        """Archive name of the active segment, from its first entry's time."""
+        first = datetime.fromisoformat(_us_timestamp(first_us))
+        return f"audit-{first:%Y%m%dT%H%M%S%f}{self.codec.suffix}.gz"
+
+    def _seal_active(self):
+        """
+        Compress the active segment into the archive and start a new one.
+        """
+        self._sync_index()
+        first = self._first_record(self._all_path, _ALL_RECORD)
+        if first is None:
+            self.log_path.unlink()
+            self._clear_index()
+            return
+        # The span covers every entry, even ones out of time order
+        times = [ts for _, ts in self._iter_index_rows(self._all_path, _ALL_RECORD)]
+
+        name = self._segment_name(first[1])
+        target = self.segments_path / name
+        tmp_path = target.with_name(name + ".tmp")
+        with open(self.log_path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, target)
+
+        last_hash = self._chain_head()
+        segments = self._load_manifest()
+        segments.append({
+            "file": name,
+            "start": _us_timestamp(min(times)),
+            "end": _us_timestamp(max(times)),
+            "count": (self._all_path).stat().st_size // _ALL_RECORD.size,
+            "services": self._index_values("service"),
+            "events": self._index_values("event"),
+            "last_hash": last_hash,
+            "encoding": self.codec.name,
+        })
+        self._save_manifest(segments)
+
+        self.log_path.unlink()
+        self._clear_index()
+        self._tail = None
+        self._reset_checkpoints(last_hash)
+
+    def _iter_segment(self, segment: dict, service, events, since_us, until_us):
+        codec = self._codec_for(segment.get("encoding", "json"))
+        with gzip.open(self.segments_path / segment["file"], 'rb') as f:
+            for _, raw in codec.iter_records(f):
+                if not codec.may_match(raw, service, events, since_us, until_us):
+                    continue
                 try:
-                    entry = json.loads(line.strip())
-                    if service is None or entry.get("service") == service:
-                        entries.append(entry)
-                except:
+                    entry = codec.decode(raw)
+                except ValueError:
                     continue
+                if _match(entry, service, events, since_us, until_us):
+                    yield entry
+
+    def _matching_segments(self, service, events, since_us, until_us) -> list:
+        """
+        Sealed segments that can contain entries for the query.
+        """
+        result = []
+        for segment in self._load_manifest():
+            if since_us is not None and _timestamp_us(segment["end"]) < since_us:
+                continue
+            if until_us is not None and _timestamp_us(segment["start"]) > until_us:
+                continue
+            if service is not None and service not in segment["services"]:
+                continue
+            if events is not None and not set(events) & set(segment["events"]):
+                continue
+            result.append(segment)
+        return result
 
-        return entries[-limit:]
+    # Hash chain
 
-    def get_access_history(self, service: str) -> list:
+    def _sealed_head(self) -> str:
+        segments = self._load_manifest()
+        if segments:
+            return segments[-1].get("last_hash", GENESIS_HASH)
+        return GENESIS_HASH
+
+    def _chain_head(self) -> str:
         """
-        Get all access events for a service.
+        Hash of the newest entry, which the next entry links to.
+        """
+        return self._active_tail()["head"]
+
+    def _sign(self, checkpoint: dict) -> str:
+        return _sign_checkpoint(self.key_path, checkpoint)
+
+    def _active_segment_id(self):
+        first = self._first_record(self._all_path, _ALL_RECORD)
+        return _us_timestamp(first[1]) if first is not None else None
+
+    def _tail_segment_id(self, tail: dict):
+        return _us_timestamp(tail["first"]) if tail["first"] is not None else None
+
+    def _make_checkpoint(self, tail: dict) -> dict:
+        checkpoint = {
+            "timestamp": datetime.now().isoformat(),
+            "segment": self._tail_segment_id(tail),
+            "entries": tail["entries"],
+            "line": tail["last"],
+            "end": tail["end"],
+            "hash": tail["head"],
+        }
+        checkpoint["sig"] = self._sign(checkpoint)
+        return checkpoint
+
+    def _append_checkpoint(self, tail: dict):
+        checkpoint = self._make_checkpoint(tail)
+        with open(self.checkpoint_path, 'ab') as f:
+            f.write((json.dumps(checkpoint) + "\n").encode())
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        tail["checkpointed"] = checkpoint["entries"]
+
+    def _reset_checkpoints(self, head: str):
+        """
+        Start the checkpoint file for a fresh active segment.
+        """
+        checkpoint = {
+            "timestamp": datetime.now().isoformat(),
+            "segment": None,
+            "entries": 0,
+            "line": 0,
+            "end": 0,
+            "hash": head,
+        }
+        checkpoint["sig"] = self._sign(checkpoint)
+        atomic_write(self.checkpoint_path, (json.dumps(checkpoint) + "\n").encode(),
+                     fsync=self.fsync)
+
+    def _last_checkpoint(self):
+        if not self.checkpoint_path.exists():
+            return None
+        with open(self.checkpoint_path, 'rb') as f:
+            size = f.seek(0, 2)
+            f.seek(max(0, size - 4096))
+            lines = f.read().splitlines()
+        for line in reversed(lines):
+            try:
+                return json.loads(line)
+            except ValueError:
+                continue
+        return None
+
+    def _checkpoint_if_due(self, tail: dict):
+        # The tail's checkpoint count is re-read with the rest of the tail
+        # whenever another process wrote, so no stat of the checkpoint file
+        if tail["entries"] - tail["checkpointed"] >= self.checkpoint_every:
+            self._append_checkpoint(tail)
+
+    def _verify_records(self, codec, records, prev: str, result: dict) -> str:
         """
-        return [e for e in self.get_logs(limit=1000, service=service)
-                if e["event"] in ("TOKEN_ACCESS", "API_CALL")]
+        Check that each record links to the one before it.
+        Returns the new chain head, or None on the first broken link.
+        """
+        for _, raw in records:
+            try:
+                entry = codec.decode(raw)
+            except ValueError:
+                # Torn line from a crashed writer. It was never chained,
+                # so the next entry still links to the one before it.
+                result["torn"] += 1
+                continue
+            if "prev" not in entry and result["verified"] == result["unchained"]:
+                # Written before entries were chained
+                result["unchained"] += 1
+            elif entry.get("prev") != prev:
+                result["error"] = (f"Chain broken at entry {entry.get('timestamp')} "
+                                   f"after {result['verified']} verified")
+                return None
+            prev = codec.chain_hash(raw)
+            result["verified"] += 1
+        return prev
+
+    def verify(self, full: bool = False) -> dict:
+        """
+        Check the audit log for tampering.
+        By default only entries written since the last signed checkpoint
+        are re-hashed, so cost stays flat as the log grows. full=True
+        re-hashes every sealed segment and the whole active segment.
+        """
+        self.flush()
+        with self._locked():
+            self._sync_index()
+            end = self._indexed_size() if self.log_path.exists() else 0
+            segments = self._load_manifest()
+            checkpoint = self._last_checkpoint()
+            segment_id = self._active_segment_id()
+
+        result = {"valid": False, "verified": 0, "unchained": 0, "torn": 0,
+                  "checkpoint": None, "error": None}
+        prev = GENESIS_HASH
+        start = 0
+
+        if full:
+            for segment in segments:
+                codec = self._codec_for(segment.get("encoding", "json"))
+                with gzip.open(self.segments_path / segment["file"], 'rb') as f:
+                    prev = self._verify_records(codec, codec.iter_records(f), prev, result)
+                if prev is None:
+                    return result
+                if prev != segment.get("last_hash", prev):
+                    result["error"] = f"Segment {segment['file']} does not match manifest"
+                    return result
+        else:
+            prev = segments[-1].get("last_hash", GENESIS_HASH) if segments else GENESIS_HASH
+            if checkpoint is not None:
+                sig = checkpoint.pop("sig", "")
+                if not hmac.compare_digest(sig, self._sign(checkpoint)):
+                    result["error"] = "Checkpoint signature invalid"
+                    return result
+                if checkpoint.get("segment") == segment_id and checkpoint["end"]:
+                    if checkpoint["end"] > end:
+                        result["error"] = "Log truncated before last checkpoint"
+                        return result
+                    with open(self.log_path, 'rb') as f:
+                        raw = self.codec.read_at(f, checkpoint["line"])
+                    if (raw is None or checkpoint["line"] + len(raw) != checkpoint["end"]
+                            or self.codec.chain_hash(raw) != checkpoint["hash"]):
+                        result["error"] = "Entry at last checkpoint was modified"
+                        return result
+                    prev = checkpoint["hash"]
+                    start = checkpoint["end"]
+                    result["checkpoint"] = checkpoint["timestamp"]
+
+        if end > start:
+            with open(self.log_path, 'rb') as f:
+                f.seek(start)
+                records = self.codec.iter_records(f, end)
+                if self._verify_records(self.codec, records, prev, result) is None:
+                    return result
+
+        result["valid"] = True
+        return result
+
+    # Encoding
+
+    def convert_encoding(self, encoding: str):
+        """
+        Losslessly rewrite every segment in another encoding.
+        Entries and their hash chain are unchanged. The index is rebuilt
+        and a fresh checkpoint issued, since byte offsets move. Run it
+        while no other process is writing to the log.
+        """
+        target = self._codec_for(encoding)
+        self.flush()
+        with self._locked():
+            self._sync_index()
+            segments = self._load_manifest()
+            for segment in segments:
+                source = self._codec_for(segment.get("encoding", "json"))
+                if source.name == target.name:
+                    continue
+                old_path = self.segments_path / segment["file"]
+                name = segment["file"].split(".")[0] + target.suffix + ".gz"
+                tmp_path = self.segments_path / (name + ".tmp")
+                with gzip.open(old_path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+                    self._convert_records(source, target, src, dst)
+                os.replace(tmp_path, self.segments_path / name)
+                segment["file"] = name
+                segment["encoding"] = target.name
+                self._save_manifest(segments)
+                old_path.unlink()
+
+            if target.name != self.codec.name:
+                old_path = self.log_path
+                new_path = AUDIT_LOG_PATH.with_suffix(target.suffix)
+                if old_path.exists():
+                    tmp_path = new_path.with_name(new_path.name + ".tmp")
+                    with open(old_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                        self._convert_records(self.codec, target, src, dst)
+                        if self.fsync:
+                            dst.flush()
+                            os.fsync(dst.fileno())
+                    os.replace(tmp_path, new_path)
+                # The format file decides which copy is current
+                atomic_write(self.format_path, target.name.encode(), fsync=self.fsync)
+                old_path.unlink(missing_ok=True)
+                self._set_codec(target)
+
+            self._clear_index()
+            self._sync_index()
+            self._tail = None
+            self._reset_checkpoints(self._sealed_head())
+            tail = self._active_tail()
+            if tail["entries"]:
+                self._append_checkpoint(tail)
+
+    def _convert_records(self, source, target, src, dst):
+        for _, raw in source.iter_records(src):
+            try:
+                entry = source.decode(raw)
+            except ValueError:
+                continue  # Torn record
+            dst.write(target.encode(entry))
+
+    # Queries
+
+    def _prepare_query(self, service, event, since, until):
+        self.flush()
+        with self._locked():
+            self._sync_index()
+        events = None
+        if event is not None:
+            events = (event,) if isinstance(event, str) else tuple(event)
+        since_us = _timestamp_us(since) if since is not None else None
+        until_us = _timestamp_us(until) if until is not None else None
+        return service, events, since_us, until_us
+
+    def iter_entries(self, since=None, until=None, service: str = None, event=None):
+        """
+        Stream matching entries oldest first, across all segments.
+        Only segments overlapping the query are opened.
+        since/until accept ISO strings or datetimes; event may be a tuple.
+        """
+        query = self._prepare_query(service, event, since, until)
+        for segment in self._matching_segments(*query):
+            yield from self._iter_segment(segment, *query)
+        if self.log_path.exists():
+            yield from self._iter_active(*query, reverse=False)
+
+    def _iter_entries_reverse(self, query: tuple, limit: int = None):
+        """
+        Yield matching entries newest first.
+        A sealed segment can only be read forwards, so at most limit of
+        its matches are buffered before they are yielded.
+        """
+        if self.log_path.exists():
+            yield from self._iter_active(*query, reverse=True)
+        for segment in reversed(self._matching_segments(*query)):
+            matches = deque(self._iter_segment(segment, *query), maxlen=limit)
+            while matches:
+                yield matches.pop()
+
+    def get_logs(self, limit: int = 100, service: str = None, event=None,
+                 since=None, until=None) -> list:
+        """
+        Read log entries, oldest first.
+        With a limit, the newest matching entries are found by seeking
+        backwards, so cost follows the result size. limit=None returns
+        every match in the time range.
+        """
+        if limit is None:
+            return list(self.iter_entries(since, until, service, event))
+
+        query = self._prepare_query(service, event, since, until)
+        entries = list(islice(self._iter_entries_reverse(query, limit), limit))
+        entries.reverse()
+        return entries
+
+    # Rollups
+
+    def get_rollups(self, granularity: str = "hour", since=None, until=None,
+                    service: str = None, event=None, actor: str = None) -> list:
+        """
+        Event counts per minute, hour or day bucket.
+        Reads only the rollups, never the raw log. For example,
+        get_rollups("hour", event="API_CALL") gives API calls per
+        service per hour.
+        """
+        self.flush()
+        return self.rollups.query(granularity, since, until, service, event, actor)
+
+    def rebuild_rollups(self):
+        """
+        Recreate the rollups from every segment of the raw log.
+        Writers wait until the rebuild is done.
+        """
+        self.flush()
+        with self._locked():
+            self._sync_index()
+            query = (None, None, None, None)
+
+            def entries():
+                for segment in self._load_manifest():
+                    yield from self._iter_segment(segment, *query)
+                if self.log_path.exists():
+                    yield from self._iter_active(*query, reverse=False)
+
+            self.rollups.rebuild(entries())
 
 
 # Singleton instance
 _audit = None
 
-def get_audit() -> AuditLog:
+def get_audit() -> BaseAuditLog:
+    """
+    The shared audit log, stored by the configured storage backend.
+    """
     global _audit
     if _audit is None:
-        _audit = AuditLog()
+        _audit = get_backend().open_audit()
+    return _audit
+
+def configure_audit(**options) -> BaseAuditLog:
+    """
+    Replace the shared audit log, e.g. configure_audit(buffered=True).
+    The previous instance is drained first.
+    """
+    global _audit
+    if _audit is not None:
+        _audit.close()
+    _audit = get_backend().open_audit(**options)
     return _audit
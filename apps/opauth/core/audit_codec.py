@@ -0,0 +1,303 @@
+"""
+OpAuth Audit Codecs
+On-disk encodings for audit entries.
+
+json    One JSON object per line. Human readable; the default.
+binary  Length-prefixed records with interned event/service/actor
+        codes, integer timestamps and a compact details payload.
+        Queries can filter on the fixed header without decoding the
+        details.
+
+Both encodings round-trip entries exactly, and the hash chain is
+computed over the JSON form, so converting between them never breaks
+the chain.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import struct
+from datetime import datetime, timedelta
+from pathlib import Path
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Binary record: <u32 n> payload[n] <u32 n>. The trailing length lets a
+# writer check that the file ends on a complete record.
+_FRAME = struct.Struct("<I")
+# Payload: flags, then unless RAW: timestamp_us, event, service, actor,
+# [32-byte prev hash], compact JSON details
+_FLAGS = struct.Struct("<B")
+_HEADER = struct.Struct("<qIII")
+_RECORD_HEADER = struct.Struct("<IBqIII")  # Frame, flags and header in one unpack
+_FLAG_RAW = 1   # Entry stored as plain JSON (not in the standard shape)
+_FLAG_PREV = 2  # Header is followed by the 32-byte prev hash
+_STANDARD_KEYS = ("timestamp", "event", "service", "actor", "details")
+_READ_CHUNK = 256 * 1024  # bytes read at a time when scanning binary records
+
+
+def _timestamp_us(timestamp) -> int:
+    """Convert an ISO entry timestamp (or datetime) to integer microseconds."""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return (timestamp - _EPOCH) // timedelta(microseconds=1)
+
+
+@functools.lru_cache(maxsize=4096)
+def _second_timestamp(seconds: int) -> str:
+    return (_EPOCH + timedelta(seconds=seconds)).isoformat()
+
+
+def _us_timestamp(us: int) -> str:
+    """Convert integer microseconds back to an ISO timestamp."""
+    # Entries cluster within seconds, so only the fraction is formatted
+    seconds, micro = divmod(us, 1000000)
+    prefix = _second_timestamp(seconds)
+    return f"{prefix}.{micro:06d}" if micro else prefix
+
+
+def _chain_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class JsonCodec:
+    """
+    One JSON entry per line.
+    """
+
+    name = "json"
+    suffix = ".log"
+    terminator = b"\n"  # Written before new entries to close off a torn line
+
+    def encode(self, entry: dict) -> bytes:
+        return json.dumps(entry).encode() + b"\n"
+
+    def decode(self, raw: bytes) -> dict:
+        return json.loads(raw)
+
+    def chain_hash(self, raw: bytes) -> str:
+        return _chain_hash(raw.rstrip(b"\n"))
+
+    def header(self, raw: bytes):
+        return None  # No header to read without parsing the line
+
+    def may_match(self, raw: bytes, service, events, since_us, until_us) -> bool:
+        return True
+
+    def read_at(self, f, offset: int):
+        """
+        The complete record at offset, or None.
+        """
+        f.seek(offset)
+        line = f.readline()
+        return line if line.endswith(b"\n") else None
+
+    def iter_records(self, f, end: int = None):
+        """
+        Yield (offset, raw) for each complete record from f's position,
+        up to byte offset end.
+        """
+        offset = f.tell()
+        while end is None or offset < end:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                return  # Entry still being written
+            yield offset, line
+            offset += len(line)
+
+    def ends_cleanly(self, fd: int, size: int) -> bool:
+        os.lseek(fd, size - 1, os.SEEK_SET)
+        return os.read(fd, 1) == b"\n"
+
+
+class BinaryCodec:
+    """
+    Length-prefixed binary records.
+    Event, service and actor names are interned in an append-only
+    dictionary file shared by every segment. Entries that do not have
+    the standard shape are stored as raw JSON, so nothing is lost.
+    """
+
+    name = "binary"
+    suffix = ".bin"
+    terminator = None  # Torn records are truncated instead
+
+    def __init__(self, dictionary_path: Path):
+        self.dictionary_path = dictionary_path
+        self._strings = []
+        self._codes = {}
+        self._loaded_size = 0
+
+    def _load_dictionary(self):
+        if not self.dictionary_path.exists():
+            return
+        with open(self.dictionary_path, 'rb') as f:
+            f.seek(self._loaded_size)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                value = json.loads(line)
+                self._codes[value] = len(self._strings)
+                self._strings.append(value)
+                self._loaded_size += len(line)
+
+    def _intern(self, value: str) -> int:
+        """
+        Code for a string, adding it to the dictionary if new.
+        Caller must hold the audit log's write lock.
+        """
+        code = self._codes.get(value)
+        if code is None:
+            self._load_dictionary()
+            code = self._codes.get(value)
+        if code is None:
+            line = (json.dumps(value) + "\n").encode()
+            with open(self.dictionary_path, 'ab') as f:
+                f.write(line)
+            code = len(self._strings)
+            self._codes[value] = code
+            self._strings.append(value)
+            self._loaded_size += len(line)
+        return code
+
+    def _string(self, code: int) -> str:
+        if code >= len(self._strings):
+            self._load_dictionary()  # Interned by another process
+        return self._strings[code]
+
+    def _is_standard(self, entry: dict) -> bool:
+        keys = tuple(entry)
+        if keys not in (_STANDARD_KEYS, _STANDARD_KEYS + ("prev",)):
+            return False
+        if not all(isinstance(entry[k], str) for k in ("timestamp", "event", "service", "actor")):
+            return False
+        if "prev" in entry and not (isinstance(entry["prev"], str) and len(entry["prev"]) == 64):
+            return False
+        try:
+            # Timestamps must survive the trip through integer microseconds
+            return _us_timestamp(_timestamp_us(entry["timestamp"])) == entry["timestamp"]
+        except ValueError:
+            return False
+
+    def encode(self, entry: dict) -> bytes:
+        if self._is_standard(entry):
+            flags = _FLAG_PREV if "prev" in entry else 0
+            payload = _FLAGS.pack(flags) + _HEADER.pack(
+                _timestamp_us(entry["timestamp"]),
+                self._intern(entry["event"]),
+                self._intern(entry["service"]),
+                self._intern(entry["actor"]),
+            )
+            if flags & _FLAG_PREV:
+                payload += bytes.fromhex(entry["prev"])
+            payload += json.dumps(entry["details"], separators=(",", ":")).encode()
+        else:
+            payload = _FLAGS.pack(_FLAG_RAW) + json.dumps(entry, separators=(",", ":")).encode()
+        frame = _FRAME.pack(len(payload))
+        return frame + payload + frame
+
+    def header(self, raw: bytes):
+        """
+        (timestamp_us, event, service, actor) without decoding details,
+        or None for raw JSON records.
+        """
+        if raw[_FRAME.size] & _FLAG_RAW:
+            return None
+        ts, event, service, actor = _RECORD_HEADER.unpack_from(raw)[2:]
+        return ts, self._string(event), self._string(service), self._string(actor)
+
+    def decode(self, raw: bytes) -> dict:
+        try:
+            return self._decode(raw)
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise ValueError(f"Corrupt audit record: {e}") from e
+
+    def _decode(self, raw: bytes) -> dict:
+        flags = raw[_FRAME.size]
+        if flags & _FLAG_RAW:
+            return json.loads(raw[_FRAME.size + _FLAGS.size:-_FRAME.size])
+        _, _, ts, event, service, actor = _RECORD_HEADER.unpack_from(raw)
+        pos = _RECORD_HEADER.size
+        prev = None
+        if flags & _FLAG_PREV:
+            prev = raw[pos:pos + 32].hex()
+            pos += 32
+        entry = {
+            "timestamp": _us_timestamp(ts),
+            "event": self._string(event),
+            "service": self._string(service),
+            "actor": self._string(actor),
+            "details": json.loads(raw[pos:-_FRAME.size]),
+        }
+        if prev is not None:
+            entry["prev"] = prev
+        return entry
+
+    def chain_hash(self, raw: bytes) -> str:
+        return _chain_hash(json.dumps(self.decode(raw)).encode())
+
+    def may_match(self, raw: bytes, service, events, since_us, until_us) -> bool:
+        header = self.header(raw)
+        if header is None:
+            return True
+        ts, event, svc, _ = header
+        if service is not None and svc != service:
+            return False
+        if events is not None and event not in events:
+            return False
+        if since_us is not None and ts < since_us:
+            return False
+        if until_us is not None and ts > until_us:
+            return False
+        return True
+
+    def _read_frame(self, f):
+        head = f.read(_FRAME.size)
+        if len(head) < _FRAME.size:
+            return None
+        n = _FRAME.unpack(head)[0]
+        rest = f.read(n + _FRAME.size)
+        if len(rest) < n + _FRAME.size or rest[n:] != head:
+            return None  # Torn or corrupt record
+        return head + rest
+
+    def read_at(self, f, offset: int):
+        f.seek(offset)
+        return self._read_frame(f)
+
+    def iter_records(self, f, end: int = None):
+        """
+        Yield (offset, raw) for each complete record from f's position,
+        up to byte offset end. Reads in large chunks; f's position
+        afterwards is unspecified.
+        """
+        offset = f.tell()
+        buf, pos = b"", 0
+        while end is None or offset < end:
+            if len(buf) - pos < _FRAME.size:
+                buf, pos = buf[pos:] + f.read(_READ_CHUNK), 0
+                if len(buf) < _FRAME.size:
+                    return
+            size = _FRAME.unpack_from(buf, pos)[0] + 2 * _FRAME.size
+            if len(buf) - pos < size:
+                buf, pos = buf[pos:] + f.read(max(size, _READ_CHUNK)), 0
+                if len(buf) < size:
+                    return  # Record still being written
+            raw = buf[pos:pos + size]
+            if raw[-_FRAME.size:] != raw[:_FRAME.size]:
+                return  # Torn or corrupt record
+            yield offset, raw
+            pos += size
+            offset += size
+
+    def ends_cleanly(self, fd: int, size: int) -> bool:
+        if size < 2 * _FRAME.size:
+            return False
+        os.lseek(fd, size - _FRAME.size, os.SEEK_SET)
+        tail = os.read(fd, _FRAME.size)
+        start = size - 2 * _FRAME.size - _FRAME.unpack(tail)[0]
+        if start < 0:
+            return False
+        os.lseek(fd, start, os.SEEK_SET)
+        return os.read(fd, _FRAME.size) == tail
@@ -0,0 +1,251 @@
+"""
+OpAuth Audit Rollups
+Pre-aggregated event counts for dashboards and monitoring.
+Counts are kept per (service, event, actor) in minute, hour and day
+buckets, so queries never rescan the raw audit log.
+"""
+
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from ..storage.fileio import FileLock, SharedCounter, atomic_write
+
+# Bucket keys are prefixes of the entry's ISO timestamp
+GRANULARITIES = {
+    "minute": 16,  # 2026-01-05T14:32
+    "hour": 13,    # 2026-01-05T14
+    "day": 10,     # 2026-01-05
+}
+
+# How long each granularity is kept (None = forever)
+RETENTION = {
+    "minute": timedelta(days=2),
+    "hour": timedelta(days=90),
+    "day": None,
+}
+
+COMPACT_EVERY = 1000  # journal lines folded into the snapshot at a time
+
+
+class AuditRollups:
+    """
+    Incremental rollups stored next to the audit log.
+
+    Each committed batch appends one line of minute-level deltas to a
+    journal. Once the journal holds COMPACT_EVERY lines it is folded
+    into the snapshot. The snapshot's generation number tells which
+    journals are already folded in, so a crash mid-fold never counts
+    an event twice. Folds hold the rollup lock exclusively and reads
+    hold it shared, so a read never sees a journal half folded.
+    """
+
+    def __init__(self, snapshot_path: Path):
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path.with_suffix(".journal")
+        self.lock_path = snapshot_path.with_suffix(".lock")
+        self._fold_lock = FileLock(self.lock_path)
+        self._folds = None  # SharedCounter bumped by every fold, in any process
+        self._folds_seen = None  # Its value when the journal was last opened
+        self._journal = None  # Open journal descriptor
+        self._journal_lines = None
+
+    def _empty(self, generation: int = 0) -> dict:
+        data = {"generation": generation}
+        for granularity in GRANULARITIES:
+            data[granularity] = {}
+        return data
+
+    def _load_snapshot(self) -> dict:
+        if not self.snapshot_path.exists():
+            return self._empty()
+        with open(self.snapshot_path, 'r') as f:
+            return json.load(f)
+
+    def _folding_path(self, generation: int) -> Path:
+        return self.journal_path.with_name(f"{self.journal_path.name}.{generation}")
+
+    def _apply(self, data: dict, rows):
+        for minute, service, event, actor, count in rows:
+            for granularity, width in GRANULARITIES.items():
+                bucket = data[granularity].setdefault(minute[:width], {})
+                by_event = bucket.setdefault(service, {}).setdefault(event, {})
+                by_event[actor] = by_event.get(actor, 0) + count
+
+    def _apply_journal(self, data: dict, path: Path):
+        if not path.exists():
+            return
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Batch still being written
+                try:
+                    self._apply(data, json.loads(line))
+                except ValueError:
+                    continue
+
+    def _load(self) -> dict:
+        """
+        Snapshot plus every journal not yet folded into it.
+        """
+        with FileLock(self.lock_path, shared=True):
+            data = self._load_snapshot()
+            leftover = self._folding_path(data["generation"])
+            self._apply_journal(data, leftover)
+            self._apply_journal(data, self.journal_path)
+        return data
+
+    def _prune(self, data: dict):
+        newest = max(data["minute"], default=None)
+        if newest is None:
+            return
+        now = datetime.fromisoformat(newest)
+        for granularity, keep in RETENTION.items():
+            if keep is None:
+                continue
+            cutoff = (now - keep).isoformat()[:GRANULARITIES[granularity]]
+            for bucket in [b for b in data[granularity] if b < cutoff]:
+                del data[granularity][bucket]
+
+    def record(self, entries: list):
+        """
+        Count a committed batch of entries.
+        Caller must hold the audit log's write lock.
+        """
+        counts = Counter(
+            (entry["timestamp"][:GRANULARITIES["minute"]], str(entry.get("service")),
+             str(entry.get("event")), str(entry.get("actor")))
+            for entry in entries
+        )
+        line = json.dumps([[*key, count] for key, count in counts.items()])
+        os.write(self._journal_fd(), (line + "\n").encode())
+        if os.name == "nt":
+            self._close_journal()  # An open file cannot be renamed by a fold there
+
+        if self._journal_lines is None:
+            self._journal_lines = self._count_journal_lines()
+        self._journal_lines += 1
+        if self._journal_lines >= COMPACT_EVERY:
+            self.compact()
+
+    def _fold_counter(self) -> SharedCounter:
+        if self._folds is None:
+            self._folds = SharedCounter(self.snapshot_path.with_suffix(".folds"))
+        return self._folds
+
+    def _journal_fd(self) -> int:
+        """
+        Append descriptor for the journal, kept open between batches.
+        Reopened once a fold, here or in another process, renamed the
+        journal away.
+        """
+        folds = self._fold_counter().value()
+        if folds != self._folds_seen:
+            self._close_journal()
+            self._journal_lines = None  # Another process may have folded
+            self._folds_seen = folds
+        if self._journal is None:
+            flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+            self._journal = os.open(self.journal_path, flags, 0o600)
+        return self._journal
+
+    def _close_journal(self):
+        fd, self._journal = self._journal, None
+        if fd is not None:
+            os.close(fd)
+
+    def close(self):
+        """
+        Close the journal.
+        Caller must hold the audit log's write lock.
+        """
+        self._close_journal()
+
+    def _count_journal_lines(self) -> int:
+        if not self.journal_path.exists():
+            return 0
+        with open(self.journal_path, 'rb') as f:
+            return sum(1 for _ in f)
+
+    def compact(self):
+        """
+        Fold the journal into the snapshot and prune expired buckets.
+        Caller must hold the audit log's write lock.
+        """
+        self._close_journal()
+        with self._fold_lock:
+            data = self._load_snapshot()
+            generation = data["generation"]
+            folding = self._folding_path(generation)
+            if self.journal_path.exists() and not folding.exists():
+                os.replace(self.journal_path, folding)
+            self._apply_journal(data, folding)
+            self._prune(data)
+            data["generation"] = generation + 1
+            atomic_write(self.snapshot_path, json.dumps(data).encode())
+            folding.unlink(missing_ok=True)
+            self._folding_path(generation - 1).unlink(missing_ok=True)
+            self._folds_seen = self._fold_counter().bump()
+        self._journal_lines = self._count_journal_lines()
+
+    def rebuild(self, entries):
+        """
+        Recreate the rollups from raw entries.
+        Caller must hold the audit log's write lock.
+        """
+        self._close_journal()
+        data = self._empty(self._load_snapshot()["generation"] + 1)
+        batch = Counter()
+        for entry in entries:
+            batch[(entry["timestamp"][:GRANULARITIES["minute"]], str(entry.get("service")),
+                   str(entry.get("event")), str(entry.get("actor")))] += 1
+            if len(batch) >= 10000:
+                self._apply(data, ([*key, count] for key, count in batch.items()))
+                batch.clear()
+        self._apply(data, ([*key, count] for key, count in batch.items()))
+        self._prune(data)
+        with self._fold_lock:
+            atomic_write(self.snapshot_path, json.dumps(data).encode())
+            for path in self.journal_path.parent.glob(self.journal_path.name + "*"):
+                path.unlink()
+            self._folds_seen = self._fold_counter().bump()
+        self._journal_lines = 0
+
+    def query(self, granularity: str = "hour", since=None, until=None,
+              service: str = None, event=None, actor: str = None) -> list:
+        """
+        Counts per bucket, oldest first.
+        Each row is {"bucket", "service", "event", "actor", "count"}.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        width = GRANULARITIES[granularity]
+        if isinstance(since, datetime):
+            since = since.isoformat()
+        if isinstance(until, datetime):
+            until = until.isoformat()
+        events = None
+        if event is not None:
+            events = (event,) if isinstance(event, str) else tuple(event)
+
+        rows = []
+        buckets = self._load()[granularity]
+        for bucket in sorted(buckets):
+            if since is not None and bucket < since[:width]:
+                continue
+            if until is not None and bucket > until[:width]:
+                continue
+            for svc, by_event in buckets[bucket].items():
+                if service is not None and svc != service:
+                    continue
+                for evt, by_actor in by_event.items():
+                    if events is not None and evt not in events:
+                        continue
+                    for act, count in by_actor.items():
+                        if actor is not None and act != actor:
+                            continue
+                        rows.append({"bucket": bucket, "service": svc, "event": evt,
+                                     "actor": act, "count": count})
+        return rows
@@ -0,0 +1,284 @@
+"""
+OpAuth SQLite Audit Log
+The audit log for the SQLite storage backend. Entries keep the same
+shape and hash chain as the file log; time, service and event are
+indexed columns, so queries never scan the whole history. Rollup
+counts are updated in the transaction that writes the entries.
+"""
+
+import hashlib
+import hmac
+import json
+from collections import Counter
+from datetime import datetime
+
+from .audit import (AUDIT_KEY_PATH, CHECKPOINT_EVERY, GENESIS_HASH, AuditWriter,
+                    BaseAuditLog, _sign_checkpoint, _stamp)
+from .audit_codec import _timestamp_us
+from .audit_rollups import GRANULARITIES, RETENTION
+
+_FETCH = 1000  # rows fetched per round trip when streaming
+
+
+class SQLiteAuditLog(BaseAuditLog):
+    """
+    Immutable audit log stored in the SQLite backend.
+    AI cannot delete or modify entries.
+
+    Each row keeps the entry's exact JSON, which the chain hash covers.
+    A signed checkpoint in the meta table lets verify() re-hash only
+    the rows written since. Rollups live in the audit_rollups table,
+    keyed like the file rollups, and expire with the same RETENTION.
+    """
+
+    def __init__(self, backend, buffered: bool = False, flush_every: int = 100,
+                 flush_interval_ms: int = 50, checkpoint_every: int = CHECKPOINT_EVERY):
+        self.backend = backend
+        self.location = f"{backend.path} (audit table)"
+        self.key_path = AUDIT_KEY_PATH
+        self.checkpoint_every = checkpoint_every
+        self._writer = None
+        if buffered:
+            self._writer = AuditWriter(self._write_entries, flush_every, flush_interval_ms)
+        db = self.backend.connection()
+        if db.execute("SELECT 1 FROM meta WHERE key = 'audit_rollups'").fetchone() is None:
+            self.rebuild_rollups()  # Database from before the rollup table
+
+    def _write_entries(self, entries: list):
+        """
+        Chain entries onto the log in one transaction.
+        """
+        with self.backend.transaction() as db:
+            _stamp(entries)
+            row = db.execute("SELECT hash FROM audit ORDER BY id DESC LIMIT 1").fetchone()
+            prev = row[0] if row else GENESIS_HASH
+            rows = []
+            for entry in entries:
+                entry["prev"] = prev
+                body = json.dumps(entry)
+                prev = hashlib.sha256(body.encode()).hexdigest()
+                rows.append((_timestamp_us(entry["timestamp"]), entry.get("event"),
+                             entry.get("service"), entry.get("actor"), body, prev))
+            db.executemany(
+                "INSERT INTO audit (ts, event, service, actor, entry, hash) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._record_rollups(db, entries)
+            if self._checkpoint_if_due(db):
+                self._prune_rollups(db)
+
+    # Hash chain
+
+    def _last_checkpoint(self, db):
+        row = db.execute("SELECT value FROM meta WHERE key = 'audit_checkpoint'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _checkpoint_if_due(self, db):
+        last = self._last_checkpoint(db)
+        after = last["id"] if last else 0
+        newest = db.execute("SELECT id, hash FROM audit ORDER BY id DESC LIMIT 1").fetchone()
+        if newest is None or newest[0] - after < self.checkpoint_every:
+            return
+        checkpoint = {
+            "timestamp": datetime.now().isoformat(),
+            "id": newest[0],
+            "hash": newest[1],
+        }
+        checkpoint["sig"] = _sign_checkpoint(self.key_path, checkpoint)
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('audit_checkpoint', ?)",
+                   (json.dumps(checkpoint),))
+        return True
+
+    def verify(self, full: bool = False) -> dict:
+        """
+        Check the audit log for tampering.
+        By default only rows written since the last signed checkpoint
+        are re-hashed; full=True re-hashes every row.
+        """
+        self.flush()
+        db = self.backend.connection()
+        result = {"valid": False, "verified": 0, "unchained": 0, "torn": 0,
+                  "checkpoint": None, "error": None}
+        prev = GENESIS_HASH
+        after = 0
+
+        checkpoint = None if full else self._last_checkpoint(db)
+        if checkpoint is not None:
+            sig = checkpoint.pop("sig", "")
+            if not hmac.compare_digest(sig, _sign_checkpoint(self.key_path, checkpoint)):
+                result["error"] = "Checkpoint signature invalid"
+                return result
+            row = db.execute("SELECT entry FROM audit WHERE id = ?", (checkpoint["id"],)).fetchone()
+            if row is None:
+                result["error"] = "Log truncated before last checkpoint"
+                return result
+            if hashlib.sha256(row[0].encode()).hexdigest() != checkpoint["hash"]:
+                result["error"] = "Entry at last checkpoint was modified"
+                return result
+            prev = checkpoint["hash"]
+            after = checkpoint["id"]
+            result["checkpoint"] = checkpoint["timestamp"]
+
+        rows = db.execute("SELECT entry, hash FROM audit WHERE id > ? ORDER BY id", (after,))
+        while True:
+            batch = rows.fetchmany(_FETCH)
+            if not batch:
+                break
+            for body, stored in batch:
+                entry = json.loads(body)
+                if "prev" not in entry and result["verified"] == result["unchained"]:
+                    result["unchained"] += 1  # Imported from before entries were chained
+                elif entry.get("prev") != prev:
+                    result["error"] = (f"Chain broken at entry {entry.get('timestamp')} "
+                                       f"after {result['verified']} verified")
+                    return result
+                prev = hashlib.sha256(body.encode()).hexdigest()
+                if prev != stored:
+                    result["error"] = f"Entry {entry.get('timestamp')} does not match its hash"
+                    return result
+                result["verified"] += 1
+
+        result["valid"] = True
+        return result
+
+    # Queries
+
+    def _where(self, service, event, since, until):
+        clauses, params = [], []
+        if service is not None:
+            clauses.append("service = ?")
+            params.append(service)
+        if event is not None:
+            events = (event,) if isinstance(event, str) else tuple(event)
+            clauses.append(f"event IN ({', '.join('?' * len(events))})")
+            params.extend(events)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(_timestamp_us(since))
+        if until is not None:
+            clauses.append("ts <= ?")
+            params.append(_timestamp_us(until))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def iter_entries(self, since=None, until=None, service: str = None, event=None):
+        """
+        Stream matching entries oldest first.
+        since/until accept ISO strings or datetimes; event may be a tuple.
+        """
+        self.flush()
+        where, params = self._where(service, event, since, until)
+        rows = self.backend.connection().execute(
+            f"SELECT entry FROM audit{where} ORDER BY id", params
+        )
+        while True:
+            batch = rows.fetchmany(_FETCH)
+            if not batch:
+                return
+            for (body,) in batch:
+                yield json.loads(body)
+
+    def get_logs(self, limit: int = 100, service: str = None, event=None,
+                 since=None, until=None) -> list:
+        """
+        Read log entries, oldest first: the newest limit matches, or
+        every match with limit=None.
+        """
+        if limit is None:
+            return list(self.iter_entries(since, until, service, event))
+        self.flush()
+        where, params = self._where(service, event, since, until)
+        rows = self.backend.connection().execute(
+            f"SELECT entry FROM audit{where} ORDER BY id DESC LIMIT ?", params + [limit]
+        ).fetchall()
+        return [json.loads(body) for (body,) in reversed(rows)]
+
+    # Rollups
+
+    def _record_rollups(self, db, entries):
+        counts = Counter(
+            (entry["timestamp"], str(entry.get("service")),
+             str(entry.get("event")), str(entry.get("actor")))
+            for entry in entries
+        )
+        db.executemany(
+            "INSERT INTO audit_rollups VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT DO UPDATE SET count = count + excluded.count",
+            [(granularity, timestamp[:width], service, event, actor, count)
+             for (timestamp, service, event, actor), count in counts.items()
+             for granularity, width in GRANULARITIES.items()],
+        )
+
+    def _prune_rollups(self, db):
+        row = db.execute(
+            "SELECT max(bucket) FROM audit_rollups WHERE granularity = 'minute'"
+        ).fetchone()
+        if row[0] is None:
+            return
+        newest = datetime.fromisoformat(row[0])
+        for granularity, keep in RETENTION.items():
+            if keep is None:
+                continue
+            cutoff = (newest - keep).isoformat()[:GRANULARITIES[granularity]]
+            db.execute("DELETE FROM audit_rollups WHERE granularity = ? AND bucket < ?",
+                       (granularity, cutoff))
+
+    def get_rollups(self, granularity: str = "hour", since=None, until=None,
+                    service: str = None, event=None, actor: str = None) -> list:
+        """
+        Event counts per minute, hour or day bucket.
+        Reads only the audit_rollups table, never the raw rows.
+        Same rows as AuditLog.get_rollups.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        self.flush()
+        width = GRANULARITIES[granularity]
+        clauses, params = ["granularity = ?"], [granularity]
+        # Whole buckets, like the file rollups
+        if since is not None:
+            since = since.isoformat() if isinstance(since, datetime) else since
+            clauses.append("bucket >= ?")
+            params.append(since[:width])
+        if until is not None:
+            until = until.isoformat() if isinstance(until, datetime) else until
+            clauses.append("bucket <= ?")
+            params.append(until[:width])
+        if service is not None:
+            clauses.append("service = ?")
+            params.append(service)
+        if event is not None:
+            events = (event,) if isinstance(event, str) else tuple(event)
+            clauses.append(f"event IN ({', '.join('?' * len(events))})")
+            params.extend(events)
+        if actor is not None:
+            clauses.append("actor = ?")
+            params.append(actor)
+        rows = self.backend.connection().execute(
+            "SELECT bucket, service, event, actor, count FROM audit_rollups "
+            f"WHERE {' AND '.join(clauses)} ORDER BY bucket",
+            params,
+        )
+        return [
+            {"bucket": bucket, "service": svc, "event": evt, "actor": act, "count": count}
+            for bucket, svc, evt, act, count in rows
+        ]
+
+    def rebuild_rollups(self):
+        """
+        Recreate the rollup table from every audit row.
+        Writers wait until the rebuild is done.
+        """
+        self.flush()
+        with self.backend.transaction() as db:
+            db.execute("DELETE FROM audit_rollups")
+            rows = db.execute("SELECT entry FROM audit ORDER BY id")
+            while True:
+                batch = rows.fetchmany(_FETCH)
+                if not batch:
+                    break
+                self._record_rollups(db, [json.loads(body) for (body,) in batch])
+            self._prune_rollups(db)
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('audit_rollups', '1')")
+
+    def convert_encoding(self, encoding: str):
+        raise ValueError("Audit encodings apply to the file backend only")
@@ -4,9 +4,11 @@ Human must explicitly consent to each service connection.
 AI cannot bypass consent.
 """
 
-from .scope_registry import ScopeRegistry
+from .scope_registry import get_registry
 from .audit import get_audit
 
+DECISIONS = ("grant", "deny", "revoke")
+
 class ConsentFlow:
     """
     Manages consent prompts and grants.
@@ -14,7 +16,7 @@ class ConsentFlow:
     """
 
     def __init__(self):
-        self.registry = ScopeRegistry()
+        self.registry = get_registry()
         self.audit = get_audit()
 
     def request_consent(self, service: str, requested_scope: list, reason: str = "") -> dict:
@@ -59,6 +61,53 @@ class ConsentFlow:
         self.audit.log_scope_revoke(service, revoked_by)
         return True
 
+    def apply_decisions(self, decisions: list, decided_by: str = "human") -> dict:
+        """
+        Apply many grant, deny and revoke decisions at once. HUMAN ONLY.
+        Each decision is {"action": "grant"|"deny"|"revoke",
+        "service": ..., "scope": [...]}; scope is needed for grant and
+        deny. Everything is validated first, including FORBIDDEN_SCOPES.
+        Then the registry changes go out in one write and the audit
+        entries in one batch. Either every decision applies or none do.
+        """
+        if decided_by != "human":
+            raise PermissionError("HS-OPAUTH-001: Only human can grant consent")
+
+        changes, events = [], []
+        applied = {"granted": [], "denied": [], "revoked": []}
+        for decision in decisions:
+            action = decision.get("action")
+            service = decision.get("service")
+            scope = decision.get("scope")
+            if action not in DECISIONS:
+                raise ValueError(f"Unknown consent decision: {action!r}")
+            if not isinstance(service, str) or not service:
+                raise ValueError(f"{action} decision needs a service name")
+            if action != "revoke" and (not scope or isinstance(scope, str)
+                                       or not all(isinstance(s, str) for s in scope)):
+                raise ValueError(f"{action} decision for {service} needs a list of scopes")
+
+            if action == "grant":
+                for s in scope:
+                    if s in FORBIDDEN_SCOPES:
+                        raise PermissionError(FORBIDDEN_SCOPES[s])
+                changes.append(("grant", service, list(scope)))
+                events.append(("CONSENT_GRANTED", service, {"scope": list(scope)}, decided_by))
+                applied["granted"].append(service)
+            elif action == "deny":
+                events.append(("CONSENT_DENIED", service, {"scope": list(scope)}, decided_by))
+                applied["denied"].append(service)
+            else:
+                changes.append(("revoke", service))
+                events.append(("SCOPE_REVOKE", service, {}, decided_by))
+                applied["revoked"].append(service)
+
+        # Buffered entries go out now: the writer thread could not commit
+        # while the registry write below holds the backend
+        self.audit.flush()
+        self.registry.apply(changes, then=lambda: self.audit.log_many(events), actor=decided_by)
+        return applied
+
     def check_consent(self, service: str, required_scope: str) -> bool:
         """
         Check if consent exists for a scope.
@@ -66,6 +115,12 @@ class ConsentFlow:
         """
         return self.registry.check(service, required_scope)
 
+    def check_any_consent(self, service: str, scopes) -> bool:
+        """
+        Check if consent exists for any one of several scopes.
+        """
+        return self.registry.check_any(service, scopes)
+
     def list_consents(self) -> dict:
         """
         List all granted consents.
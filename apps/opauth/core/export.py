@@ -0,0 +1,182 @@
+"""
+OpAuth Export
+Right to Export: all OpAuth data in readable format, any time.
+Everything is streamed record by record, so memory use stays constant
+no matter how large the audit history is. Token values are never
+exported, only when and by whom each token was stored.
+"""
+
+import io
+import json
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+from .audit import get_audit
+from .scope_registry import get_registry
+
+JOURNALS_PATH = Path.home() / ".opauth" / "journals"
+
+EXPORT_FORMATS = ("zip", "tar", "ndjson")
+PROGRESS_EVERY = 1000  # records between progress callbacks
+_CHUNK = 64 * 1024
+
+
+def _iter_journal_files(journals_path: Path):
+    if not journals_path.exists():
+        return
+    for path in sorted(journals_path.rglob("*")):
+        if path.is_file():
+            yield path
+
+
+class DataExport:
+    """
+    Streaming export of registry, token metadata, audit log and
+    session journals.
+
+    Formats:
+      zip     one NDJSON member per stream, plus journals as files
+      tar     same layout; members are spooled to a temp file first,
+              since tar needs each size up front
+      ndjson  one stream of {"stream": ..., "record": ...} lines
+
+    progress(stream, count) is called every PROGRESS_EVERY records and
+    once when each stream finishes.
+    """
+
+    def __init__(self, token_store=None, audit=None, registry=None,
+                 journals_path: Path = None, progress=None):
+        self.token_store = token_store
+        self.audit = audit or get_audit()
+        self.registry = registry or get_registry()
+        self.journals_path = journals_path or JOURNALS_PATH
+        self.progress = progress
+        self.counts = {}
+
+    def _streams(self):
+        """
+        (name, record generator) pairs, in export order.
+        """
+        yield "registry", self.registry.iter_services()
+        if self.token_store is not None and self.token_store.is_unlocked():
+            yield "tokens", self.token_store.iter_metadata()
+        yield "audit", self.audit.iter_entries()
+
+    def _counted(self, stream: str, records):
+        count = 0
+        for record in records:
+            count += 1
+            if self.progress and count % PROGRESS_EVERY == 0:
+                self.progress(stream, count)
+            yield record
+        self.counts[stream] = count
+        if self.progress:
+            self.progress(stream, count)
+
+    def _summary(self, fmt: str) -> dict:
+        return {
+            "exported_at": datetime.now().isoformat(),
+            "format": fmt,
+            "counts": dict(self.counts),
+            "tokens_included": "tokens" in self.counts,
+            "note": "Token values are never exported.",
+        }
+
+    def _write_ndjson(self, records, f):
+        for record in records:
+            f.write((json.dumps(record) + "\n").encode())
+
+    def write(self, dest, fmt: str = "zip") -> dict:
+        """
+        Write the export to dest (a path, or a binary file object for
+        the ndjson format). Returns the export summary.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        self.counts = {}
+        self.audit.log("DATA_EXPORT", "opauth", {"format": fmt}, "human")
+
+        if fmt == "ndjson":
+            if hasattr(dest, "write"):
+                self._write_stream(dest)
+            else:
+                with open(dest, 'wb') as f:
+                    self._write_stream(f)
+        elif fmt == "zip":
+            self._write_zip(dest)
+        else:
+            self._write_tar(dest)
+        return self._summary(fmt)
+
+    def _write_stream(self, f):
+        for stream, records in self._streams():
+            self._write_ndjson(
+                ({"stream": stream, "record": r} for r in self._counted(stream, records)), f
+            )
+        journal_lines = self._counted("journal_lines", self._iter_journal_lines())
+        self._write_ndjson(({"stream": "journals", "record": r} for r in journal_lines), f)
+        f.write((json.dumps({"stream": "summary", "record": self._summary("ndjson")})
+                 + "\n").encode())
+
+    def _iter_journal_lines(self):
+        for path in _iter_journal_files(self.journals_path):
+            name = path.relative_to(self.journals_path).as_posix()
+            with open(path, 'r', encoding="utf-8", errors="replace") as f:
+                for number, line in enumerate(f, 1):
+                    yield {"file": name, "line": number, "text": line.rstrip("\n")}
+
+    def _write_zip(self, dest):
+        with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as zf:
+            for stream, records in self._streams():
+                with zf.open(f"{stream}.ndjson", "w", force_zip64=True) as f:
+                    self._write_ndjson(self._counted(stream, records), f)
+
+            count = 0
+            for path in _iter_journal_files(self.journals_path):
+                name = "journals/" + path.relative_to(self.journals_path).as_posix()
+                with open(path, 'rb') as src, zf.open(name, "w", force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst, _CHUNK)
+                count += 1
+                if self.progress:
+                    self.progress("journals", count)
+            self.counts["journals"] = count
+
+            zf.writestr("summary.json", json.dumps(self._summary("zip"), indent=2))
+
+    def _write_tar(self, dest):
+        with tarfile.open(dest, "w:gz") as tar:
+            for stream, records in self._streams():
+                with tempfile.TemporaryFile() as spool:
+                    self._write_ndjson(self._counted(stream, records), spool)
+                    info = tarfile.TarInfo(f"{stream}.ndjson")
+                    info.size = spool.tell()
+                    info.mtime = int(datetime.now().timestamp())
+                    spool.seek(0)
+                    tar.addfile(info, spool)
+
+            count = 0
+            for path in _iter_journal_files(self.journals_path):
+                name = "journals/" + path.relative_to(self.journals_path).as_posix()
+                tar.add(path, arcname=name, recursive=False)
+                count += 1
+                if self.progress:
+                    self.progress("journals", count)
+            self.counts["journals"] = count
+
+            data = json.dumps(self._summary("tar"), indent=2).encode()
+            info = tarfile.TarInfo("summary.json")
+            info.size = len(data)
+            info.mtime = int(datetime.now().timestamp())
+            tar.addfile(info, io.BytesIO(data))
+
+
+def export_data(dest, fmt: str = "zip", token_store=None, progress=None) -> dict:
+    """
+    Export all OpAuth data to dest. Pass an unlocked TokenStore to
+    include token metadata.
+    """
+    return DataExport(token_store=token_store, progress=progress).write(dest, fmt)
@@ -0,0 +1,186 @@
+"""
+OpAuth Token Refresh Scheduler
+Refreshes each provider's access token shortly before it expires, on a
+background thread, so requests rarely meet an expired token. The 401
+retry in each provider stays as the fallback.
+"""
+
+import random
+import sys
+import threading
+import time
+
+# Refresh this many seconds before expiry, moved earlier by up to
+# REFRESH_JITTER of it so processes sharing a token don't all fire at once.
+# Short-lived tokens use at most REFRESH_MAX_SHARE of their lifetime as
+# the margin, and no service is refreshed twice within MIN_REFRESH_GAP
+# seconds, whatever the token endpoint hands out.
+REFRESH_MARGIN = 300
+REFRESH_JITTER = 0.2
+REFRESH_MAX_SHARE = 0.5
+MIN_REFRESH_GAP = 30
+
+# Failed refreshes retry after RETRY_INITIAL seconds, doubling up to
+# RETRY_MAX, each wait randomized by +/- half
+RETRY_INITIAL = 5
+RETRY_MAX = 600
+
+# How long to wait before looking again at a token with no known expiry
+# or a locked store
+IDLE_RECHECK = 600
+
+
+class RefreshScheduler:
+    """
+    Background refresher for a set of providers.
+
+        scheduler = RefreshScheduler([google, fitbit])
+        scheduler.start()
+        ...
+        scheduler.stop()
+
+    Each provider's next refresh is worked out from the expires_in and
+    the storage time in its token record; tokens without expires_in are
+    left alone. The thread sleeps until the soonest one is due.
+    """
+
+    def __init__(self, providers=(), margin: float = REFRESH_MARGIN,
+                 jitter: float = REFRESH_JITTER):
+        self.margin = margin
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._providers = {}  # service -> provider
+        self._due = {}        # service -> Unix time of the next attempt
+        self._failures = {}   # service -> consecutive failed refreshes
+        self._thread = None
+        self._stopping = False
+        for provider in providers:
+            self.add(provider)
+
+    def add(self, provider):
+        with self._lock:
+            self._providers[provider.service_name] = provider
+            self._due[provider.service_name] = 0  # Look at it straight away
+            self._failures.pop(provider.service_name, None)
+        self._wake.set()
+
+    def remove(self, service: str):
+        with self._lock:
+            self._providers.pop(service, None)
+            self._due.pop(service, None)
+            self._failures.pop(service, None)
+
+    def schedule(self) -> dict:
+        """
+        {service: Unix time of its next refresh attempt}.
+        """
+        with self._lock:
+            return dict(self._due)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="opauth-token-refresher",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.clear()
+            now = time.time()
+            with self._lock:
+                due = [s for s, at in self._due.items() if at <= now]
+                upcoming = min((at for at in self._due.values() if at > now), default=None)
+            for service in due:
+                if self._stopping:
+                    return
+                try:
+                    self._refresh(service)
+                except Exception as e:
+                    # An unreadable token record or a failed audit write:
+                    # back this service off and keep refreshing the rest
+                    self._back_off(service)
+                    self._report_failure(service, e)
+            if not due:
+                self._wake.wait(IDLE_RECHECK if upcoming is None else upcoming - now)
+
+    def _next_due(self, provider) -> float:
+        """
+        When to refresh provider's current token.
+        """
+        try:
+            lifetime = provider.token_store.token_lifetime(provider.service_name)
+        except PermissionError:
+            lifetime = None  # Store locked; nothing can be refreshed yet
+        if lifetime is None:
+            return time.time() + IDLE_RECHECK
+        stored, expires = lifetime
+        margin = self.margin * (1 + random.uniform(0, self.jitter))
+        return expires - min(margin, (expires - stored) * REFRESH_MAX_SHARE)
+
+    def _refresh(self, service: str):
+        with self._lock:
+            provider = self._providers.get(service)
+        if provider is None:
+            return
+        due = self._next_due(provider)
+        if due > time.time():
+            # Refreshed elsewhere, or not due yet
+            with self._lock:
+                if service in self._due:
+                    self._due[service] = due
+            return
+
+        try:
+            ok = provider.refresh_once()
+            error = None if ok else "refresh rejected"
+        except Exception as e:
+            ok, error = False, str(e)
+        due = self._next_due(provider) if ok else None
+
+        with self._lock:
+            if service not in self._due:
+                return
+            if ok:
+                self._failures.pop(service, None)
+                self._due[service] = max(due, time.time() + MIN_REFRESH_GAP)
+        if not ok:
+            self._back_off(service)
+        details = {"scheduled": True, "ok": ok}
+        if error is not None:
+            details["error"] = error
+        provider.audit.log_token_refresh(service, details)
+
+    def _back_off(self, service: str):
+        with self._lock:
+            if service not in self._due:
+                return
+            failures = self._failures.get(service, 0) + 1
+            self._failures[service] = failures
+            delay = min(RETRY_INITIAL * 2 ** (failures - 1), RETRY_MAX)
+            self._due[service] = time.time() + delay * random.uniform(0.5, 1.5)
+
+    def _report_failure(self, service: str, error: Exception):
+        """
+        Audit a refresh that failed outside refresh_once. If the audit
+        log is what failed, stderr is all that is left.
+        """
+        with self._lock:
+            provider = self._providers.get(service)
+        if provider is None:
+            return
+        try:
+            provider.audit.log_token_refresh(
+                service, {"scheduled": True, "ok": False, "error": str(error)})
+        except Exception as e:
+            print(f"opauth: scheduled refresh of {service} failed: {error} "
+                  f"(and could not be audited: {e})", file=sys.stderr)
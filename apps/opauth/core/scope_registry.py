@@ -4,12 +4,74 @@ Tracks what services are connected and what permissions are granted.
 AI operates within scope. Cannot expand scope.
 """
 
-import json
-import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from pathlib import Path
 
-REGISTRY_PATH = Path.home() / ".opauth" / "scope_registry.json"
+from ..storage.backends import get_backend
+from ..storage.fileio import SharedCounter
+
+# check() results are cached per (service, scope), denials included,
+# until the registry epoch moves. Every grant and revoke in any process
+# bumps the epoch, so a revoke drops all cached decisions at once.
+DECISION_CACHE_SIZE = 4096
+
+# Broader scopes imply narrower ones: granting the key grants the values
+# too. Followed transitively.
+SCOPE_IMPLIES = {
+    "calendar.events": ("calendar.readonly",),
+    "lights.control": ("lights.read",),
+    "thermostat.control": ("thermostat.read",),
+}
+
+# Every scope name gets a bit; a service's grant compiles to an int
+# bitset so a cache miss is a dict lookup plus a bit test.
+_scope_bits = {}
+_grant_masks = {}
+_any_masks = {}
+_intern_lock = threading.Lock()
+
+
+def _scope_bit(scope: str) -> int:
+    bit = _scope_bits.get(scope)
+    if bit is None:
+        with _intern_lock:
+            bit = _scope_bits.setdefault(scope, 1 << len(_scope_bits))
+    return bit
+
+
+def _grant_mask(scopes) -> int:
+    """
+    Bitset of the given scopes plus everything they imply.
+    """
+    key = tuple(scopes)
+    mask = _grant_masks.get(key)
+    if mask is None:
+        mask, pending, seen = 0, list(key), set()
+        while pending:
+            scope = pending.pop()
+            if scope in seen:
+                continue
+            seen.add(scope)
+            mask |= _scope_bit(scope)
+            pending.extend(SCOPE_IMPLIES.get(scope, ()))
+        _grant_masks[key] = mask
+    return mask
+
+
+def _any_mask(scopes) -> int:
+    """
+    Bitset of exactly the given scopes, for check_any().
+    """
+    key = tuple(scopes)
+    mask = _any_masks.get(key)
+    if mask is None:
+        mask = 0
+        for scope in key:
+            mask |= _scope_bit(scope)
+        _any_masks[key] = mask
+    return mask
+
 
 class ScopeRegistry:
     """
@@ -17,23 +79,117 @@ class ScopeRegistry:
     Human grants scope. AI reads scope. AI cannot modify.
     """
 
-    def __init__(self):
-        self.registry_path = REGISTRY_PATH
-        self._ensure_directory()
-        self.scopes = self._load()
+    def __init__(self, backend=None):
+        self.backend = backend or get_backend()
+        self._lock = threading.Lock()
+        self._epoch = SharedCounter(self.backend.epoch_path)
+        self._epoch_now = self._epoch.view  # [0] is the live epoch
+        with self.backend.registry_transaction():
+            self._seen_epoch = self._epoch.value()
+            self._reload()
+
+    def _reload(self):
+        """
+        Caller must hold the backend's registry transaction.
+        """
+        self.scopes, self._cursor = self.backend.registry_load()
+        self._compile()
+        self._decisions = {}
+
+    def _catch_up(self) -> bool:
+        """
+        Apply changes other processes made since the last look.
+        Returns False if a full reload is needed instead.
+        """
+        changes = self.backend.registry_changes(self._cursor)
+        if changes is None:
+            return False
+        applied, self._cursor = changes
+        self._apply_changes(dict(applied))
+        return True
+
+    def _refresh(self):
+        """
+        Pick up grants and revokes made elsewhere once the epoch moves.
+        The backend only reads what changed.
+        """
+        if self._epoch_now[0] == self._seen_epoch:
+            return
+        with self._lock:
+            # Read the epoch first: a change landing during the catch-up
+            # moves it again and is picked up next time
+            self._seen_epoch = self._epoch.value()
+            if not self._catch_up():
+                with self.backend.registry_transaction():
+                    self._reload()
+
+    @contextmanager
+    def _writing(self):
+        """
+        Hold both locks with the in-memory state current.
+        """
+        with self._lock:
+            try:
+                with self.backend.registry_transaction():
+                    self._seen_epoch = self._epoch.value()
+                    if not self._catch_up():
+                        self._reload()
+                    yield
+            except BaseException:
+                # A rolled-back write may already be applied in memory;
+                # have the next read catch up from the backend
+                self._seen_epoch = -1
+                raise
+
+    def _compile(self, service: str = None):
+        """
+        Rebuild the bitset index for one service, or for all of them.
+        Inactive services are left out.
+        """
+        if service is None:
+            self._index = {
+                name: _grant_mask(svc.get("scope", []))
+                for name, svc in self.scopes["services"].items()
+                if svc.get("active", False)
+            }
+            return
+        svc = self.scopes["services"].get(service)
+        if svc and svc.get("active", False):
+            self._index[service] = _grant_mask(svc.get("scope", []))
+        else:
+            self._index.pop(service, None)
+
+    def _apply_changes(self, changes: dict):
+        for service, entry in changes.items():
+            if entry is None:
+                self.scopes["services"].pop(service, None)
+            else:
+                self.scopes["services"][service] = entry
+            self._compile(service)
+        if changes:
+            # Replaced only once the index is current: a check() that
+            # computed from the old index will not store into this dict
+            self._decisions = {}
 
-    def _ensure_directory(self):
-        self.registry_path.parent.mkdir(parents=True, exist_ok=True)
+    def _commit(self, changes: dict):
+        """
+        Store {service: entry} changes in one write and apply them.
+        Caller must be inside _writing().
+        """
+        self._cursor = self.backend.registry_put(changes, self._cursor)
+        self._apply_changes(changes)
+        # Readers elsewhere must not see the epoch move before they can
+        # see the change itself
+        self.backend.after_commit(self._bump_epoch)
 
-    def _load(self) -> dict:
-        if self.registry_path.exists():
-            with open(self.registry_path, 'r') as f:
-                return json.load(f)
-        return {"services": {}, "created": datetime.now().isoformat()}
+    def _bump_epoch(self):
+        self._seen_epoch = self._epoch.bump()
 
-    def _save(self):
-        with open(self.registry_path, 'w') as f:
-            json.dump(self.scopes, f, indent=2)
+    def compact(self):
+        """
+        Fold the backend's change log into its snapshot, if it has one.
+        """
+        self.backend.registry_compact()
 
     def grant(self, service: str, scope: list, granted_by: str = "human"):
         """
@@ -43,57 +199,141 @@ class ScopeRegistry:
         if granted_by != "human":
             raise PermissionError("HS-OPAUTH-001: Only human can grant scope")
 
-        self.scopes["services"][service] = {
-            "scope": scope,
-            "granted_at": datetime.now().isoformat(),
-            "granted_by": granted_by,
-            "active": True
-        }
-        self._save()
+        with self._writing():
+            self._commit({service: {
+                "scope": scope,
+                "granted_at": datetime.now().isoformat(),
+                "granted_by": granted_by,
+                "active": True
+            }})
         return True
 
     def revoke(self, service: str, revoked_by: str = "human"):
         """
         Revoke all scope for a service.
         """
-        if service in self.scopes["services"]:
-            self.scopes["services"][service]["active"] = False
-            self.scopes["services"][service]["revoked_at"] = datetime.now().isoformat()
-            self.scopes["services"][service]["revoked_by"] = revoked_by
-            self._save()
-            return True
+        with self._writing():
+            if service in self.scopes["services"]:
+                self._commit({service: {
+                    **self.scopes["services"][service],
+                    "active": False,
+                    "revoked_at": datetime.now().isoformat(),
+                    "revoked_by": revoked_by,
+                }})
+                return True
         return False
 
+    def apply(self, changes: list, then=None, actor: str = "human"):
+        """
+        Grant and revoke several services with one write. HUMAN ONLY.
+        changes holds ("grant", service, scope) and ("revoke", service)
+        tuples, applied in order. then() runs after the write, still
+        under the registry lock; if it raises, the changes are undone
+        and the error re-raised.
+        """
+        if actor != "human":
+            raise PermissionError("HS-OPAUTH-001: Only human can grant scope")
+
+        with self._writing():
+            now = datetime.now().isoformat()
+            staged = {}
+            for change in changes:
+                action, service = change[0], change[1]
+                if action == "grant":
+                    staged[service] = {
+                        "scope": list(change[2]),
+                        "granted_at": now,
+                        "granted_by": actor,
+                        "active": True
+                    }
+                elif action == "revoke":
+                    current = staged.get(service, self.scopes["services"].get(service))
+                    if current is None:
+                        raise ValueError(f"No scope granted to {service}; nothing to revoke")
+                    staged[service] = {**current, "active": False,
+                                       "revoked_at": now, "revoked_by": actor}
+                else:
+                    raise ValueError(f"Unknown registry change: {action}")
+
+            previous = {service: self.scopes["services"].get(service) for service in staged}
+            if staged:
+                self._commit(staged)
+            if then is not None:
+                try:
+                    then()
+                except BaseException:
+                    if staged:
+                        self._commit(previous)
+                    raise
+
     def check(self, service: str, required_scope: str) -> bool:
         """
         Check if a scope is granted. AI can call this.
         """
-        if service not in self.scopes["services"]:
-            return False
+        if self._epoch_now[0] != self._seen_epoch:
+            self._refresh()
+        decisions = self._decisions
+        allowed = decisions.get((service, required_scope))
+        if allowed is None:
+            mask = self._index.get(service, 0)
+            bit = _scope_bits.get(required_scope, 0)
+            allowed = self._remember(decisions, (service, required_scope), bool(mask & bit))
+        return allowed
 
-        svc = self.scopes["services"][service]
-        if not svc.get("active", False):
-            return False
+    def check_any(self, service: str, scopes) -> bool:
+        """
+        Check if any one of several scopes is granted. AI can call this.
+        """
+        if self._epoch_now[0] != self._seen_epoch:
+            self._refresh()
+        key = (service, tuple(scopes))
+        decisions = self._decisions
+        allowed = decisions.get(key)
+        if allowed is None:
+            allowed = self._remember(decisions, key,
+                                     bool(self._index.get(service, 0) & _any_mask(scopes)))
+        return allowed
 
-        return required_scope in svc.get("scope", [])
+    def _remember(self, decisions: dict, key: tuple, allowed: bool) -> bool:
+        """
+        Cache a decision computed while decisions was the current cache.
+        If a change replaced the cache meanwhile, the decision may be
+        stale and is not kept.
+        """
+        if decisions is not self._decisions:
+            return allowed
+        if len(decisions) >= DECISION_CACHE_SIZE:
+            decisions.clear()
+        decisions[key] = allowed
+        return allowed
 
     def list_services(self) -> dict:
         """
         List all services and their scopes.
         """
+        self._refresh()
         return {
             name: {
                 "scope": svc["scope"],
                 "active": svc.get("active", False),
                 "granted_at": svc.get("granted_at")
             }
-            for name, svc in self.scopes["services"].items()
+            for name, svc in list(self.scopes["services"].items())
         }
 
+    def iter_services(self):
+        """
+        Yield each service's full registry record, one at a time.
+        """
+        self._refresh()
+        for name, svc in list(self.scopes["services"].items()):
+            yield {"service": name, **svc}
+
     def get_scope(self, service: str) -> list:
         """
         Get granted scope for a service.
         """
+        self._refresh()
         if service in self.scopes["services"]:
             svc = self.scopes["services"][service]
             if svc.get("active", False):
@@ -101,6 +341,18 @@ class ScopeRegistry:
         return []
 
 
+_registry = None
+
+def get_registry() -> ScopeRegistry:
+    """
+    The registry shared by everything in this process.
+    """
+    global _registry
+    if _registry is None:
+        _registry = ScopeRegistry()
+    return _registry
+
+
 # Hard stops - AI cannot bypass
 HARD_STOPS = {
     "HS-OPAUTH-001": "Only human can grant scope",
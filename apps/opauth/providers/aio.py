@@ -0,0 +1,100 @@
+"""
+OpAuth Async Providers
+asyncio counterparts to the OAuth providers, for fanning many scoped
+API calls out at once.
+
+Each call runs the provider's own method in a worker thread, so consent
+checks, audit logging, single-flight refresh and the pooled session all
+behave exactly as they do for synchronous callers.
+"""
+
+import asyncio
+import functools
+import inspect
+
+# gather() runs at most this many calls at once by default. Keep it at
+# or below the session's per-host pool size (POOL_MAXSIZE) to reuse
+# connections rather than open extra ones.
+GATHER_LIMIT = 8
+
+
+class AsyncProvider:
+    """
+    Async view of an OAuthProvider.
+
+        google = AsyncProvider(GoogleProvider(...))
+        events = await google.list_calendar_events()
+
+    api_call, refresh_token and get_access_token are coroutines here;
+    so is every other method of the wrapped provider, including its
+    convenience methods. Generator methods such as iter_drive_files
+    become async iterators, each item fetched in a worker thread:
+
+        async for item in google.iter_drive_files():
+            ...
+
+    Plain attributes pass through unchanged.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.service_name = provider.service_name
+
+    async def api_call(self, endpoint: str, required_scope, **kwargs):
+        """
+        Make an API call with scope checking.
+        """
+        return await asyncio.to_thread(self.provider.api_call, endpoint, required_scope, **kwargs)
+
+    async def refresh_token(self) -> bool:
+        """
+        Refresh the access token; concurrent refreshes share one.
+        """
+        return await asyncio.to_thread(self.provider.refresh_once)
+
+    async def get_access_token(self) -> str:
+        return await asyncio.to_thread(self.provider.get_access_token)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.provider, name)
+        if not callable(attr):
+            return attr
+
+        if inspect.isgeneratorfunction(attr):
+            @functools.wraps(attr)
+            async def iterate(*args, **kwargs):
+                # Each step can page through the API; none may run on the loop
+                iterator = attr(*args, **kwargs)
+                done = object()
+                try:
+                    while True:
+                        item = await asyncio.to_thread(next, iterator, done)
+                        if item is done:
+                            return
+                        yield item
+                finally:
+                    await asyncio.to_thread(iterator.close)
+            return iterate
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+        return call
+
+
+async def gather(*calls, limit: int = GATHER_LIMIT, return_exceptions: bool = False) -> list:
+    """
+    Await calls (coroutines, e.g. from AsyncProvider methods) with at
+    most limit running at once. Results come back in order. With
+    return_exceptions=True a failed call (say, a PermissionError for a
+    scope that was never granted) yields its exception instead of
+    cancelling the rest.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(call):
+        async with semaphore:
+            return await call
+
+    return await asyncio.gather(*(limited(call) for call in calls),
+                                return_exceptions=return_exceptions)
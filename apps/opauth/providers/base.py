@@ -3,22 +3,40 @@ OpAuth Provider Base Class
 All OAuth providers inherit from this.
 """
 
+import threading
 from abc import ABC, abstractmethod
 from ..core.consent import ConsentFlow
 from ..core.audit import get_audit
 from ..storage.token_store import TokenStore
+from .session import ProviderSession
+
+# One refresh at a time per service, across every provider instance in
+# the process. _last_refresh holds (stale access token, outcome) of the
+# latest one, for the callers that queued behind it.
+_refresh_locks = {}
+_refresh_locks_guard = threading.Lock()
+_last_refresh = {}
+
+
+def _refresh_lock(service: str) -> threading.Lock:
+    with _refresh_locks_guard:
+        return _refresh_locks.setdefault(service, threading.Lock())
+
 
 class OAuthProvider(ABC):
     """
     Base class for OAuth providers.
     Enforces consent and audit requirements.
+    All HTTP goes through self.session, a pooled ProviderSession; pass
+    one in to change its pool size, timeouts or retries.
     """
 
-    def __init__(self, service_name: str):
+    def __init__(self, service_name: str, session: ProviderSession = None):
         self.service_name = service_name
         self.consent = ConsentFlow()
         self.audit = get_audit()
-        self.token_store = TokenStore()
+        self.token_store = TokenStore(cache=True)
+        self.session = session or ProviderSession()
 
     @abstractmethod
     def get_auth_url(self, scope: list) -> str:
@@ -40,9 +58,34 @@ class OAuthProvider(ABC):
     def refresh_token(self) -> bool:
         """
         Refresh access token using refresh token.
+        Call refresh_once() instead, which never runs two at once.
         """
         pass
 
+    def refresh_once(self, stale_token: str = None) -> bool:
+        """
+        Single-flight refresh_token(). Callers that find the access
+        token stale_token rejected (a 401) queue behind one refresh and
+        share its outcome: if the token already changed, there is
+        nothing to do; if the refresh they waited on failed for that
+        same token, they fail too rather than spend the refresh token
+        again. Only threads in this process are coordinated.
+        """
+        before = _last_refresh.get(self.service_name)
+        with _refresh_lock(self.service_name):
+            if stale_token is not None:
+                current = self.token_store.get_token(self.service_name) or {}
+                if current.get("access_token") != stale_token:
+                    return True
+                last = _last_refresh.get(self.service_name)
+                if last is not before and last[0] == stale_token:
+                    return last[1]  # Finished while we waited
+            else:
+                stale_token = (self.token_store.get_token(self.service_name) or {}).get("access_token")
+            ok = self.refresh_token()
+            _last_refresh[self.service_name] = (stale_token, ok)
+            return ok
+
     def request_authorization(self, scope: list, reason: str = "") -> dict:
         """
         Request authorization from human.
@@ -95,11 +138,22 @@ class OAuthProvider(ABC):
         """
         return self.consent.check_consent(self.service_name, required_scope)
 
-    def api_call(self, endpoint: str, required_scope: str, **kwargs):
+    def check_any_scope(self, scopes) -> bool:
+        """
+        Check if any one of several scopes is authorized.
+        """
+        return self.consent.check_any_consent(self.service_name, scopes)
+
+    def api_call(self, endpoint: str, required_scope, **kwargs):
         """
         Make an API call with scope checking.
+        required_scope may be a tuple, meaning any one of them will do.
         """
-        if not self.check_scope(required_scope):
+        if isinstance(required_scope, str):
+            authorized = self.check_scope(required_scope)
+        else:
+            authorized = self.check_any_scope(required_scope)
+        if not authorized:
             raise PermissionError(f"HS-OPAUTH-002: Scope '{required_scope}' not authorized")
 
         self.audit.log_api_call(self.service_name, endpoint, actor="ai")
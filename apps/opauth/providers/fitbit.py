@@ -3,10 +3,10 @@ OpAuth Fitbit Provider
 OAuth integration for Fitbit health data.
 """
 
-import requests
 import base64
 from urllib.parse import urlencode
 from .base import OAuthProvider
+from .session import ProviderSession
 
 FITBIT_AUTH_URL = "https://www.fitbit.com/oauth2/authorize"
 FITBIT_TOKEN_URL = "https://api.fitbit.com/oauth2/token"
@@ -27,8 +27,9 @@ class FitbitProvider(OAuthProvider):
     Access activity, heart rate, sleep, weight data.
     """
 
-    def __init__(self, client_id: str = None, client_secret: str = None, redirect_uri: str = None):
-        super().__init__("fitbit")
+    def __init__(self, client_id: str = None, client_secret: str = None, redirect_uri: str = None,
+                 session: ProviderSession = None):
+        super().__init__("fitbit", session)
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri or "http://localhost:8080/callback"
@@ -64,7 +65,7 @@ class FitbitProvider(OAuthProvider):
             "redirect_uri": self.redirect_uri,
         }
 
-        response = requests.post(FITBIT_TOKEN_URL, headers=headers, data=data)
+        response = self.session.post(FITBIT_TOKEN_URL, headers=headers, data=data)
         response.raise_for_status()
         return response.json()
 
@@ -85,7 +86,7 @@ class FitbitProvider(OAuthProvider):
             "grant_type": "refresh_token",
         }
 
-        response = requests.post(FITBIT_TOKEN_URL, headers=headers, data=data)
+        response = self.session.post(FITBIT_TOKEN_URL, headers=headers, data=data)
         if response.ok:
             new_token = response.json()
             self.token_store.store_token(self.service_name, new_token, stored_by="human")
@@ -104,13 +105,13 @@ class FitbitProvider(OAuthProvider):
         headers["Authorization"] = f"Bearer {token}"
 
         url = f"{FITBIT_API_BASE}{endpoint}" if endpoint.startswith("/") else endpoint
-        response = requests.request(method, url, headers=headers, **kwargs)
+        response = self.session.request(method, url, headers=headers, **kwargs)
 
         if response.status_code == 401:
-            if self.refresh_token():
+            if self.refresh_once(token):
                 token = self.get_access_token()
                 headers["Authorization"] = f"Bearer {token}"
-                response = requests.request(method, url, headers=headers, **kwargs)
+                response = self.session.request(method, url, headers=headers, **kwargs)
 
         return response
 
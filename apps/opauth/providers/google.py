@@ -3,9 +3,19 @@ OpAuth Google Provider
 OAuth integration for Google services (Drive, Calendar, Gmail, etc.)
 """
 
-import requests
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from urllib.parse import urlencode
+
+import requests
+
+from ..storage.fileio import atomic_write
 from .base import OAuthProvider
+from .session import ProviderSession
 
 # Google OAuth endpoints
 GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
@@ -25,14 +35,38 @@ GOOGLE_SCOPE_MAP = {
     "fitness.heart_rate.read": "https://www.googleapis.com/auth/fitness.heart_rate.read",
 }
 
+# Either scope allows reading Drive files
+DRIVE_READ_SCOPES = ("drive.readonly", "drive.file")
+
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+DRIVE_FOLDER_TYPE = "application/vnd.google-apps.folder"
+DRIVE_FILE_FIELDS = "id,name,mimeType,modifiedTime"
+DRIVE_MAX_PAGE_SIZE = 1000  # The most Drive returns per page
+
+# Downloads stream in chunks of DRIVE_CHUNK_SIZE. Files saved to a path
+# are fetched as DRIVE_PIECE_SIZE byte ranges into "<name>.part", with
+# the finished ranges recorded in "<name>.part.json" so an interrupted
+# download picks up where it stopped. Files of at least
+# DRIVE_PARALLEL_MIN_SIZE fetch DRIVE_PARALLEL ranges at once.
+DRIVE_CHUNK_SIZE = 1024 * 1024
+DRIVE_PIECE_SIZE = 8 * 1024 * 1024
+DRIVE_PARALLEL = 4
+DRIVE_PARALLEL_MIN_SIZE = 4 * DRIVE_PIECE_SIZE
+DRIVE_RESUME_RETRIES = 5  # Reconnects in a row before a stream gives up
+
+_RESUMABLE_ERRORS = (requests.exceptions.ChunkedEncodingError,
+                     requests.exceptions.ConnectionError,
+                     requests.exceptions.Timeout)
+
 class GoogleProvider(OAuthProvider):
     """
     Google OAuth provider.
     Supports Drive, Calendar, Gmail, Fitness APIs.
     """
 
-    def __init__(self, client_id: str = None, client_secret: str = None, redirect_uri: str = None):
-        super().__init__("google")
+    def __init__(self, client_id: str = None, client_secret: str = None, redirect_uri: str = None,
+                 session: ProviderSession = None):
+        super().__init__("google", session)
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri or "http://localhost:8080/callback"
@@ -68,7 +102,7 @@ class GoogleProvider(OAuthProvider):
             "redirect_uri": self.redirect_uri,
         }
 
-        response = requests.post(GOOGLE_TOKEN_URL, data=data)
+        response = self.session.post(GOOGLE_TOKEN_URL, data=data)
         response.raise_for_status()
         return response.json()
 
@@ -87,7 +121,7 @@ class GoogleProvider(OAuthProvider):
             "grant_type": "refresh_token",
         }
 
-        response = requests.post(GOOGLE_TOKEN_URL, data=data)
+        response = self.session.post(GOOGLE_TOKEN_URL, data=data)
         if response.ok:
             new_token = response.json()
             # Preserve refresh token if not returned
@@ -108,14 +142,14 @@ class GoogleProvider(OAuthProvider):
         headers = kwargs.pop("headers", {})
         headers["Authorization"] = f"Bearer {token}"
 
-        response = requests.request(method, endpoint, headers=headers, **kwargs)
+        response = self.session.request(method, endpoint, headers=headers, **kwargs)
 
         # Auto-refresh on 401
         if response.status_code == 401:
-            if self.refresh_token():
+            if self.refresh_once(token):
                 token = self.get_access_token()
                 headers["Authorization"] = f"Bearer {token}"
-                response = requests.request(method, endpoint, headers=headers, **kwargs)
+                response = self.session.request(method, endpoint, headers=headers, **kwargs)
 
         return response
 
@@ -126,34 +160,248 @@ class GoogleProvider(OAuthProvider):
         List files in Google Drive.
         Requires: drive.readonly or drive.file
         """
-        if not (self.check_scope("drive.readonly") or self.check_scope("drive.file")):
+        if not self.check_any_scope(DRIVE_READ_SCOPES):
             raise PermissionError("HS-OPAUTH-002: Drive read scope not authorized")
 
-        endpoint = "https://www.googleapis.com/drive/v3/files"
+        endpoint = DRIVE_FILES_URL
         params = {
             "q": f"'{folder_id}' in parents",
             "pageSize": page_size,
             "fields": "files(id,name,mimeType,modifiedTime)",
         }
-        return self.api_call(endpoint, "drive.readonly", params=params).json()
+        return self.api_call(endpoint, DRIVE_READ_SCOPES, params=params).json()
+
+    def iter_drive_files(self, folder_id: str = "root", fields: str = DRIVE_FILE_FIELDS,
+                         recursive: bool = False, page_size: int = DRIVE_MAX_PAGE_SIZE,
+                         prefetch: bool = True):
+        """
+        Yield every file in a Drive folder, following nextPageToken.
+        Requires: drive.readonly or drive.file
+
+        fields picks the file properties Drive returns. recursive=True
+        also walks subfolders, depth first; each folder is yielded
+        before its contents. With prefetch, the next page is fetched
+        while the caller works through the current one. At most two
+        pages are held at a time, plus the IDs of folders still to
+        walk. Every page is a scope-checked, audited api_call.
+        """
+        if not self.check_any_scope(DRIVE_READ_SCOPES):
+            raise PermissionError("HS-OPAUTH-002: Drive read scope not authorized")
+        if recursive:
+            # The walk needs these whatever the caller asked for
+            fields = ",".join(dict.fromkeys(["id", "mimeType"] + fields.split(",")))
+
+        def fetch(folder, page_token):
+            params = {
+                "q": f"'{folder}' in parents",
+                "pageSize": page_size,
+                "fields": f"nextPageToken,files({fields})",
+            }
+            if page_token:
+                params["pageToken"] = page_token
+            response = self.api_call(DRIVE_FILES_URL, DRIVE_READ_SCOPES, params=params)
+            response.raise_for_status()
+            return folder, response.json()
+
+        pending_folders = []
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        next_page = None
+        try:
+            page = fetch(folder_id, None)
+            while page is not None:
+                folder, data = page
+                files = data.get("files", [])
+                if recursive:
+                    pending_folders.extend(reversed(
+                        [f["id"] for f in files if f.get("mimeType") == DRIVE_FOLDER_TYPE]
+                    ))
+                request = None
+                if data.get("nextPageToken"):
+                    request = (folder, data["nextPageToken"])
+                elif pending_folders:
+                    request = (pending_folders.pop(), None)
+                if request is not None and executor is not None:
+                    next_page = executor.submit(fetch, *request)
+                page = data = None  # Let the page go once its files are yielded
+                yield from files
+                files = None
+                if next_page is not None:
+                    page, next_page = next_page.result(), None
+                elif request is not None:
+                    page = fetch(*request)
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False)
 
     def read_drive_file(self, file_id: str) -> bytes:
         """
         Read a file from Google Drive.
         Requires: drive.readonly or drive.file
         """
-        if not (self.check_scope("drive.readonly") or self.check_scope("drive.file")):
+        if not self.check_any_scope(DRIVE_READ_SCOPES):
             raise PermissionError("HS-OPAUTH-002: Drive read scope not authorized")
 
-        endpoint = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
-        return self.api_call(endpoint, "drive.readonly").content
+        endpoint = f"{DRIVE_FILES_URL}/{file_id}?alt=media"
+        return self.api_call(endpoint, DRIVE_READ_SCOPES).content
+
+    def iter_drive_file(self, file_id: str, start: int = 0, end: int = None,
+                        chunk_size: int = DRIVE_CHUNK_SIZE):
+        """
+        Yield a Drive file's bytes from start up to end (exclusive; None
+        for the rest of the file) in chunks of at most chunk_size.
+        Requires: drive.readonly or drive.file
+
+        A dropped connection is picked up again with a Range request
+        from the last byte received, up to DRIVE_RESUME_RETRIES times
+        in a row. Every request is a scope-checked, audited api_call.
+        """
+        if not self.check_any_scope(DRIVE_READ_SCOPES):
+            raise PermissionError("HS-OPAUTH-002: Drive read scope not authorized")
+
+        endpoint = f"{DRIVE_FILES_URL}/{file_id}?alt=media"
+        offset, failures = start, 0
+        while end is None or offset < end:
+            headers = {}
+            if offset or end is not None:
+                last = "" if end is None else str(end - 1)
+                headers["Range"] = f"bytes={offset}-{last}"
+            try:
+                response = self.api_call(endpoint, DRIVE_READ_SCOPES, headers=headers, stream=True)
+                with response:
+                    if response.status_code == 416 and end is None:
+                        return  # Nothing past offset
+                    response.raise_for_status()
+                    # A server that ignores Range sends the whole file
+                    skip = offset if response.status_code == 200 else 0
+                    for chunk in response.iter_content(chunk_size):
+                        if skip:
+                            cut = min(skip, len(chunk))
+                            chunk, skip = chunk[cut:], skip - cut
+                        if end is not None:
+                            chunk = chunk[:end - offset]
+                        if not chunk:
+                            continue
+                        offset += len(chunk)
+                        failures = 0
+                        yield chunk
+                        if end is not None and offset >= end:
+                            return
+                return
+            except _RESUMABLE_ERRORS:
+                failures += 1
+                if failures > DRIVE_RESUME_RETRIES:
+                    raise
+                time.sleep(min(0.1 * 2 ** failures, 5))
+
+    def download_drive_file(self, file_id: str, dest, parallel: int = DRIVE_PARALLEL,
+                            chunk_size: int = DRIVE_CHUNK_SIZE, progress=None) -> int:
+        """
+        Download a Drive file to a path or a writable file object.
+        Returns the number of bytes written.
+        Requires: drive.readonly or drive.file
+
+        At most one chunk per stream is held in memory. Saving to a path
+        resumes a download that was interrupted, unless the file changed
+        on Drive since, and large files are fetched as parallel ranges.
+        The file only appears at dest once complete. progress, if
+        given, is called as progress(bytes_done, total_bytes); total is
+        None when Drive does not report a size (Google Docs formats).
+        """
+        if not self.check_any_scope(DRIVE_READ_SCOPES):
+            raise PermissionError("HS-OPAUTH-002: Drive read scope not authorized")
+
+        if hasattr(dest, "write"):
+            return self._stream_drive_file(file_id, dest, chunk_size, progress)
+
+        path = Path(dest)
+        part_path = path.with_name(path.name + ".part")
+        state_path = path.with_name(path.name + ".part.json")
+        response = self.api_call(f"{DRIVE_FILES_URL}/{file_id}", DRIVE_READ_SCOPES,
+                                 params={"fields": "size,md5Checksum,modifiedTime"})
+        response.raise_for_status()
+        meta = response.json()
+        if meta.get("size") is None:
+            with open(part_path, 'wb') as f:
+                written = self._stream_drive_file(file_id, f, chunk_size, progress)
+            os.replace(part_path, path)
+            return written
+
+        size = int(meta["size"])
+        state = {"file_id": file_id, "size": size, "md5Checksum": meta.get("md5Checksum"),
+                 "modifiedTime": meta.get("modifiedTime"), "done": []}
+        if state_path.exists() and part_path.exists():
+            with open(state_path, 'r') as f:
+                saved = json.load(f)
+            if {k: v for k, v in saved.items() if k != "done"} == \
+                    {k: v for k, v in state.items() if k != "done"}:
+                state["done"] = saved["done"]
+        done = set(state["done"])
+        pieces = [(s, min(s + DRIVE_PIECE_SIZE, size))
+                  for s in range(0, size, DRIVE_PIECE_SIZE) if s not in done]
+
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o600)
+        try:
+            if not done:
+                os.ftruncate(fd, 0)
+            os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+
+        lock = threading.Lock()
+        received = [sum(min(s + DRIVE_PIECE_SIZE, size) - s for s in done)]
+        if progress is not None:
+            progress(received[0], size)
+
+        def fetch(piece):
+            start, end = piece
+            with open(part_path, 'r+b') as f:
+                f.seek(start)
+                for chunk in self.iter_drive_file(file_id, start, end, chunk_size):
+                    f.write(chunk)
+                    if progress is not None:
+                        with lock:
+                            received[0] += len(chunk)
+                            progress(received[0], size)
+                f.flush()
+                os.fsync(f.fileno())
+            with lock:
+                state["done"].append(start)
+                atomic_write(state_path, json.dumps(state).encode())
+
+        workers = parallel if size >= DRIVE_PARALLEL_MIN_SIZE else 1
+        if workers > 1 and len(pieces) > 1:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            try:
+                for _ in executor.map(fetch, pieces):
+                    pass
+            finally:
+                # On failure, finish the ranges in flight but start no more
+                executor.shutdown(wait=True, cancel_futures=True)
+        else:
+            for piece in pieces:
+                fetch(piece)
+
+        os.replace(part_path, path)
+        state_path.unlink(missing_ok=True)
+        return size
+
+    def _stream_drive_file(self, file_id: str, out, chunk_size: int, progress) -> int:
+        written = 0
+        for chunk in self.iter_drive_file(file_id, chunk_size=chunk_size):
+            out.write(chunk)
+            written += len(chunk)
+            if progress is not None:
+                progress(written, None)
+        return written
 
     def list_calendar_events(self, calendar_id: str = "primary", max_results: int = 10) -> dict:
         """
         List calendar events.
         Requires: calendar.readonly or calendar.events
         """
-        if not (self.check_scope("calendar.readonly") or self.check_scope("calendar.events")):
+        if not self.check_scope("calendar.readonly"):  # Implied by calendar.events
             raise PermissionError("HS-OPAUTH-002: Calendar read scope not authorized")
 
         endpoint = f"https://www.googleapis.com/calendar/v3/calendars/{calendar_id}/events"
@@ -0,0 +1,89 @@
+"""
+OpAuth Provider HTTP Session
+One pooled keep-alive session per provider, with timeouts, retry with
+exponential backoff for 429 and 5xx responses, and connection reuse
+metrics.
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+POOL_CONNECTIONS = 10  # hosts with a pool kept open
+POOL_MAXSIZE = 10      # connections kept open per host
+CONNECT_TIMEOUT = 5    # seconds
+READ_TIMEOUT = 30      # seconds
+RETRIES = 3
+BACKOFF_FACTOR = 0.5   # 0.5 s, 1 s, 2 s, ... unless Retry-After says otherwise
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ProviderSession(requests.Session):
+    """
+    requests.Session for one provider.
+
+    Connections to each host are kept alive and reused. Requests get
+    the default timeouts unless they pass their own. Idempotent requests
+    answered with a RETRY_STATUSES status, or that fail to connect, are
+    retried with exponential backoff, waiting as long as a Retry-After
+    header asks. POSTs are not retried: a token grant whose response
+    was lost may already have spent a single-use refresh token. After
+    the last retry the final response is returned, not raised.
+    """
+
+    def __init__(self, pool_connections: int = POOL_CONNECTIONS,
+                 pool_maxsize: int = POOL_MAXSIZE,
+                 connect_timeout: float = CONNECT_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT,
+                 retries: int = RETRIES,
+                 backoff_factor: float = BACKOFF_FACTOR):
+        super().__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(pool_connections=pool_connections,
+                                    pool_maxsize=pool_maxsize, max_retries=retry)
+        self.mount("https://", self._adapter)
+        self.mount("http://", self._adapter)
+        self._metrics_lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self.hooks["response"].append(self._count)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+    def _count(self, response, **kwargs):
+        retries = getattr(response.raw, "retries", None)
+        with self._metrics_lock:
+            self._requests += 1
+            self._retries += len(retries.history) if retries is not None else 0
+
+    def metrics(self) -> dict:
+        """
+        Request, retry and connection counts. Connections are counted
+        over the pools still open, so a host whose pool was dropped
+        to make room for others stops counting.
+        """
+        opened = sent = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                sent += pool.num_requests
+        with self._metrics_lock:
+            return {
+                "requests": self._requests,
+                "retries": self._retries,
+                "connections_opened": opened,
+                "connections_reused": max(sent - opened, 0),
+            }
@@ -0,0 +1,208 @@
+"""
+OpAuth Storage Backends
+One interface for where the scope registry, token store and audit log
+keep their data.
+
+file    The original files under ~/.opauth (journal + snapshot registry,
+        tokens.enc, segmented audit log). The default.
+sqlite  One SQLite database in WAL mode: indexed audit queries,
+        transactions and concurrent readers across processes.
+
+The choice is recorded in ~/.opauth/backend. Use migrate() to move
+existing data from one backend to the other.
+"""
+
+import argparse
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from .fileio import atomic_write
+
+OPAUTH_HOME = Path.home() / ".opauth"
+BACKEND_PATH = OPAUTH_HOME / "backend"
+BACKENDS = ("file", "sqlite")
+
+
+class StorageBackend(ABC):
+    """
+    Persistence for the three OpAuth stores.
+
+    Scope registry: services map to their registry entries; a None
+    entry removes the service. A cursor marks how much of the registry
+    a reader has seen, so it can pick up changes made by other
+    processes without reloading everything.
+    registry_load() and registry_put() must be called inside
+    registry_transaction(), which excludes other writers. Writers bump
+    the counter in epoch_path after every change, from after_commit(),
+    so readers know when to look and find the change when they do.
+
+    Token store: one opaque encrypted record per service; encryption
+    stays in TokenStore. Service names are stored in the clear so one
+    record can be found without decrypting the others. Stores written
+    before records keep a single blob until TokenStore upgrades them.
+
+    Audit log: open_audit() returns the backend's audit log class.
+    """
+
+    name = None
+    epoch_path = None
+
+    # Scope registry
+
+    @abstractmethod
+    def registry_transaction(self):
+        """Context manager holding the registry write lock."""
+
+    @abstractmethod
+    def registry_load(self):
+        """(scopes, cursor) for the whole registry."""
+
+    @abstractmethod
+    def registry_changes(self, cursor):
+        """
+        ([(service, entry), ...], cursor) for changes since cursor, or
+        None if the reader must reload.
+        """
+
+    @abstractmethod
+    def registry_put(self, changes: dict, cursor):
+        """
+        Store {service: entry} changes all-or-nothing. Returns the new
+        cursor.
+        """
+
+    @abstractmethod
+    def registry_import(self, scopes: dict):
+        """Replace the whole registry (used by migrate)."""
+
+    def registry_compact(self):
+        """Fold any change log into the registry. Optional."""
+
+    def after_commit(self, fn):
+        """
+        Call fn once the current registry transaction is committed and
+        visible to other processes. Writes that are visible at once can
+        call it straight away.
+        """
+        fn()
+
+    # Token store
+
+    @abstractmethod
+    def read_token(self, service: str):
+        """The service's encrypted record, or None."""
+
+    @abstractmethod
+    def token_services(self) -> list:
+        """Services with a stored record."""
+
+    @abstractmethod
+    def iter_tokens(self):
+        """Yield (service, encrypted record) for every service."""
+
+    @abstractmethod
+    def put_tokens(self, changes: dict):
+        """
+        Store {service: encrypted record} changes; None removes the
+        service.
+        """
+
+    @abstractmethod
+    def import_tokens(self, records: dict):
+        """Replace every record, dropping any legacy blob."""
+
+    @abstractmethod
+    def legacy_tokens(self):
+        """The single encrypted blob of a store not yet upgraded, or None."""
+
+    # Audit log
+
+    @abstractmethod
+    def open_audit(self, **options):
+        """A new audit log instance for this backend."""
+
+    def is_empty(self) -> bool:
+        with self.registry_transaction():
+            scopes, _ = self.registry_load()
+        if scopes["services"] or self.token_services() or self.legacy_tokens() is not None:
+            return False
+        return next(self.open_audit().iter_entries(), None) is None
+
+
+def open_backend(name: str, **options) -> StorageBackend:
+    if name == "file":
+        from .file_backend import FileBackend
+        return FileBackend(**options)
+    if name == "sqlite":
+        from .sqlite_backend import SQLiteBackend
+        return SQLiteBackend(**options)
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+def _stored_name() -> str:
+    if BACKEND_PATH.exists():
+        return BACKEND_PATH.read_text().strip()
+    return "file"
+
+
+_backend = None
+
+def get_backend() -> StorageBackend:
+    """
+    The backend recorded in ~/.opauth/backend, shared by the process.
+    """
+    global _backend
+    if _backend is None:
+        _backend = open_backend(_stored_name())
+    return _backend
+
+
+def migrate(target: str, progress=None) -> dict:
+    """
+    Copy the registry, token blob and audit history from the current
+    backend into target, then make target current. The target must be
+    empty. Audit entries are re-chained onto the target's hash chain.
+    Run it while nothing else is using OpAuth.
+    """
+    global _backend
+    source = get_backend()
+    if target == source.name:
+        raise ValueError(f"Already using the {target} backend")
+    dest = open_backend(target)
+    if not dest.is_empty():
+        raise ValueError(f"The {target} backend already holds data")
+
+    with source.registry_transaction():
+        scopes, _ = source.registry_load()
+    with dest.registry_transaction():
+        dest.registry_import(scopes)
+
+    if source.legacy_tokens() is not None:
+        raise ValueError("Unlock the token store once to upgrade it before migrating")
+    tokens = dict(source.iter_tokens())
+    dest.import_tokens(tokens)
+
+    src_audit = source.open_audit()
+    dst_audit = dest.open_audit()
+    entries = dst_audit.import_entries(src_audit.iter_entries(), progress=progress)
+    dst_audit.log("STORAGE_MIGRATED", "opauth",
+                  {"from": source.name, "to": target, "entries": entries}, "human")
+    dst_audit.close()
+
+    atomic_write(BACKEND_PATH, target.encode(), fsync=True)
+    _backend = dest
+    return {
+        "from": source.name,
+        "to": target,
+        "services": len(scopes["services"]),
+        "tokens": len(tokens),
+        "audit_entries": entries,
+    }
+
+
+if __name__ == "__main__":
+    # python -m opauth.storage.backends sqlite   (from apps/)
+    parser = argparse.ArgumentParser(description="Move OpAuth data to another storage backend.")
+    parser.add_argument("target", choices=BACKENDS)
+    args = parser.parse_args()
+    print(migrate(args.target, progress=lambda n: print(f"  {n} audit entries copied")))
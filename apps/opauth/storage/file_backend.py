@@ -0,0 +1,384 @@
+"""
+OpAuth File Backend
+The original on-disk stores under ~/.opauth.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from .backends import OPAUTH_HOME, StorageBackend
+from .fileio import FileLock, atomic_write, file_stamp, file_state, fsync_dir
+
+REGISTRY_PATH = OPAUTH_HOME / "scope_registry.json"
+TOKEN_STORE_PATH = OPAUTH_HOME / "tokens.enc"
+
+# Grants and revokes append one record to scope_registry.journal instead
+# of rewriting the registry. Each record holds a service's full entry (or
+# a batch of them, on one line so it applies whole or not at all), so
+# replay is an idempotent upsert. Once the journal holds COMPACT_EVERY
+# records it is folded into the snapshot by a background thread.
+COMPACT_EVERY = 500
+
+# tokens.enc is a log of per-service records after a header line:
+#   "<service as JSON>" <Fernet token>\n     or     "<service>" -\n
+# The second form removes the service. Only service names are in the
+# clear; the index maps each to the offset of its ciphertext. The file
+# is rewritten with live records only once it holds COMPACT_TOKENS_EVERY
+# dead ones and more dead than live.
+# Writers hold tokens.lock across processes. Records are appended and
+# synced; compaction writes a new file and renames it into place. A
+# crash leaves at most one torn record at the end, which readers skip
+# and the next writer cuts off.
+TOKEN_MAGIC = b"OPAUTH-TOKENS/1\n"
+COMPACT_TOKENS_EVERY = 64
+TOKEN_TAIL = len(TOKEN_MAGIC)  # indexed bytes re-checked to spot a replaced file
+
+
+class FileBackend(StorageBackend):
+    """
+    Registry as snapshot + journal, tokens as a log of encrypted
+    records, audit as the segmented AuditLog.
+
+    The registry cursor is (snapshot state, journal inode, journal
+    offset): a reader replays new journal records from its offset, and
+    reloads if the snapshot was replaced or the journal rotated.
+    """
+
+    name = "file"
+
+    def __init__(self, fsync: bool = True):
+        self.fsync = fsync
+        self.registry_path = REGISTRY_PATH
+        self.journal_path = self.registry_path.with_suffix(".journal")
+        self.compacting_path = self.registry_path.with_suffix(".journal.compacting")
+        self.epoch_path = self.registry_path.with_suffix(".epoch")
+        self.token_path = TOKEN_STORE_PATH
+        self.registry_path.parent.mkdir(parents=True, exist_ok=True)
+        self._registry_lock = threading.Lock()
+        self._journal_lock = FileLock(self.registry_path.with_suffix(".lock"))
+        self._compact_lock = FileLock(self.registry_path.with_suffix(".compact.lock"))
+        self._compactor = None
+        self._journal_records = 0
+        self._token_lock = threading.RLock()
+        self._token_file_lock = FileLock(self.token_path.with_suffix(".lock"))
+        self._token_index = {}   # service -> (offset, length) of its ciphertext
+        # (inode, mtime_ns, size, bytes indexed, last bytes indexed) of tokens.enc
+        self._token_state = None
+        self._token_dead = 0
+
+    # Scope registry
+
+    @contextmanager
+    def registry_transaction(self):
+        with self._registry_lock, self._journal_lock:
+            yield
+
+    def _load_snapshot(self) -> dict:
+        if self.registry_path.exists():
+            with open(self.registry_path, 'r') as f:
+                return json.load(f)
+        return {"services": {}, "created": datetime.now().isoformat()}
+
+    def _replay(self, scopes: dict, f) -> list:
+        """
+        Apply journal records from f's position to scopes.
+        Returns the (service, entry) pairs applied; f is left after the
+        last complete record.
+        """
+        applied = []
+        offset = f.tell()
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # Record still being written
+            offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            for change in record.get("batch", (record,)):
+                service, entry = change["service"], change["entry"]
+                if entry is None:
+                    scopes["services"].pop(service, None)
+                else:
+                    scopes["services"][service] = entry
+                applied.append((service, entry))
+        f.seek(offset)
+        return applied
+
+    def registry_load(self):
+        """
+        Snapshot, then any journal being compacted, then the journal.
+        """
+        if not self.registry_path.exists():
+            # Pin the creation time; compaction rebuilds from disk
+            atomic_write(self.registry_path, json.dumps(self._load_snapshot(), indent=2).encode())
+        snapshot = file_stamp(self.registry_path)
+        scopes = self._load_snapshot()
+        if self.compacting_path.exists():
+            with open(self.compacting_path, 'rb') as f:
+                self._replay(scopes, f)
+        ino, offset, self._journal_records = None, 0, 0
+        if self.journal_path.exists():
+            with open(self.journal_path, 'rb') as f:
+                self._journal_records = len(self._replay(scopes, f))
+                ino, offset = os.fstat(f.fileno()).st_ino, f.tell()
+        return scopes, (snapshot, ino, offset)
+
+    def registry_changes(self, cursor):
+        snapshot, ino, offset = cursor
+        if file_stamp(self.registry_path) != snapshot:
+            return None
+        journal = file_state(self.journal_path)
+        if journal is None:
+            return ([], cursor) if ino is None else None
+        if journal[0] != ino or journal[1] < offset:
+            return None  # Replaced: the journal only ever grows
+        if journal[1] == offset:
+            return [], cursor
+        scopes = {"services": {}}
+        try:
+            with open(self.journal_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_ino != ino:
+                    return None  # Renamed away since the stat
+                f.seek(offset)
+                applied = self._replay(scopes, f)
+                offset = f.tell()
+        except FileNotFoundError:
+            return None
+        self._journal_records += len(applied)
+        return applied, (snapshot, ino, offset)
+
+    def registry_put(self, changes: dict, cursor):
+        """
+        Journal the changes as one record. O(1) I/O.
+        """
+        records = [{"service": service, "entry": entry} for service, entry in changes.items()]
+        record = records[0] if len(records) == 1 else {"batch": records}
+        with open(self.journal_path, 'ab') as f:
+            f.write((json.dumps(record) + "\n").encode())
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+        self._journal_records += len(records)
+        if self._journal_records >= COMPACT_EVERY:
+            self._compact_in_background()
+        return (cursor[0], st.st_ino, st.st_size)
+
+    def registry_import(self, scopes: dict):
+        atomic_write(self.registry_path, json.dumps(scopes, indent=2).encode(), fsync=self.fsync)
+        self.compacting_path.unlink(missing_ok=True)
+        self.journal_path.unlink(missing_ok=True)
+        self._journal_records = 0
+
+    def _compact_in_background(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(
+            target=self.registry_compact, name="opauth-registry-compactor", daemon=True
+        )
+        self._compactor.start()
+
+    def registry_compact(self):
+        """
+        Fold the journal into an atomically replaced snapshot.
+        Built from the files on disk, so grants made by other processes
+        are kept. Safe to interrupt at any point.
+
+        The new snapshot is built without blocking writers, but replaced
+        under the journal lock together with the compacting journal's
+        removal: a reload in between would read the old snapshot and
+        find no compacting journal, losing its changes.
+        """
+        with self._compact_lock:
+            with self.registry_transaction():
+                if self.journal_path.exists() and not self.compacting_path.exists():
+                    os.replace(self.journal_path, self.compacting_path)
+            scopes = self._load_snapshot()
+            if self.compacting_path.exists():
+                with open(self.compacting_path, 'rb') as f:
+                    self._replay(scopes, f)
+            data = json.dumps(scopes, indent=2).encode()
+            with self.registry_transaction():
+                atomic_write(self.registry_path, data, fsync=self.fsync)
+                self.compacting_path.unlink(missing_ok=True)
+
+    # Token store
+
+    def _index_records(self, f, offset: int):
+        """
+        Add the complete records from offset on to the token index.
+        Returns the offset after the last one.
+        """
+        f.seek(offset)
+        decoder = json.JSONDecoder()
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # Record still being written
+            try:
+                service, end = decoder.raw_decode(line.decode())
+            except ValueError:
+                offset += len(line)
+                continue
+            data = line[end + 1:-1]
+            if service in self._token_index:
+                self._token_dead += 1
+            if data == b"-":
+                self._token_index.pop(service, None)
+                self._token_dead += 1
+            else:
+                self._token_index[service] = (offset + end + 1, len(data))
+            offset += len(line)
+        return offset
+
+    def _refresh_token_index(self, f) -> bool:
+        """
+        Bring the index up to date with the open tokens.enc.
+        False if it holds a legacy single-blob store.
+        """
+        st = os.fstat(f.fileno())
+        state = self._token_state
+        if state is not None and state[:3] == (st.st_ino, st.st_mtime_ns, st.st_size):
+            return True  # Unchanged since it was indexed
+        if state is not None and self._same_token_file(f, st, state):
+            offset = state[3]
+        else:
+            f.seek(0)
+            if f.read(len(TOKEN_MAGIC)) != TOKEN_MAGIC:
+                self._token_index, self._token_state = {}, None
+                return f.tell() == 0  # An empty file is a new store
+            self._token_index, self._token_dead = {}, 0
+            offset = len(TOKEN_MAGIC)
+        offset = self._index_records(f, offset)
+        f.seek(offset - TOKEN_TAIL)
+        self._token_state = (st.st_ino, st.st_mtime_ns, st.st_size, offset, f.read(TOKEN_TAIL))
+        return True
+
+    def _same_token_file(self, f, st, state) -> bool:
+        """
+        Whether tokens.enc only grew since it was indexed. Compaction
+        replaces the file, and the new one may reuse the inode, so the
+        bytes just before the indexed offset must still be there too.
+        """
+        ino, _, _, offset, tail = state
+        if st.st_ino != ino or st.st_size < offset:
+            return False
+        f.seek(offset - TOKEN_TAIL)
+        return f.read(TOKEN_TAIL) == tail
+
+    @contextmanager
+    def _tokens(self):
+        """
+        The open tokens.enc with the index brought up to date, or None.
+        """
+        with self._token_lock:
+            try:
+                f = open(self.token_path, 'rb')
+            except FileNotFoundError:
+                self._token_index, self._token_state = {}, None
+                yield None
+                return
+            with f:
+                yield f if self._refresh_token_index(f) else None
+
+    def read_token(self, service: str):
+        with self._tokens() as f:
+            if f is None or service not in self._token_index:
+                return None
+            offset, length = self._token_index[service]
+            f.seek(offset)
+            return f.read(length)
+
+    def token_services(self) -> list:
+        with self._tokens():
+            return list(self._token_index)
+
+    def iter_tokens(self):
+        for service in self.token_services():
+            data = self.read_token(service)
+            if data is not None:
+                yield service, data
+
+    def put_tokens(self, changes: dict):
+        """
+        Append one record per change. O(1) I/O per service.
+        """
+        records = b"".join(
+            json.dumps(service).encode() + b" " + (b"-" if data is None else data) + b"\n"
+            for service, data in changes.items()
+        )
+        with self._token_lock, self._token_file_lock:
+            if self.legacy_tokens() is not None:
+                raise ValueError("Token store must be upgraded before writing records")
+            created = not self.token_path.exists()
+            with open(self.token_path, 'ab') as out:
+                if out.tell() == 0:
+                    out.write(TOKEN_MAGIC)
+                else:
+                    self._cut_torn_record(out)
+                out.write(records)
+                out.flush()
+                if self.fsync:
+                    os.fsync(out.fileno())
+            if created and self.fsync:
+                fsync_dir(self.token_path.parent)
+            with self._tokens():
+                dead, live = self._token_dead, len(self._token_index)
+            if dead >= COMPACT_TOKENS_EVERY and dead > live:
+                self._write_token_file(dict(self.iter_tokens()))
+
+    def _cut_torn_record(self, out):
+        """
+        Truncate a record left half-written by a crash, so the next one
+        starts on its own line. Caller holds the token file lock.
+        """
+        size = out.tell()
+        with open(self.token_path, 'rb') as f:
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # Records are short; look back for the last complete one
+            end = size
+            while end > len(TOKEN_MAGIC):
+                start = max(len(TOKEN_MAGIC), end - 64 * 1024)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b"\n")
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+        out.truncate(max(end, len(TOKEN_MAGIC)))
+
+    def _write_token_file(self, records: dict):
+        """
+        Replace tokens.enc with just these records. Caller holds the
+        token file lock.
+        """
+        data = TOKEN_MAGIC + b"".join(
+            json.dumps(service).encode() + b" " + blob + b"\n"
+            for service, blob in records.items()
+        )
+        atomic_write(self.token_path, data, fsync=self.fsync)
+
+    def import_tokens(self, records: dict):
+        with self._token_lock, self._token_file_lock:
+            self._write_token_file(records)
+
+    def legacy_tokens(self):
+        try:
+            with open(self.token_path, 'rb') as f:
+                head = f.read(len(TOKEN_MAGIC))
+                if not head or head == TOKEN_MAGIC:
+                    return None
+                return head + f.read()
+        except FileNotFoundError:
+            return None
+
+    # Audit log
+
+    def open_audit(self, **options):
+        from ..core.audit import AuditLog
+        return AuditLog(**options)
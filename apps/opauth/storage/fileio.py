@@ -0,0 +1,166 @@
+"""
+OpAuth File I/O Helpers
+Small primitives shared by the on-disk stores.
+"""
+
+import mmap
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def fsync_dir(path: Path):
+    """
+    Make renames and new files in a directory durable.
+    A no-op where directories cannot be opened (Windows).
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path, data: bytes, fsync: bool = False):
+    """
+    Replace a file's contents atomically.
+    Data goes to a temp file next to the target, which is then renamed
+    over it. Readers see either the old file or the new one, never a
+    partial write. fsync=True also syncs the file and the directory, so
+    the new contents survive a crash.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if fsync:
+            fsync_dir(path.parent)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class FileLock:
+    """
+    Advisory inter-process lock held on a lock file.
+    Serializes writers across processes; combine with a threading.Lock
+    for threads in the same process. A shared lock lets other shared
+    holders in but keeps exclusive ones out; Windows has no shared mode,
+    so there it is exclusive too.
+    """
+
+    def __init__(self, path: Path, shared: bool = False):
+        self.path = Path(path)
+        self.shared = shared
+        self._fd = None
+
+    def acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if msvcrt is not None:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK gives up after ~10s; keep waiting
+            else:
+                fcntl.flock(fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if msvcrt is not None:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SharedCounter:
+    """
+    A 64-bit counter in a small memory-mapped file.
+    Every process that maps the file sees a bump as soon as it happens,
+    and reading it costs no system call. Bumps from different processes
+    are serialized by a lock file, so none is lost.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._thread_lock = threading.Lock()
+        self._file_lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o600)
+        try:
+            if os.fstat(fd).st_size < 8:
+                os.ftruncate(fd, 8)
+            self._map = mmap.mmap(fd, 8)
+        finally:
+            os.close(fd)
+        self.view = memoryview(self._map).cast("Q")  # view[0] is the value
+
+    def value(self) -> int:
+        return self.view[0]
+
+    def bump(self) -> int:
+        with self._thread_lock, self._file_lock:
+            value = (self.view[0] + 1) & 0xFFFFFFFFFFFFFFFF
+            self.view[0] = value
+        return value
+
+
+def file_state(path: Path):
+    """
+    (inode, size) of a file, or None if it does not exist.
+    Used to tell whether another process changed a file.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size)
+
+
+def file_stamp(path: Path):
+    """
+    (inode, mtime_ns, size) of a file, or None if it does not exist.
+    For files that are only ever replaced: unlike file_state, it also
+    tells a replacement apart when the new file reused the old inode
+    and happens to have the same size.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
@@ -0,0 +1,233 @@
+"""
+OpAuth SQLite Backend
+All three stores in one SQLite database, in WAL mode so readers in any
+process never block the writer.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from .backends import OPAUTH_HOME, StorageBackend
+
+SQLITE_PATH = OPAUTH_HOME / "opauth.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS registry (
+    service TEXT PRIMARY KEY,
+    entry TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS registry_seq ON registry (seq);
+CREATE TABLE IF NOT EXISTS tokens (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS token_records (
+    service TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS audit (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    event TEXT,
+    service TEXT,
+    actor TEXT,
+    entry TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS audit_ts ON audit (ts);
+CREATE INDEX IF NOT EXISTS audit_service ON audit (service, ts);
+CREATE INDEX IF NOT EXISTS audit_event ON audit (event, ts);
+CREATE TABLE IF NOT EXISTS audit_rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    service TEXT NOT NULL,
+    event TEXT NOT NULL,
+    actor TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, service, event, actor)
+);
+"""
+
+BUSY_TIMEOUT = 30  # seconds a writer waits for another process's transaction
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Registry rows carry a sequence number bumped on every write; the
+    registry cursor is the highest one a reader has applied. Removed
+    services stay as 'null' rows so readers see the removal.
+    Each service's encrypted token is its own row in token_records; the
+    tokens table only holds a blob from before per-service records.
+    Audit entries are rows with the chain hash and indexed columns for
+    time, service and event, plus per-bucket counts in audit_rollups
+    kept up to date by the same transactions. See core/audit_sqlite.py.
+
+    Each thread gets its own connection. transaction() nests, so the
+    registry and the audit log can share one all-or-nothing write.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self.epoch_path = self.path.with_suffix(".epoch")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists():
+            # Holds the encrypted tokens; keep it private from the start
+            os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600))
+        self._local = threading.local()
+        with self.transaction() as db:
+            if db.execute("SELECT 1 FROM meta WHERE key = 'created'").fetchone() is None:
+                db.execute("INSERT INTO meta VALUES ('created', ?)", (datetime.now().isoformat(),))
+
+    def connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}")
+            db.executescript(_SCHEMA)
+            self._local.db = db
+            self._local.depth = 0
+            self._local.after_commit = []
+        return db
+
+    @contextmanager
+    def transaction(self):
+        """
+        Exclusive write transaction; nested calls join the outer one.
+        """
+        db = self.connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield db
+            finally:
+                self._local.depth -= 1
+            return
+        db.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield db
+        except BaseException:
+            self._local.depth = 0
+            self._local.after_commit = []
+            db.execute("ROLLBACK")
+            raise
+        self._local.depth = 0
+        db.execute("COMMIT")
+        hooks, self._local.after_commit = self._local.after_commit, []
+        for fn in hooks:
+            fn()
+
+    def after_commit(self, fn):
+        """
+        Rows written inside transaction() stay invisible to other
+        processes until the outermost one commits; run fn after that.
+        """
+        self.connection()
+        if self._local.depth:
+            self._local.after_commit.append(fn)
+        else:
+            fn()
+
+    # Scope registry
+
+    def registry_transaction(self):
+        return self.transaction()
+
+    def registry_load(self):
+        db = self.connection()
+        created = db.execute("SELECT value FROM meta WHERE key = 'created'").fetchone()[0]
+        scopes = {"services": {}, "created": created}
+        cursor = 0
+        for service, entry, seq in db.execute("SELECT service, entry, seq FROM registry"):
+            entry = json.loads(entry)
+            if entry is not None:
+                scopes["services"][service] = entry
+            cursor = max(cursor, seq)
+        return scopes, cursor
+
+    def registry_changes(self, cursor):
+        db = self.connection()
+        newest = db.execute("SELECT max(seq) FROM registry").fetchone()[0] or 0
+        if newest == cursor:
+            return [], cursor
+        if newest < cursor:
+            return None  # Registry was replaced
+        rows = db.execute(
+            "SELECT service, entry FROM registry WHERE seq > ? ORDER BY seq", (cursor,)
+        ).fetchall()
+        return [(service, json.loads(entry)) for service, entry in rows], newest
+
+    def registry_put(self, changes: dict, cursor):
+        with self.transaction() as db:
+            seq = db.execute("SELECT max(seq) FROM registry").fetchone()[0] or 0
+            for service, entry in changes.items():
+                seq += 1
+                db.execute("INSERT OR REPLACE INTO registry VALUES (?, ?, ?)",
+                           (service, json.dumps(entry), seq))
+        return seq
+
+    def registry_import(self, scopes: dict):
+        db = self.connection()
+        db.execute("DELETE FROM registry")
+        db.executemany(
+            "INSERT INTO registry VALUES (?, ?, ?)",
+            [(service, json.dumps(entry), seq)
+             for seq, (service, entry) in enumerate(scopes["services"].items(), 1)],
+        )
+        if scopes.get("created"):
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('created', ?)", (scopes["created"],))
+
+    # Token store
+
+    def read_token(self, service: str):
+        row = self.connection().execute(
+            "SELECT data FROM token_records WHERE service = ?", (service,)
+        ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def token_services(self) -> list:
+        return [service for (service,) in
+                self.connection().execute("SELECT service FROM token_records")]
+
+    def iter_tokens(self):
+        for service, data in self.connection().execute("SELECT service, data FROM token_records"):
+            yield service, bytes(data)
+
+    def put_tokens(self, changes: dict):
+        with self.transaction() as db:
+            if self.legacy_tokens() is not None:
+                raise ValueError("Token store must be upgraded before writing records")
+            for service, data in changes.items():
+                if data is None:
+                    db.execute("DELETE FROM token_records WHERE service = ?", (service,))
+                else:
+                    db.execute("INSERT OR REPLACE INTO token_records VALUES (?, ?)", (service, data))
+
+    def import_tokens(self, records: dict):
+        with self.transaction() as db:
+            db.execute("DELETE FROM tokens")
+            db.execute("DELETE FROM token_records")
+            db.executemany("INSERT INTO token_records VALUES (?, ?)", records.items())
+
+    def legacy_tokens(self):
+        row = self.connection().execute("SELECT data FROM tokens WHERE id = 1").fetchone()
+        return bytes(row[0]) if row else None
+
+    # Audit log
+
+    def open_audit(self, **options):
+        from ..core.audit_sqlite import SQLiteAuditLog
+        return SQLiteAuditLog(self, **options)
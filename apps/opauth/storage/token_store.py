@@ -1,102 +1,398 @@
 """
 OpAuth Token Store
-Encrypted storage for OAuth tokens.
+Encrypted storage for OAuth tokens, one record per service, so reading
+or updating a token decrypts or writes only that token.
 Human provides passphrase. AI cannot access raw tokens without human.
 """
 
+import argparse
 import json
 import os
 import base64
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+from .backends import get_backend
+from .fileio import atomic_write, fsync_dir
 
-TOKEN_STORE_PATH = Path.home() / ".opauth" / "tokens.enc"
 SALT_PATH = Path.home() / ".opauth" / "salt"
 
+# The KDF header: algorithm, parameters and salt, as JSON. Stores
+# without one use the salt file and PBKDF2 at PBKDF2_ITERATIONS.
+# rekey() writes the new header beside it as kdf.json.pending before
+# re-encrypting, so unlock() can finish or undo an interrupted re-key.
+KDF_PATH = Path.home() / ".opauth" / "kdf.json"
+KDF_ALGORITHMS = ("pbkdf2-sha256", "scrypt")
+PBKDF2_ITERATIONS = 480000
+UNLOCK_TARGET_MS = 250  # What calibrate() aims for by default
+
+# Calibration never goes below these, however slow the machine
+MIN_PBKDF2_ITERATIONS = 100000
+MIN_SCRYPT_N = 2 ** 14
+MAX_SCRYPT_N = 2 ** 20  # 1 GiB of memory at r=8
+
+
+def _kdf(header: dict):
+    salt = base64.b64decode(header["salt"])
+    if header["algorithm"] == "pbkdf2-sha256":
+        return PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt,
+                          iterations=header["iterations"])
+    if header["algorithm"] == "scrypt":
+        return Scrypt(salt=salt, length=32, n=header["n"], r=header["r"], p=header["p"])
+    raise ValueError(f"Unknown KDF: {header['algorithm']}")
+
+
+def _time_kdf(params: dict) -> float:
+    header = dict(params, salt=base64.b64encode(os.urandom(16)).decode())
+    start = time.perf_counter()
+    _kdf(header).derive(b"calibration")
+    return (time.perf_counter() - start) * 1000
+
+
+def calibrate(algorithm: str = "pbkdf2-sha256", target_ms: float = UNLOCK_TARGET_MS) -> dict:
+    """
+    KDF parameters that take about target_ms to derive a key on this
+    machine. Pass the result to TokenStore.rekey().
+    """
+    if algorithm == "pbkdf2-sha256":
+        probe = MIN_PBKDF2_ITERATIONS
+        elapsed = min(_time_kdf({"algorithm": algorithm, "iterations": probe}) for _ in range(3))
+        iterations = int(probe * target_ms / elapsed) // 10000 * 10000
+        return {"algorithm": algorithm, "iterations": max(iterations, MIN_PBKDF2_ITERATIONS)}
+    if algorithm == "scrypt":
+        # Cost doubles with n; keep the largest n that fits the target
+        params = {"algorithm": algorithm, "n": MIN_SCRYPT_N, "r": 8, "p": 1}
+        while params["n"] < MAX_SCRYPT_N:
+            bigger = dict(params, n=params["n"] * 2)
+            if _time_kdf(bigger) > target_ms:
+                break
+            params = bigger
+        return params
+    raise ValueError(f"Unknown KDF: {algorithm}")
+
+# The unlocked key is dropped after this many seconds without use
+IDLE_TIMEOUT = 15 * 60
+
+# Decrypted tokens are cached for at most this many seconds, and never
+# past the token's own expiry
+CACHE_TTL = 300
+
+
+class TokenCache:
+    """
+    Decrypted tokens for TokenStores opened with cache=True.
+    Each token is kept as JSON in a bytearray that is zeroed when the
+    entry is dropped. Only this process's writes invalidate entries; a
+    token replaced by another process is seen once the TTL runs out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}  # service -> (expires, bytearray)
+        self.generation = 0  # Bumped by every invalidation
+
+    def get(self, service: str):
+        with self._lock:
+            entry = self._entries.get(service)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[0]:
+                self._drop(service)
+                return None
+            return json.loads(entry[1])
+
+    def put(self, service: str, record: dict, generation: int):
+        """
+        Cache a record read while generation was current. Skipped if
+        anything was invalidated since, as the record may be stale.
+        """
+        token = record["token"]
+        ttl = CACHE_TTL
+        if isinstance(token, dict) and token.get("expires_in") is not None:
+            stored_at = datetime.fromisoformat(record["stored_at"])
+            ttl = min(ttl, stored_at.timestamp() + token["expires_in"] - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._drop(service)
+            self._entries[service] = (time.monotonic() + ttl, bytearray(json.dumps(token).encode()))
+
+    def invalidate(self, service: str):
+        with self._lock:
+            self.generation += 1
+            self._drop(service)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            for service in list(self._entries):
+                self._drop(service)
+
+    def _drop(self, service: str):
+        entry = self._entries.pop(service, None)
+        if entry is not None:
+            buf = entry[1]
+            buf[:] = bytes(len(buf))
+
+
+class KeyContext:
+    """
+    The unlocked key, shared by every TokenStore in the process.
+    The human unlocks once and every provider can use the store
+    without deriving the key again. lock(), or a timer once
+    IDLE_TIMEOUT seconds pass without use, drops it for all of them
+    and zeroes every cached token.
+    """
+
+    def __init__(self, idle_timeout: float = IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.cache = TokenCache()
+        self._lock = threading.Lock()
+        self._fernet = None
+        self._last_used = 0.0
+        self._timer = None  # Fires once the key may have sat idle too long
+
+    def set(self, fernet: Fernet):
+        with self._lock:
+            self._fernet = fernet
+            self._last_used = time.monotonic()
+            self._arm(self.idle_timeout)
+
+    def get(self):
+        """
+        The Fernet for the unlocked key, or None if locked or idle too long.
+        """
+        with self._lock:
+            if self._fernet is None:
+                return None
+            now = time.monotonic()
+            if now - self._last_used > self.idle_timeout:
+                self._drop()  # The timer has not run yet
+                return None
+            self._last_used = now
+            return self._fernet
+
+    def clear(self):
+        with self._lock:
+            self._drop()
+
+    def _arm(self, delay: float):
+        """
+        Caller holds self._lock.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._expire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expire(self):
+        # Uses don't re-arm the timer, so it may find the key used since
+        with self._lock:
+            if self._fernet is None:
+                return
+            idle = time.monotonic() - self._last_used
+            if idle < self.idle_timeout:
+                self._arm(self.idle_timeout - idle)
+            else:
+                self._drop()
+
+    def _drop(self):
+        """
+        Forget the key and zero every cached token.
+        Caller holds self._lock.
+        """
+        self._fernet = None
+        self.cache.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+_key_context = KeyContext()
+
+
 class TokenStore:
     """
     Encrypted token storage.
     Tokens encrypted at rest. Human passphrase required to decrypt.
     AI cannot access tokens without human providing passphrase.
+    All instances share one KeyContext, so one unlock serves them all.
+    With cache=True, get_token() serves repeat reads from the
+    context's TokenCache instead of decrypting again.
     """
 
-    def __init__(self):
-        self.store_path = TOKEN_STORE_PATH
+    def __init__(self, backend=None, key_context: KeyContext = None, cache: bool = False):
+        self.backend = backend or get_backend()
         self.salt_path = SALT_PATH
+        self.kdf_path = KDF_PATH
+        self.pending_kdf_path = KDF_PATH.with_name(KDF_PATH.name + ".pending")
         self._ensure_directory()
-        self._fernet = None  # Not initialized until human provides passphrase
+        self.key_context = key_context or _key_context
+        self.cache = cache
 
     def _ensure_directory(self):
-        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        self.salt_path.parent.mkdir(parents=True, exist_ok=True)
 
     def _get_salt(self) -> bytes:
         if self.salt_path.exists():
             with open(self.salt_path, 'rb') as f:
                 return f.read()
-        else:
-            salt = os.urandom(16)
-            with open(self.salt_path, 'wb') as f:
-                f.write(salt)
-            return salt
-
-    def _derive_key(self, passphrase: str) -> bytes:
-        salt = self._get_salt()
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=480000,
-        )
-        return base64.urlsafe_b64encode(kdf.derive(passphrase.encode()))
+        # Write it in full under a temp name, then link it into place:
+        # of two processes creating it at once, one salt wins for both
+        tmp_path = self.salt_path.with_name(f".salt.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(os.urandom(16))
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.link(tmp_path, self.salt_path)
+                fsync_dir(self.salt_path.parent)
+            except FileExistsError:
+                pass
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        with open(self.salt_path, 'rb') as f:
+            return f.read()
+
+    def kdf_header(self) -> dict:
+        """
+        The KDF algorithm, parameters and salt the store is keyed with.
+        """
+        if self.kdf_path.exists():
+            with open(self.kdf_path, 'r') as f:
+                return json.load(f)
+        return {
+            "algorithm": "pbkdf2-sha256",
+            "iterations": PBKDF2_ITERATIONS,
+            "salt": base64.b64encode(self._get_salt()).decode(),
+        }
+
+    def _pending_kdf_header(self):
+        if not self.pending_kdf_path.exists():
+            return None
+        with open(self.pending_kdf_path, 'r') as f:
+            return json.load(f)
+
+    def _derive_key(self, passphrase: str, header: dict) -> bytes:
+        return base64.urlsafe_b64encode(_kdf(header).derive(passphrase.encode()))
 
     def unlock(self, passphrase: str) -> bool:
         """
         Unlock the token store with human-provided passphrase.
         HUMAN ONLY - AI cannot call this without human input.
         """
-        try:
-            key = self._derive_key(passphrase)
-            self._fernet = Fernet(key)
-            # Test decryption if store exists
-            if self.store_path.exists():
-                self._load()
-            return True
-        except Exception:
-            self._fernet = None
+        header, pending = self.kdf_header(), self._pending_kdf_header()
+        for candidate in (header, pending):
+            if candidate is None:
+                continue
+            try:
+                fernet = Fernet(self._derive_key(passphrase, candidate))
+                # Test decryption if store exists
+                legacy = self.backend.legacy_tokens()
+                if legacy is not None:
+                    data = json.loads(fernet.decrypt(legacy).decode())
+                else:
+                    for service in self.backend.token_services()[:1]:
+                        fernet.decrypt(self.backend.read_token(service))
+            except Exception:
+                continue
+            break
+        else:
+            # A wrong passphrase leaves an existing unlock alone
             return False
+        if pending is not None:
+            # An interrupted rekey(): keep whichever header the tokens use
+            if candidate is pending:
+                os.replace(self.pending_kdf_path, self.kdf_path)
+                fsync_dir(self.kdf_path.parent)
+            else:
+                self.pending_kdf_path.unlink(missing_ok=True)
+        self.key_context.set(fernet)
+        self.key_context.cache.clear()
+        if legacy is not None:
+            # Written before per-service records; split it up once
+            self.backend.import_tokens({
+                service: self._encrypt(fernet, service, record)
+                for service, record in data["tokens"].items()
+            })
+        return True
 
-    def lock(self):
+    def rekey(self, passphrase: str, new_passphrase: str = None, kdf: dict = None) -> bool:
         """
-        Lock the token store. Clear decryption key from memory.
+        Re-encrypt every token under a new key: a new passphrase, new
+        KDF parameters (from calibrate()), or both. A fresh salt is
+        always used. Returns False if passphrase is wrong.
+        HUMAN ONLY. Run it while nothing else is writing tokens.
         """
-        self._fernet = None
+        if not self.unlock(passphrase):
+            return False
+        old = self._fernet()
+        records = {service: self._decrypt(old, service, encrypted)
+                   for service, encrypted in self.backend.iter_tokens()}
 
-    def is_unlocked(self) -> bool:
-        return self._fernet is not None
+        params = kdf or {k: v for k, v in self.kdf_header().items() if k != "salt"}
+        header = dict(params, salt=base64.b64encode(os.urandom(16)).decode())
+        new = Fernet(self._derive_key(new_passphrase or passphrase, header))
 
-    def _load(self) -> dict:
-        if not self.is_unlocked():
-            raise PermissionError("HS-OPAUTH-005: Token store locked. Human must unlock.")
+        # Header first, then tokens, then the switch: unlock() can tell
+        # which header the tokens on disk need if this is interrupted
+        atomic_write(self.pending_kdf_path, json.dumps(header, indent=2).encode(), fsync=True)
+        self.backend.import_tokens({service: self._encrypt(new, service, record)
+                                    for service, record in records.items()})
+        os.replace(self.pending_kdf_path, self.kdf_path)
+        fsync_dir(self.kdf_path.parent)
 
-        if not self.store_path.exists():
-            return {"tokens": {}}
+        self.key_context.set(new)
+        self.key_context.cache.clear()
+        return True
 
-        with open(self.store_path, 'rb') as f:
-            encrypted = f.read()
+    def lock(self):
+        """
+        Lock the token store in every component of this process.
+        Clear decryption key from memory.
+        """
+        self.key_context.clear()
 
-        decrypted = self._fernet.decrypt(encrypted)
-        return json.loads(decrypted.decode())
+    def is_unlocked(self) -> bool:
+        return self.key_context.get() is not None
 
-    def _save(self, data: dict):
-        if not self.is_unlocked():
+    def _fernet(self) -> Fernet:
+        fernet = self.key_context.get()
+        if fernet is None:
             raise PermissionError("HS-OPAUTH-005: Token store locked. Human must unlock.")
+        return fernet
+
+    @staticmethod
+    def _encrypt(fernet: Fernet, service: str, record: dict) -> bytes:
+        # The service name goes inside the ciphertext too, so a record
+        # moved to another name in the index is rejected
+        return fernet.encrypt(json.dumps(dict(record, service=service)).encode())
+
+    def _decrypt(self, fernet: Fernet, service: str, encrypted: bytes) -> dict:
+        record = json.loads(fernet.decrypt(encrypted).decode())
+        if record.pop("service", None) != service:
+            raise ValueError(f"Token record for {service} belongs to another service")
+        return record
 
-        encrypted = self._fernet.encrypt(json.dumps(data).encode())
-        with open(self.store_path, 'wb') as f:
-            f.write(encrypted)
+    def _read(self, service: str) -> dict:
+        """
+        Decrypt the one record for service, or None.
+        """
+        fernet = self._fernet()
+        encrypted = self.backend.read_token(service)
+        if encrypted is None:
+            return None
+        return self._decrypt(fernet, service, encrypted)
 
     def store_token(self, service: str, token_data: dict, stored_by: str = "human"):
         """
@@ -105,32 +401,55 @@ class TokenStore:
         if stored_by != "human":
             raise PermissionError("HS-OPAUTH-006: Only human can store tokens")
 
-        data = self._load()
-        data["tokens"][service] = {
+        record = {
             "token": token_data,
             "stored_at": datetime.now().isoformat(),
             "stored_by": stored_by
         }
-        self._save(data)
+        self.key_context.cache.invalidate(service)
+        self.backend.put_tokens({service: self._encrypt(self._fernet(), service, record)})
 
     def get_token(self, service: str) -> dict:
         """
         Get a token for a service.
         Only works if store is unlocked by human.
         """
-        data = self._load()
-        if service in data["tokens"]:
-            return data["tokens"][service]["token"]
-        return None
+        cache = self.key_context.cache
+        if self.cache:
+            self._fernet()
+            token = cache.get(service)
+            if token is not None:
+                return token
+        generation = cache.generation
+        record = self._read(service)
+        if record is None:
+            return None
+        if self.cache:
+            cache.put(service, record, generation)
+        return record["token"]
+
+    def token_lifetime(self, service: str):
+        """
+        (stored, expires) Unix times of the service's access token, from
+        when it was stored and its expires_in. None if unknown.
+        """
+        record = self._read(service)
+        if record is None:
+            return None
+        token = record["token"]
+        if not isinstance(token, dict) or token.get("expires_in") is None:
+            return None
+        stored = datetime.fromisoformat(record["stored_at"]).timestamp()
+        return stored, stored + float(token["expires_in"])
 
     def delete_token(self, service: str):
         """
         Delete a token (revocation).
         """
-        data = self._load()
-        if service in data["tokens"]:
-            del data["tokens"][service]
-            self._save(data)
+        self._fernet()
+        self.key_context.cache.invalidate(service)
+        if self.backend.read_token(service) is not None:
+            self.backend.put_tokens({service: None})
             return True
         return False
 
@@ -139,8 +458,22 @@ class TokenStore:
         List services with stored tokens.
         Does not expose token values.
         """
-        data = self._load()
-        return list(data["tokens"].keys())
+        self._fernet()
+        return self.backend.token_services()
+
+    def iter_metadata(self):
+        """
+        Yield when and by whom each token was stored.
+        Never yields token values.
+        """
+        fernet = self._fernet()
+        for service, encrypted in self.backend.iter_tokens():
+            record = self._decrypt(fernet, service, encrypted)
+            yield {
+                "service": service,
+                "stored_at": record.get("stored_at"),
+                "stored_by": record.get("stored_by"),
+            }
 
 
 # Hard stops
@@ -149,3 +482,33 @@ HARD_STOPS = {
     "HS-OPAUTH-006": "Only human can store tokens",
     "HS-OPAUTH-007": "Tokens encrypted at rest",
 }
+
+
+if __name__ == "__main__":
+    # python -m opauth.storage.token_store calibrate [--apply]   (from apps/)
+    import getpass
+
+    parser = argparse.ArgumentParser(description="Tune or change the token store key.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    cal = commands.add_parser("calibrate", help="Pick KDF parameters for this machine.")
+    cal.add_argument("--algorithm", choices=KDF_ALGORITHMS, default="pbkdf2-sha256")
+    cal.add_argument("--target-ms", type=float, default=UNLOCK_TARGET_MS)
+    cal.add_argument("--apply", action="store_true", help="Re-key the store with them.")
+    commands.add_parser("rekey", help="Change the passphrase.")
+    args = parser.parse_args()
+
+    store = TokenStore()
+    if args.command == "calibrate":
+        params = calibrate(args.algorithm, args.target_ms)
+        print(f"Current: {dict((k, v) for k, v in store.kdf_header().items() if k != 'salt')}")
+        print(f"Calibrated for {args.target_ms:.0f} ms: {params}")
+        if args.apply:
+            ok = store.rekey(getpass.getpass("Passphrase: "), kdf=params)
+            print("Re-keyed." if ok else "Wrong passphrase; nothing changed.")
+    else:
+        passphrase = getpass.getpass("Current passphrase: ")
+        new_passphrase = getpass.getpass("New passphrase: ")
+        if new_passphrase != getpass.getpass("Repeat new passphrase: "):
+            parser.exit(1, "Passphrases do not match; nothing changed.\n")
+        ok = store.rekey(passphrase, new_passphrase)
+        print("Re-keyed." if ok else "Wrong passphrase; nothing changed.")
@@ -0,0 +1,15 @@
+"""
+OpAuth Tests
+Every store path derives from the home directory at import time, so
+the tests run against a throwaway one set up before anything else is
+imported.
+
+Run from apps/:  python -m pytest opauth/tests
+           or:  python -m unittest discover -s opauth/tests -t .
+"""
+
+import os
+import tempfile
+
+HOME = tempfile.mkdtemp(prefix="opauth-tests-")
+os.environ["HOME"] = os.environ["USERPROFILE"] = HOME
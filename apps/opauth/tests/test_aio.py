@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import unittest
+
+from opauth.providers.aio import AsyncProvider, gather
+
+
+class FakeProvider:
+    service_name = "fake"
+    base_url = "https://api.example.com"
+
+    def __init__(self):
+        self.closed = False
+
+    def whoami(self, suffix=""):
+        return threading.get_ident(), "me" + suffix
+
+    def iter_pages(self, count: int):
+        try:
+            for page in range(count):
+                yield threading.get_ident(), page
+        finally:
+            self.closed = True
+
+
+class AsyncProviderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = FakeProvider()
+        self.aio = AsyncProvider(self.provider)
+
+    def test_plain_attributes_pass_through(self):
+        self.assertEqual(self.aio.base_url, "https://api.example.com")
+        self.assertEqual(self.aio.service_name, "fake")
+
+    def test_methods_become_coroutines_run_off_the_loop(self):
+        async def main():
+            return threading.get_ident(), await self.aio.whoami(suffix="!")
+
+        loop_thread, (worker, result) = asyncio.run(main())
+        self.assertEqual(result, "me!")
+        self.assertNotEqual(worker, loop_thread)
+
+    def test_generator_methods_become_async_iterators_run_off_the_loop(self):
+        async def main():
+            return threading.get_ident(), [item async for item in self.aio.iter_pages(3)]
+
+        loop_thread, items = asyncio.run(main())
+        self.assertEqual([page for _, page in items], [0, 1, 2])
+        self.assertNotIn(loop_thread, {worker for worker, _ in items})
+        self.assertTrue(self.provider.closed)
+
+    def test_leaving_an_async_iterator_early_closes_the_generator(self):
+        async def main():
+            pages = self.aio.iter_pages(10)
+            async for _ in pages:
+                break
+            await pages.aclose()
+
+        asyncio.run(main())
+        self.assertTrue(self.provider.closed)
+
+
+class GatherTest(unittest.TestCase):
+
+    def test_limit_caps_calls_in_flight_and_keeps_order(self):
+        running = peak = 0
+
+        async def call(i):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return i
+
+        results = asyncio.run(gather(*(call(i) for i in range(10)), limit=3))
+        self.assertEqual(results, list(range(10)))
+        self.assertEqual(peak, 3)
+
+    def test_return_exceptions_keeps_the_other_results(self):
+        async def call(i):
+            if i == 1:
+                raise PermissionError("scope not granted")
+            return i
+
+        results = asyncio.run(gather(call(0), call(1), call(2), return_exceptions=True))
+        self.assertEqual(results[0], 0)
+        self.assertIsInstance(results[1], PermissionError)
+        self.assertEqual(results[2], 2)
+
+    def test_failure_propagates_without_return_exceptions(self):
+        async def fail():
+            raise PermissionError("scope not granted")
+
+        with self.assertRaises(PermissionError):
+            asyncio.run(gather(fail()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from opauth.core.audit_rollups import AuditRollups
+
+
+def _entries(count: int, service: str = "svc"):
+    return [{"timestamp": "2026-01-05T14:32:00", "service": service,
+             "event": "API_CALL", "actor": "ai"} for _ in range(count)]
+
+
+def _total(rollups) -> int:
+    return sum(row["count"] for row in rollups.query("day"))
+
+
+class AuditRollupsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "audit.rollups.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_writer_follows_a_fold_by_another_instance(self):
+        # Two instances stand in for two processes sharing the files
+        a, b = AuditRollups(self.path), AuditRollups(self.path)
+        a.record(_entries(2))
+        b.record(_entries(3))
+        a.compact()
+        # b's open journal was folded away; its next batch must land in
+        # the new journal, not the folded one
+        b.record(_entries(4))
+        a.record(_entries(5))
+        self.assertEqual(_total(AuditRollups(self.path)), 14)
+        a.close()
+        b.close()
+
+    def test_query_waits_for_a_fold_in_progress(self):
+        rollups = AuditRollups(self.path)
+        rollups.record(_entries(2))
+        counts = []
+        with rollups._fold_lock:
+            reader = threading.Thread(target=lambda: counts.append(_total(AuditRollups(self.path))))
+            reader.start()
+            reader.join(0.2)
+            self.assertTrue(reader.is_alive())
+        reader.join(5)
+        self.assertEqual(counts, [2])
+        rollups.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
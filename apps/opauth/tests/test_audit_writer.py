@@ -0,0 +1,64 @@
+import unittest
+
+from opauth.core.audit import AuditCommittedError, AuditWriter
+
+
+class FlakyBatches:
+    """Stands in for _write_entries; fails the next `failures` calls."""
+
+    def __init__(self, failures: int = 0, error=OSError("disk full")):
+        self.failures = failures
+        self.error = error
+        self.written = []
+
+    def __call__(self, batch):
+        if self.failures:
+            self.failures -= 1
+            if isinstance(self.error, AuditCommittedError):
+                self.written.extend(batch)
+            raise self.error
+        self.written.extend(batch)
+
+
+class AuditWriterTest(unittest.TestCase):
+
+    def test_flush_retries_past_an_earlier_failure(self):
+        sink = FlakyBatches(failures=1)
+        # Batches only go out when flushed, so the failure is the first
+        # flush's own
+        writer = AuditWriter(sink, flush_interval_ms=60000)
+        writer.submit({"n": 1})
+        with self.assertRaises(OSError):
+            writer.flush()
+        # The failed batch was retried; a later flush is not stuck on
+        # the old error
+        writer.submit({"n": 2})
+        writer.flush(timeout=5)
+        self.assertEqual(sink.written, [{"n": 1}, {"n": 2}])
+        writer.close()
+
+    def test_committed_batch_is_not_written_twice(self):
+        sink = FlakyBatches(failures=1, error=AuditCommittedError("index"))
+        writer = AuditWriter(sink, flush_interval_ms=10)
+        writer.submit({"n": 1})
+        writer.flush(timeout=5)
+        writer.close()
+        self.assertEqual(sink.written, [{"n": 1}])
+
+    def test_close_retries_then_raises(self):
+        sink = FlakyBatches(failures=2)
+        writer = AuditWriter(sink, flush_interval_ms=1)
+        writer.submit({"n": 1})
+        writer.close()  # Retried within CLOSE_RETRIES
+        self.assertEqual(sink.written, [{"n": 1}])
+
+        sink = FlakyBatches(failures=100)
+        writer = AuditWriter(sink, flush_interval_ms=1)
+        writer.submit({"n": 1})
+        with self.assertRaises(OSError):
+            writer.close()
+        self.assertEqual(sink.written, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
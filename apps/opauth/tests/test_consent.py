@@ -0,0 +1,50 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from opauth.core.consent import ConsentFlow
+from opauth.core.scope_registry import ScopeRegistry
+from opauth.storage.sqlite_backend import SQLiteBackend
+
+
+class ApplyDecisionsSQLiteTest(unittest.TestCase):
+    """
+    apply_decisions against the SQLite backend with a buffered audit
+    log: the batch goes out inside the registry's write transaction.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.backend = SQLiteBackend(Path(self.tmp.name) / "opauth.db", fsync=False)
+        self.flow = ConsentFlow.__new__(ConsentFlow)
+        self.flow.registry = ScopeRegistry(self.backend)
+        self.flow.audit = self.backend.open_audit(buffered=True)
+
+    def tearDown(self):
+        self.flow.audit.close()
+        self.tmp.cleanup()
+
+    def test_buffered_entries_and_batch_commit(self):
+        self.flow.audit.log_consent_prompt("drive", ["read"])  # Still buffered
+        applied = self.flow.apply_decisions([
+            {"action": "grant", "service": "drive", "scope": ["read"]},
+            {"action": "deny", "service": "mail", "scope": ["send"]},
+        ])
+        self.assertEqual(applied["granted"], ["drive"])
+        self.assertTrue(self.flow.registry.check("drive", "read"))
+        events = [e["event"] for e in self.flow.audit.get_logs(limit=None)]
+        self.assertEqual(events, ["CONSENT_PROMPT", "CONSENT_GRANTED", "CONSENT_DENIED"])
+
+    def test_failed_batch_undoes_registry(self):
+        def fail(events):
+            raise OSError("disk full")
+
+        self.flow.audit.log_many = fail
+        with self.assertRaises(OSError):
+            self.flow.apply_decisions([{"action": "grant", "service": "drive", "scope": ["read"]}])
+        self.assertFalse(self.flow.registry.check("drive", "read"))
+        self.assertFalse(ScopeRegistry(self.backend).check("drive", "read"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from opauth.storage.file_backend import TOKEN_MAGIC, FileBackend
+
+
+def _rewrite_in_place(path: Path, data: bytes):
+    """Replace a file's contents but keep its inode, as a replacement
+    that reused the old inode would."""
+    with open(path, 'r+b') as f:
+        f.write(data)
+        f.truncate()
+
+
+class FileBackendReplacedFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.backend = FileBackend(fsync=False)
+        self.backend.token_path = Path(self.tmp.name) / "tokens.enc"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _replace_tokens(self, records: dict):
+        _rewrite_in_place(self.backend.token_path, TOKEN_MAGIC + b"".join(
+            json.dumps(service).encode() + b" " + blob + b"\n"
+            for service, blob in records.items()
+        ))
+
+    def test_larger_token_file_on_the_same_inode_is_reindexed(self):
+        self.backend.put_tokens({"a": b"A" * 40, "b": b"B" * 40})
+        self.assertEqual(self.backend.read_token("b"), b"B" * 40)
+        self._replace_tokens({"b": b"C" * 40, "a": b"D" * 40, "c": b"E" * 40})
+        self.assertEqual(self.backend.read_token("a"), b"D" * 40)
+        self.assertEqual(self.backend.read_token("b"), b"C" * 40)
+        self.assertEqual(self.backend.read_token("c"), b"E" * 40)
+
+    def test_token_file_smaller_than_indexed_is_reindexed(self):
+        self.backend.put_tokens({"a": b"A" * 40, "b": b"B" * 40})
+        self.assertEqual(self.backend.read_token("a"), b"A" * 40)
+        self._replace_tokens({"b": b"C" * 10})
+        self.assertIsNone(self.backend.read_token("a"))
+        self.assertEqual(self.backend.read_token("b"), b"C" * 10)
+
+    def test_snapshot_replaced_on_the_same_inode_and_size_forces_a_reload(self):
+        backend = self.backend
+        backend.registry_path = Path(self.tmp.name) / "scope_registry.json"
+        backend.journal_path = backend.registry_path.with_suffix(".journal")
+        backend.compacting_path = backend.registry_path.with_suffix(".journal.compacting")
+        _, cursor = backend.registry_load()
+        self.assertEqual(backend.registry_changes(cursor), ([], cursor))
+
+        path = backend.registry_path
+        data = path.read_bytes()
+        st = os.stat(path)
+        _rewrite_in_place(path, data.replace(b"services", b"SERVICES"))
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+        self.assertEqual(os.stat(path).st_size, st.st_size)
+        self.assertIsNone(backend.registry_changes(cursor))
+
+
+if __name__ == "__main__":
+    unittest.main()
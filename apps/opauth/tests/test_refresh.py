@@ -0,0 +1,64 @@
+import time
+import unittest
+
+from opauth.core.refresh import RETRY_INITIAL, RefreshScheduler
+
+
+class FakeAudit:
+    def __init__(self):
+        self.refreshes = []
+
+    def log_token_refresh(self, service, details):
+        self.refreshes.append((service, details))
+
+
+class FakeStore:
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+
+    def token_lifetime(self, service):
+        if isinstance(self.lifetime, Exception):
+            raise self.lifetime
+        return self.lifetime
+
+
+class FakeProvider:
+    def __init__(self, service_name, lifetime):
+        self.service_name = service_name
+        self.token_store = FakeStore(lifetime)
+        self.audit = FakeAudit()
+        self.refreshed = 0
+
+    def refresh_once(self):
+        self.refreshed += 1
+        now = time.time()
+        self.token_store.lifetime = (now, now + 3600)
+        return True
+
+
+class RefreshSchedulerTest(unittest.TestCase):
+
+    def test_unreadable_token_backs_off_without_stopping_the_thread(self):
+        now = time.time()
+        broken = FakeProvider("broken", ValueError("token record is corrupt"))
+        healthy = FakeProvider("healthy", (now - 3600, now - 1))
+        scheduler = RefreshScheduler([broken, healthy])
+        scheduler.start()
+        try:
+            deadline = time.time() + 5
+            while not healthy.refreshed and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(scheduler._thread.is_alive())
+        finally:
+            scheduler.stop(timeout=5)
+
+        self.assertEqual(healthy.refreshed, 1)
+        self.assertEqual(broken.refreshed, 0)
+        self.assertGreater(scheduler.schedule()["broken"], now + RETRY_INITIAL * 0.5 - 1)
+        self.assertEqual(broken.audit.refreshes, [
+            ("broken", {"scheduled": True, "ok": False, "error": "token record is corrupt"}),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import time
+import unittest
+
+from opauth.storage.token_store import KeyContext
+
+
+class KeyContextIdleTest(unittest.TestCase):
+
+    def test_idle_key_and_cached_tokens_are_dropped_without_another_call(self):
+        context = KeyContext(idle_timeout=0.1)
+        key = object()
+        context.set(key)
+        context.cache.put("svc", {"token": {"access_token": "secret"}}, context.cache.generation)
+        buf = context.cache._entries["svc"][1]
+
+        time.sleep(0.4)
+        # Read the state directly: get() would also drop an idle key
+        self.assertIsNone(context._fernet)
+        self.assertEqual(bytes(buf), bytes(len(buf)))
+        self.assertIsNone(context.get())
+
+    def test_use_keeps_the_key(self):
+        context = KeyContext(idle_timeout=0.2)
+        key = object()
+        context.set(key)
+        for _ in range(8):
+            time.sleep(0.05)
+            self.assertIs(context.get(), key)
+        context.clear()
+        self.assertIsNone(context._timer)
+
+
+if __name__ == "__main__":
+    unittest.main()